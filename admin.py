@@ -0,0 +1,178 @@
+"""
+Rotas administrativas no servidor Flask do app (app.server).
+
+registrar(servidor) instala as rotas e os ganchos das requisições; é
+chamado por myindex.criar_servidor. As rotas só respondem com
+MONEYFLOW_ADMIN_TOKEN definido; cada requisição precisa do mesmo token no
+cabeçalho X-Admin-Token. Sem o token as rotas respondem 404.
+
+/admin/perfil roda o perfilador por amostragem no worker que atender a
+requisição e devolve as pilhas no formato colapsado (flamegraph):
+    /admin/perfil?segundos=10
+        todas as threads do worker por 10 segundos
+    /admin/perfil?callback=graph1&requisicoes=5
+        só as threads que atenderem as próximas 5 chamadas a um callback cujo
+        output contenha "graph1" (desiste após timeout segundos, padrão 120)
+
+Callbacks em segundo plano rodam nos processos do DiskcacheManager; no worker
+aparece só o despacho do job.
+
+/admin/metricas devolve o pico de alocação e os sítios de alocação de cada
+callback (memoria.py, com MONEYFLOW_PERFIL_MEMORIA=1) e o uso de memória do
+worker.
+"""
+
+import hmac
+import os
+import resource
+import threading
+import time
+
+from flask import Response, abort, g, request
+
+import memoria
+from app import app
+from perfilador import INTERVALO_AMOSTRAGEM, AmostradorPilhas
+
+ADMIN_TOKEN = os.environ.get("MONEYFLOW_ADMIN_TOKEN")
+
+# Limites de uma sessão de perfil
+MAX_SEGUNDOS_PERFIL = 300
+MAX_REQUISICOES_PERFIL = 1000
+
+# Um perfil por vez em cada worker
+_lock_perfil = threading.Lock()
+
+class _PerfilCallback:
+    """Estado de um perfil restrito às requisições de um callback."""
+
+    def __init__(self, callback_id, requisicoes):
+        self.callback_id = callback_id
+        self.restantes = requisicoes
+        self.threads = set()
+        self.concluido = threading.Event()
+        self._lock = threading.Lock()
+
+    def entrar(self):
+        with self._lock:
+            if self.restantes <= 0:
+                return False
+            self.threads.add(threading.get_ident())
+            return True
+
+    def sair(self):
+        with self._lock:
+            self.threads.discard(threading.get_ident())
+            self.restantes -= 1
+            if self.restantes <= 0:
+                self.concluido.set()
+
+    def threads_ativas(self):
+        with self._lock:
+            return set(self.threads)
+
+_perfil_callback = None
+
+def _verificar_token():
+    """Responde 404 sem token configurado e 403 com token errado."""
+    if not ADMIN_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        abort(403)
+
+def _parametro(nome, tipo, padrao, minimo, maximo):
+    try:
+        valor = tipo(request.args.get(nome, padrao))
+    except ValueError:
+        abort(400, f"Parâmetro inválido: {nome}")
+    return min(max(valor, minimo), maximo)
+
+def _antes_callback():
+    perfil = _perfil_callback
+    if (perfil is None and not memoria.ATIVO) or request.path != '/_dash-update-component':
+        return
+    output = str((request.get_json(silent=True) or {}).get('output', ''))
+    if perfil is not None and perfil.callback_id in output and perfil.entrar():
+        g.perfil_callback = perfil
+
+    # Callbacks em segundo plano são medidos no job (app.background_callback)
+    callback = app.callback_map.get(output)
+    if memoria.ATIVO and callback is not None and not callback.get('background'):
+        g.medicao_memoria = memoria.iniciar(callback['callback'].__name__)
+
+def _depois_callback(_erro):
+    memoria.concluir(g.pop('medicao_memoria', None))
+    perfil = g.pop('perfil_callback', None)
+    if perfil is not None:
+        perfil.sair()
+
+def perfil():
+    """Perfil por amostragem do worker, devolvido como arquivo de pilhas colapsadas."""
+    global _perfil_callback
+    _verificar_token()
+    if not _lock_perfil.acquire(blocking=False):
+        abort(409, "Já existe um perfil em andamento neste worker")
+
+    try:
+        intervalo = _parametro('intervalo', float, INTERVALO_AMOSTRAGEM, 0.001, 1.0)
+        callback_id = request.args.get('callback')
+        inicio = time.perf_counter()
+
+        if callback_id:
+            requisicoes = _parametro('requisicoes', int, 10, 1, MAX_REQUISICOES_PERFIL)
+            timeout = _parametro('timeout', float, 120, 1, MAX_SEGUNDOS_PERFIL)
+            _perfil_callback = _PerfilCallback(callback_id, requisicoes)
+            amostrador = AmostradorPilhas(intervalo, filtro_threads=_perfil_callback.threads_ativas)
+            amostrador.iniciar()
+            try:
+                _perfil_callback.concluido.wait(timeout)
+            finally:
+                perfil_callback, _perfil_callback = _perfil_callback, None
+                amostrador.parar()
+            descricao = f"callback-{callback_id}-{requisicoes - max(perfil_callback.restantes, 0)}req"
+        else:
+            segundos = _parametro('segundos', float, 10, 0.1, MAX_SEGUNDOS_PERFIL)
+            amostrador = AmostradorPilhas(intervalo)
+            amostrador.iniciar()
+            time.sleep(segundos)
+            amostrador.parar()
+            descricao = f"{segundos:g}s"
+    finally:
+        _lock_perfil.release()
+
+    nome = f"perfil-{os.getpid()}-{descricao}.folded".replace('/', '_')
+    return Response(amostrador.colapsado(), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename="{nome}"',
+        'X-Amostras': str(amostrador.amostras),
+        'X-Duracao': f"{time.perf_counter() - inicio:.3f}",
+    })
+
+def _rss_atual():
+    """Memória residente atual do processo (bytes), ou None fora do Linux."""
+    try:
+        with open('/proc/self/statm') as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def metricas():
+    """Métricas de memória do worker e de alocação por callback (JSON)."""
+    _verificar_token()
+    return {
+        'processo': {
+            'pid': os.getpid(),
+            'rss': _rss_atual(),
+            'rss_max': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+        'perfil_memoria': memoria.ATIVO,
+        'memoria_callbacks': memoria.ler_metricas(),
+    }
+
+def registrar(servidor):
+    """Instala as rotas /admin e os ganchos de perfil e memória no servidor Flask (uma vez)."""
+    if 'admin_perfil' in servidor.view_functions:
+        return
+    servidor.before_request(_antes_callback)
+    servidor.teardown_request(_depois_callback)
+    servidor.add_url_rule('/admin/perfil', 'admin_perfil', perfil)
+    servidor.add_url_rule('/admin/metricas', 'admin_metricas', metricas)
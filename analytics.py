@@ -0,0 +1,454 @@
+"""
+Motor analítico das agregações pesadas (resumo mensal, totais por categoria e
+fluxo por período), de um usuário ou de muitos, sobre todo o histórico.
+
+O motor padrão é o pandas lendo o SQLite. Com MONEYFLOW_MOTOR_ANALITICO=duckdb
+as agregações rodam no DuckDB embutido, vetorizadas e em várias threads, sem
+passar as linhas por objetos Python. O DuckDB lê direto o arquivo SQLite (pela
+extensão sqlite) ou, com MONEYFLOW_FONTE_ANALITICA=parquet, os snapshots
+Parquet gerados por exportar_parquet(). O DuckDB é opcional: sem ele
+instalado, ou se a fonte não abrir (a extensão sqlite precisa ser baixada na
+primeira vez, o que falha sem rede), o motor pandas é usado.
+
+Os dashboards usam totais_por_categoria() e fluxo_por_periodo() quando o
+motor efetivo (motor_ativo()) é o DuckDB. Os snapshots Parquet só servem um
+usuário enquanto os dados dele não mudaram desde a exportação (as versões de
+versoes_dados são gravadas junto); depois disso a consulta vai ao SQLite. O
+lote noturno (batch.py) regera os snapshots quando esta é a fonte.
+
+Cada processo abre uma conexão DuckDB por fonte (extensão, ATTACH e visões
+uma vez só) e cada consulta usa um cursor próprio dela.
+
+Os dois motores devem dar o mesmo resultado; verificar_paridade() compara
+todas as agregações e deve passar antes de trocar o motor:
+
+Uso:
+    python analytics.py --verificar
+    python analytics.py --exportar-parquet
+    python analytics.py --reconstruir-resumo --motor duckdb
+"""
+
+import argparse
+import functools
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import db
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Motor das agregações: 'pandas' ou 'duckdb'
+MOTOR = os.environ.get("MONEYFLOW_MOTOR_ANALITICO", "pandas")
+
+# Fonte do DuckDB: 'sqlite' (o próprio banco) ou 'parquet' (snapshots)
+FONTE = os.environ.get("MONEYFLOW_FONTE_ANALITICA", "sqlite")
+DIR_PARQUET = os.environ.get("MONEYFLOW_DIR_PARQUET", "./cache/parquet")
+
+# Regras de período do pandas (as de dashboards.GRANULARIDADES) e os
+# equivalentes: período do pandas e unidade do date_trunc do DuckDB.
+# A semana começa na segunda-feira nos dois.
+_PERIODOS = {
+    'D': ('D', 'day'),
+    'W-MON': ('W-SUN', 'week'),
+    'MS': ('M', 'month'),
+    'QS': ('Q', 'quarter'),
+    'YS': ('Y', 'year'),
+}
+
+_COLUNAS_RESUMO = ['usuario_id', 'mes', 'tipo', 'categoria', 'total', 'total_efetuado', 'quantidade']
+
+def _motor(motor):
+    """Motor efetivo: o pedido (ou o configurado), caindo para pandas sem o DuckDB."""
+    motor = motor or MOTOR
+    if motor not in ('pandas', 'duckdb'):
+        raise ValueError(f"Motor analítico desconhecido: {motor}")
+    if motor == 'duckdb' and (duckdb is None or not _duckdb_disponivel(FONTE)):
+        return 'pandas'
+    return motor
+
+def motor_ativo():
+    """Motor que as agregações usam de fato com a configuração atual."""
+    return _motor(None)
+
+@functools.lru_cache(maxsize=None)
+def _duckdb_disponivel(fonte):
+    """Confere uma vez por processo se o DuckDB consegue abrir a fonte."""
+    try:
+        _conexao_duckdb(fonte)
+    except (duckdb.Error, FileNotFoundError) as e:
+        print(f"⚠️ DuckDB indisponível com a fonte {fonte}, usando o motor pandas: {e}")
+        return False
+    return True
+
+def _filtro_usuarios(usuarios, coluna='usuario_id'):
+    """Filtro SQL (com ? por usuário) e parâmetros; None = todos os usuários."""
+    if usuarios is None:
+        return f"{coluna} IS NOT NULL", []
+    usuarios = [int(u) for u in usuarios]
+    if not usuarios:
+        return "0", []
+    return f"{coluna} IN ({', '.join('?' for _ in usuarios)})", usuarios
+
+# --- Motor pandas ---
+
+def _ler_pandas(usuarios, colunas):
+    """Lê as colunas das transações (inclusive arquivadas) dos usuários."""
+    filtro, params = _filtro_usuarios(usuarios)
+    conn = db.conectar_bd(com_arquivo=True)
+    cursor = conn.cursor()
+    fonte = db._fonte_transacoes(cursor, filtro)
+    repeticoes = 2 if db._arquivo_anexado(cursor) else 1
+    df = pd.read_sql_query(f"SELECT {colunas} FROM {fonte}", conn, params=params * repeticoes)
+    conn.close()
+    return df
+
+def _resumo_pandas(usuarios):
+    df = _ler_pandas(usuarios, "usuario_id, tipo, valor, data, categoria, efetuado")
+    df = df.assign(
+        mes=df['data'].astype(str).str[:7],
+        valor_efetuado=np.where(df['efetuado'].fillna(0).astype(bool), df['valor'], 0.0)
+    )
+    return (df.groupby(['usuario_id', 'mes', 'tipo', 'categoria'], as_index=False)
+              .agg(total=('valor', 'sum'), total_efetuado=('valor_efetuado', 'sum'), quantidade=('valor', 'size')))
+
+def _filtrar_datas(df, inicio, fim):
+    datas = pd.to_datetime(df['data'].astype(str).str[:10])
+    mascara = pd.Series(True, index=df.index)
+    if inicio:
+        mascara &= datas >= pd.Timestamp(inicio)
+    if fim:
+        mascara &= datas <= pd.Timestamp(fim)
+    return df[mascara].assign(data=datas[mascara])
+
+def _categorias_pandas(usuario_id, tipo, inicio, fim):
+    df = _filtrar_datas(_ler_pandas([usuario_id], "tipo, valor, data, categoria"), inicio, fim)
+    df = df[df['tipo'] == tipo]
+    return df.groupby('categoria', as_index=False).agg(total=('valor', 'sum'))
+
+def _fluxo_pandas(usuario_id, regra, inicio, fim, categorias):
+    df = _filtrar_datas(_ler_pandas([usuario_id], "tipo, valor, data, categoria"), inicio, fim)
+    for tipo, selecionadas in categorias.items():
+        if selecionadas is not None:
+            df = df[(df['tipo'] != tipo) | df['categoria'].isin(selecionadas)]
+    periodo = df['data'].dt.to_period(_PERIODOS[regra][0]).dt.start_time
+    df = df.assign(
+        periodo=periodo,
+        receitas=np.where(df['tipo'] == 'receita', df['valor'], 0.0),
+        despesas=np.where(df['tipo'] == 'despesa', df['valor'], 0.0)
+    )
+    return df.groupby('periodo', as_index=False)[['receitas', 'despesas']].sum()
+
+# --- Motor DuckDB ---
+
+def _conectar_duckdb(fonte=None):
+    """
+    Conexão DuckDB em memória com a visão "transacoes" sobre a fonte
+    configurada (SQLite principal + arquivo, ou os snapshots Parquet).
+    """
+    fonte = fonte or FONTE
+    con = duckdb.connect()
+    if fonte == 'parquet':
+        arquivos = sorted(glob.glob(os.path.join(DIR_PARQUET, 'transacoes*.parquet')))
+        if not arquivos:
+            raise FileNotFoundError(f"Nenhum snapshot Parquet em {DIR_PARQUET}; rode exportar_parquet()")
+        lista = ', '.join("'" + arquivo.replace("'", "''") + "'" for arquivo in arquivos)
+        con.execute(f"CREATE VIEW transacoes AS SELECT * FROM read_parquet([{lista}])")
+        return con
+
+    # Lê tudo como texto e converte aqui: o SQLite não garante o tipo declarado
+    con.execute("LOAD sqlite")
+    con.execute("SET sqlite_all_varchar = true")
+    bancos = [db.DB_FILE] + ([db.ARQUIVO_FILE] if os.path.exists(db.ARQUIVO_FILE) else [])
+    selects = []
+    for i, caminho in enumerate(bancos):
+        con.execute(f"ATTACH '{caminho}' AS banco{i} (TYPE sqlite, READ_ONLY)")
+        selects.append(f"""
+            SELECT CAST(id AS BIGINT) AS id, tipo, CAST(valor AS DOUBLE) AS valor,
+                   CAST(substr(data, 1, 10) AS DATE) AS data, categoria,
+                   CAST(COALESCE(efetuado, '0') AS INTEGER) AS efetuado,
+                   CAST(usuario_id AS BIGINT) AS usuario_id
+            FROM banco{i}.transacoes
+        """)
+    con.execute(f"CREATE VIEW transacoes AS {' UNION ALL '.join(selects)}")
+    return con
+
+_conexoes = {}
+_lock_conexoes = threading.Lock()
+
+def _reiniciar_apos_fork():
+    # A conexão do DuckDB não atravessa o fork; o filho abre a sua
+    global _conexoes, _lock_conexoes
+    _conexoes, _lock_conexoes = {}, threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar_apos_fork)
+
+def _conexao_duckdb(fonte):
+    """
+    Conexão DuckDB do processo para a fonte, aberta na primeira consulta e
+    reaberta se os arquivos de banco mudarem (o arquivo criado depois, por
+    exemplo).
+    """
+    chave = (fonte, db.DB_FILE, db.ARQUIVO_FILE, os.path.exists(db.ARQUIVO_FILE), DIR_PARQUET)
+    with _lock_conexoes:
+        con = _conexoes.get(chave)
+        if con is None:
+            con = _conexoes[chave] = _conectar_duckdb(fonte)
+        return con
+
+def _consultar_duckdb(sql, params=(), fonte=None):
+    # A conexão é compartilhada entre as threads; o cursor é da consulta
+    cursor = _conexao_duckdb(fonte or FONTE).cursor()
+    try:
+        return cursor.execute(sql, list(params)).df()
+    finally:
+        cursor.close()
+
+def _versoes_exportadas():
+    """Versões dos dados ({escopo: versao}) no momento do snapshot Parquet."""
+    caminho = os.path.join(DIR_PARQUET, 'versoes.json')
+    try:
+        return _ler_versoes_exportadas(caminho, os.stat(caminho).st_mtime_ns)
+    except FileNotFoundError:
+        return {}
+
+@functools.lru_cache(maxsize=4)
+def _ler_versoes_exportadas(caminho, modificacao):
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+def _motor_e_fonte(motor, usuario_id):
+    """
+    Motor e fonte das consultas de um usuário. O snapshot Parquet só é usado
+    se os dados do usuário não mudaram desde a exportação; senão a consulta
+    vai ao SQLite pelo DuckDB ou, sem a extensão sqlite, pelo pandas.
+    """
+    motor = _motor(motor)
+    if motor != 'duckdb' or FONTE != 'parquet':
+        return motor, FONTE
+    _, versao = db.ler_versao(usuario_id)
+    if _versoes_exportadas().get(db._escopo_usuario(usuario_id), 0) == versao:
+        return 'duckdb', 'parquet'
+    if _duckdb_disponivel('sqlite'):
+        return 'duckdb', 'sqlite'
+    return 'pandas', None
+
+def _filtro_datas_sql(inicio, fim):
+    condicoes, params = [], []
+    if inicio:
+        condicoes.append("data >= CAST(? AS DATE)")
+        params.append(str(pd.Timestamp(inicio).date()))
+    if fim:
+        condicoes.append("data <= CAST(? AS DATE)")
+        params.append(str(pd.Timestamp(fim).date()))
+    return ''.join(f" AND {c}" for c in condicoes), params
+
+def _resumo_duckdb(usuarios):
+    filtro, params = _filtro_usuarios(usuarios)
+    return _consultar_duckdb(f"""
+        SELECT usuario_id, strftime(data, '%Y-%m') AS mes, tipo, categoria,
+               SUM(valor) AS total,
+               SUM(CASE WHEN efetuado <> 0 THEN valor ELSE 0 END) AS total_efetuado,
+               COUNT(*) AS quantidade
+        FROM transacoes
+        WHERE {filtro}
+        GROUP BY ALL
+    """, params)
+
+def _categorias_duckdb(usuario_id, tipo, inicio, fim, fonte):
+    filtro_datas, params = _filtro_datas_sql(inicio, fim)
+    return _consultar_duckdb(f"""
+        SELECT categoria, SUM(valor) AS total
+        FROM transacoes
+        WHERE usuario_id = ? AND tipo = ?{filtro_datas}
+        GROUP BY categoria
+    """, [usuario_id, tipo] + params, fonte)
+
+def _filtro_categorias_sql(categorias):
+    condicoes, params = [], []
+    for tipo, selecionadas in categorias.items():
+        if selecionadas is not None:
+            marcadores = ', '.join('?' for _ in selecionadas) or 'NULL'
+            condicoes.append(f" AND (tipo <> ? OR categoria IN ({marcadores}))")
+            params += [tipo, *selecionadas]
+    return ''.join(condicoes), params
+
+def _fluxo_duckdb(usuario_id, regra, inicio, fim, categorias, fonte):
+    filtro_datas, params = _filtro_datas_sql(inicio, fim)
+    filtro_categorias, params_categorias = _filtro_categorias_sql(categorias)
+    return _consultar_duckdb(f"""
+        SELECT CAST(date_trunc('{_PERIODOS[regra][1]}', data) AS TIMESTAMP) AS periodo,
+               SUM(CASE WHEN tipo = 'receita' THEN valor ELSE 0 END) AS receitas,
+               SUM(CASE WHEN tipo = 'despesa' THEN valor ELSE 0 END) AS despesas
+        FROM transacoes
+        WHERE usuario_id = ?{filtro_datas}{filtro_categorias}
+        GROUP BY periodo
+    """, [usuario_id] + params + params_categorias, fonte)
+
+# --- Agregações ---
+
+def _ordenar(df, colunas):
+    return df.sort_values(colunas, kind='stable').reset_index(drop=True)
+
+def resumo_mensal(usuarios=None, motor=None):
+    """
+    Totais por usuário, mês, tipo e categoria (formato da tabela resumo_mensal)
+    de todo o histórico dos usuários (None = todos).
+    """
+    df = _resumo_duckdb(usuarios) if _motor(motor) == 'duckdb' else _resumo_pandas(usuarios)
+    df['quantidade'] = df['quantidade'].astype('int64')
+    return _ordenar(df[_COLUNAS_RESUMO], ['usuario_id', 'mes', 'tipo', 'categoria'])
+
+def totais_por_categoria(usuario_id, tipo, inicio=None, fim=None, motor=None):
+    """Total por categoria das transações do tipo no período (datas inclusivas)."""
+    motor, fonte = _motor_e_fonte(motor, usuario_id)
+    if motor == 'duckdb':
+        df = _categorias_duckdb(usuario_id, tipo, inicio, fim, fonte)
+    else:
+        df = _categorias_pandas(usuario_id, tipo, inicio, fim)
+    return _ordenar(df[['categoria', 'total']], ['categoria'])
+
+def fluxo_por_periodo(usuario_id, regra='MS', inicio=None, fim=None, motor=None,
+                      categorias_receita=None, categorias_despesa=None):
+    """
+    Receitas e despesas por período (rotulado pelo início do período) para uma
+    regra de dashboards.GRANULARIDADES, do primeiro ao último período com
+    lançamentos; os períodos vazios no meio aparecem zerados, como no
+    agrupamento dos dashboards (dashboards.agrupar_por_periodo).
+    As listas de categorias, se informadas, limitam cada tipo a elas.
+    """
+    if regra not in _PERIODOS:
+        raise ValueError(f"Regra de período desconhecida: {regra}")
+    categorias = {'receita': categorias_receita, 'despesa': categorias_despesa}
+    motor, fonte = _motor_e_fonte(motor, usuario_id)
+    if motor == 'duckdb':
+        df = _fluxo_duckdb(usuario_id, regra, inicio, fim, categorias, fonte)
+    else:
+        df = _fluxo_pandas(usuario_id, regra, inicio, fim, categorias)
+    df['periodo'] = pd.to_datetime(df['periodo']).astype('datetime64[ns]')
+    df = _ordenar(df[['periodo', 'receitas', 'despesas']], ['periodo'])
+    if df.empty:
+        return df
+    periodos = pd.period_range(df['periodo'].iloc[0], df['periodo'].iloc[-1], freq=_PERIODOS[regra][0]).start_time
+    return (df.set_index('periodo').reindex(periodos.astype('datetime64[ns]'), fill_value=0.0)
+              .rename_axis('periodo').reset_index())
+
+def reconstruir_resumo_mensal(usuarios=None, motor=None):
+    """Recalcula com o motor analítico e grava o resumo mensal dos usuários (None = todos)."""
+    resumo = resumo_mensal(usuarios, motor)
+    filtro, params = _filtro_usuarios(usuarios)
+
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DELETE FROM resumo_mensal WHERE {filtro}", params)
+        cursor.executemany("""
+            INSERT INTO resumo_mensal (usuario_id, mes, tipo, categoria, total, total_efetuado, quantidade)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, resumo.astype(object).itertuples(index=False, name=None))
+        for usuario_id in resumo['usuario_id'].unique():
+            db._incrementar_versao(cursor, int(usuario_id))
+        conn.commit()
+    finally:
+        conn.close()
+    return len(resumo)
+
+# --- Snapshots Parquet ---
+
+def exportar_parquet(diretorio=None):
+    """
+    Grava todas as transações (inclusive arquivadas) em um snapshot Parquet
+    para o DuckDB. O arquivo é trocado de uma vez, sem leitura parcial.
+    """
+    if duckdb is None:
+        raise RuntimeError("Os snapshots Parquet precisam do duckdb instalado")
+    diretorio = diretorio or DIR_PARQUET
+    os.makedirs(diretorio, exist_ok=True)
+
+    # As versões são lidas antes: um snapshot nunca parece mais novo que os dados
+    conn = db.conectar_bd()
+    versoes = dict(conn.execute("SELECT escopo, versao FROM versoes_dados").fetchall())
+    conn.close()
+    df = _ler_pandas(None, "id, tipo, valor, data, categoria, efetuado, usuario_id")
+    df['data'] = pd.to_datetime(df['data'].astype(str).str[:10]).dt.date
+    df['efetuado'] = df['efetuado'].fillna(0).astype('int32')
+
+    destino = os.path.join(diretorio, 'transacoes.parquet')
+    temporario = destino + '.tmp'
+    con = duckdb.connect()
+    try:
+        con.register('snapshot', df)
+        con.execute(f"COPY snapshot TO '{temporario}' (FORMAT parquet)")
+    finally:
+        con.close()
+    os.replace(temporario, destino)
+
+    caminho_versoes = os.path.join(diretorio, 'versoes.json')
+    with open(caminho_versoes + '.tmp', 'w', encoding='utf-8') as arquivo:
+        json.dump(versoes, arquivo)
+    os.replace(caminho_versoes + '.tmp', caminho_versoes)
+
+    with _lock_conexoes:
+        for chave in [chave for chave in _conexoes if chave[0] == 'parquet']:
+            _conexoes.pop(chave)
+    _duckdb_disponivel.cache_clear()
+    return len(df)
+
+# --- Paridade entre os motores ---
+
+def verificar_paridade(usuarios=None, regras=('D', 'MS')):
+    """
+    Roda as agregações nos dois motores e compara os resultados. Retorna a
+    lista de divergências (vazia quando os motores concordam).
+    """
+    if _motor('duckdb') != 'duckdb':
+        raise RuntimeError(f"A verificação de paridade precisa do duckdb instalado e da fonte {FONTE} disponível")
+
+    def comparar(nome, calcular):
+        try:
+            pd.testing.assert_frame_equal(calcular('pandas'), calcular('duckdb'),
+                                          check_dtype=False, rtol=1e-9)
+        except AssertionError as e:
+            divergencias.append(f"{nome}: {e}")
+
+    divergencias = []
+    comparar("resumo_mensal", lambda motor: resumo_mensal(usuarios, motor))
+
+    if usuarios is None:
+        usuarios = resumo_mensal(None, 'pandas')['usuario_id'].unique().tolist()
+    for usuario_id in usuarios:
+        for tipo in ('receita', 'despesa'):
+            comparar(f"totais_por_categoria({usuario_id}, {tipo})",
+                     lambda motor: totais_por_categoria(usuario_id, tipo, motor=motor))
+        for regra in regras:
+            comparar(f"fluxo_por_periodo({usuario_id}, {regra})",
+                     lambda motor: fluxo_por_periodo(usuario_id, regra, motor=motor))
+    return divergencias
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Motor analítico do MoneyFlow")
+    parser.add_argument('--verificar', action='store_true', help="compara os motores pandas e DuckDB")
+    parser.add_argument('--exportar-parquet', action='store_true', help="gera o snapshot Parquet")
+    parser.add_argument('--reconstruir-resumo', action='store_true', help="recalcula o resumo mensal")
+    parser.add_argument('--motor', choices=['pandas', 'duckdb'], default=None)
+    parser.add_argument('--usuarios', type=int, nargs='*', default=None)
+    args = parser.parse_args()
+
+    db.inicializar_bd()
+    if args.exportar_parquet:
+        print(f"Snapshot Parquet: {exportar_parquet()} transações")
+    if args.reconstruir_resumo:
+        print(f"Resumo mensal: {reconstruir_resumo_mensal(args.usuarios, args.motor)} linhas")
+    if args.verificar:
+        divergencias = verificar_paridade(args.usuarios)
+        for divergencia in divergencias:
+            print(divergencia)
+        print("Motores com resultados idênticos" if not divergencias else f"{len(divergencias)} divergência(s)")
+        raise SystemExit(1 if divergencias else 0)
@@ -0,0 +1,127 @@
+"""
+Detecção em lote de despesas anômalas por categoria.
+
+Calcula, de forma vetorizada, a mediana e o MAD móveis de cada categoria
+(janela das últimas despesas anteriores a cada lançamento) e marca as
+despesas cujo escore robusto passa do limiar. Também gera as estatísticas
+finais por categoria usadas pela verificação incremental de db.py.
+
+O MAD de cada janela é exato: os desvios são medidos em relação à mediana da
+própria janela. As janelas são montadas com NumPy em blocos de linhas, então
+a memória usada não depende do tamanho do histórico.
+"""
+
+import numpy as np
+import pandas as pd
+
+import db
+
+# Quantidade de despesas anteriores consideradas em cada janela
+JANELA_ANOMALIA = db.JANELA_ANOMALIA
+
+# Linhas por bloco no cálculo das janelas (bloco × janela valores na memória)
+LINHAS_POR_BLOCO = 100_000
+
+def _mediana_linhas(janelas, quantidades):
+    """Mediana de cada linha considerando só os valores não nulos (NaN no fim após ordenar)."""
+    ordenadas = np.sort(janelas, axis=1)
+    baixo = np.clip((quantidades - 1) // 2, 0, None)[:, None]
+    alto = np.clip(quantidades // 2, 0, None)[:, None]
+    mediana = (np.take_along_axis(ordenadas, baixo, 1) + np.take_along_axis(ordenadas, alto, 1))[:, 0] / 2
+    return np.where(quantidades > 0, mediana, np.nan)
+
+def mediana_mad_anteriores(valores, inicio_grupo, janela=JANELA_ANOMALIA):
+    """
+    Mediana e MAD exatos das até `janela` observações anteriores a cada
+    posição, sem passar do início do grupo dela (NaN sem observações).
+    """
+    valores = np.asarray(valores, dtype=float)
+    inicio_grupo = np.asarray(inicio_grupo)
+    mediana = np.full(len(valores), np.nan)
+    mad = np.full(len(valores), np.nan)
+    deslocamentos = np.arange(-janela, 0)
+    for inicio in range(0, len(valores), LINHAS_POR_BLOCO):
+        posicoes = np.arange(inicio, min(inicio + LINHAS_POR_BLOCO, len(valores)))
+        indices = posicoes[:, None] + deslocamentos
+        validos = indices >= inicio_grupo[posicoes][:, None]
+        janelas = np.where(validos, valores[np.clip(indices, 0, None)], np.nan)
+        quantidades = validos.sum(axis=1)
+        mediana[posicoes] = _mediana_linhas(janelas, quantidades)
+        mad[posicoes] = _mediana_linhas(np.abs(janelas - mediana[posicoes][:, None]), quantidades)
+    return mediana, mad
+
+def detectar_anomalias(df, janela=JANELA_ANOMALIA, limiar=None):
+    """
+    Marca as despesas anômalas de um histórico.
+
+    Recebe um DataFrame com as colunas id, usuario_id, data, categoria e
+    valor (apenas despesas) e devolve uma cópia ordenada com as colunas
+    mediana, mad, escore e anomalia. Cada lançamento é comparado apenas com
+    os anteriores da mesma categoria do mesmo usuário.
+    """
+    limiar = db.LIMIAR_ANOMALIA if limiar is None else limiar
+    df = df.sort_values(['usuario_id', 'categoria', 'data', 'id'], kind='stable').reset_index(drop=True)
+    valores = df['valor'].astype(float).to_numpy()
+
+    # Posição de cada linha no grupo e onde o grupo começa (dados ordenados)
+    amostras = df.groupby(['usuario_id', 'categoria'], sort=False).cumcount().to_numpy()
+    mediana, mad = mediana_mad_anteriores(valores, np.arange(len(df)) - amostras, janela)
+
+    df['mediana'] = mediana
+    df['mad'] = mad
+    df['escore'] = db.escore_robusto(valores, mediana, mad)
+    df['anomalia'] = (amostras >= db.MIN_AMOSTRAS_ANOMALIA) & (df['escore'] > limiar)
+    return df
+
+def estatisticas_finais(df, janela=JANELA_ANOMALIA):
+    """Mediana e MAD das últimas `janela` despesas de cada (usuário, categoria)."""
+    ultimas = (df.sort_values(['usuario_id', 'categoria', 'data', 'id'], kind='stable')
+                 .groupby(['usuario_id', 'categoria'], sort=False).tail(janela))
+    grupos = ultimas.groupby(['usuario_id', 'categoria'], sort=False)['valor']
+    mediana = grupos.transform('median')
+    resultado = grupos.agg(n='size', mediana='median')
+    resultado['mad'] = (ultimas['valor'] - mediana).abs().groupby([ultimas['usuario_id'], ultimas['categoria']], sort=False).median()
+    resultado['n'] = df.groupby(['usuario_id', 'categoria'], sort=False).size()
+    return resultado.reset_index()
+
+def calcular_artefatos_anomalias(df):
+    """
+    Retorna (linhas de anomalias, linhas de estatísticas) prontas para gravar
+    a partir das despesas de um ou mais usuários.
+    """
+    if df.empty:
+        return [], []
+    marcadas = detectar_anomalias(df)
+    marcadas = marcadas[marcadas['anomalia']]
+    anomalias = list(marcadas[['id', 'usuario_id', 'categoria', 'valor', 'escore']].itertuples(index=False, name=None))
+    estatisticas = list(estatisticas_finais(df)[['usuario_id', 'categoria', 'n', 'mediana', 'mad']]
+                        .itertuples(index=False, name=None))
+    return anomalias, estatisticas
+
+def gravar_anomalias(cursor, usuarios, anomalias, estatisticas):
+    """Substitui as anomalias e estatísticas dos usuários informados (na transação corrente)."""
+    marcadores = ', '.join('?' for _ in usuarios)
+    cursor.execute(f"DELETE FROM anomalias WHERE usuario_id IN ({marcadores})", list(usuarios))
+    cursor.execute(f"DELETE FROM estatisticas_categoria WHERE usuario_id IN ({marcadores})", list(usuarios))
+    cursor.executemany("""
+        INSERT OR REPLACE INTO anomalias (transacao_id, usuario_id, categoria, valor, escore) VALUES (?, ?, ?, ?, ?)
+    """, anomalias)
+    cursor.executemany("""
+        INSERT INTO estatisticas_categoria (usuario_id, categoria, n, mediana, mad) VALUES (?, ?, ?, ?, ?)
+    """, estatisticas)
+
+def reconstruir_anomalias(usuario_id):
+    """Recalcula as anomalias e estatísticas de um usuário a partir do histórico completo."""
+    conn = db.conectar_bd(com_arquivo=True)
+    cursor = conn.cursor()
+    fonte = db._fonte_transacoes(cursor, "usuario_id = ? AND tipo = 'despesa'")
+    repeticoes = 2 if db._arquivo_anexado(cursor) else 1
+    df = pd.read_sql_query(f"SELECT id, usuario_id, data, categoria, valor FROM {fonte}", conn,
+                           params=[usuario_id] * repeticoes)
+
+    anomalias, estatisticas = calcular_artefatos_anomalias(df)
+    gravar_anomalias(cursor, [usuario_id], anomalias, estatisticas)
+    db._incrementar_versao(cursor, usuario_id)
+    conn.commit()
+    conn.close()
+    return len(anomalias)
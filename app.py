@@ -1,13 +1,78 @@
+import os
+import functools
 import dash
 import dash_bootstrap_components as dbc
 
+import db
+from memoria import medir_funcao
+from sessoes import usuario_da_sessao
+
 estilos = ["https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css", "https://fonts.googleapis.com/icon?family=Material+Icons", dbc.themes.COSMO]
 dbc_css = "https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates@V1.0.4/dbc.min.css"
 
+# --- Callbacks em segundo plano ---
+# Usa um DiskCache local (sem broker externo). Se o diskcache não estiver
+# instalado, os callbacks pesados continuam rodando de forma síncrona.
+CACHE_DIR = os.environ.get("MONEYFLOW_CACHE_DIR", "./cache")
+CACHE_EXPIRA = 600  # segundos que um resultado calculado fica em cache
+
+# Versão do cálculo: muda quando o código dos callbacks muda
+CACHE_VERSAO = "1"
+
+def _versao_dados_sessao():
+    """
+    Versões dos dados (global e do usuário da sessão) para a chave do cache.
+
+    Vários callbacks leem o banco além dos stores (períodos arquivados, motor
+    analítico, resumo mensal); escritas que não passam pelos stores, como o
+    lote noturno e as edições em lote, mudam a versão e invalidam o cache.
+    """
+    sessao = dash.callback_context.states.get('store-user-session.data')
+    return db.ler_versao(usuario_da_sessao(sessao))
 
+try:
+    import diskcache
+    background_callback_manager = dash.DiskcacheManager(
+        diskcache.Cache(CACHE_DIR),
+        cache_by=[lambda: CACHE_VERSAO, _versao_dados_sessao],
+        expire=CACHE_EXPIRA
+    )
+except ImportError:
+    background_callback_manager = None
 
-app = dash.Dash(__name__, external_stylesheets=estilos + [dbc_css])
+
+app = dash.Dash(__name__, external_stylesheets=estilos + [dbc_css],
+                background_callback_manager=background_callback_manager)
 
 app.config['suppress_callback_exceptions'] = True
 app.scripts.config.serve_locally = True
 server = app.server
+
+
+def background_callback(*args, progress=None, cancel=None, **kwargs):
+    """
+    Registra um callback pesado para rodar em segundo plano.
+    
+    A função decorada recebe `set_progress` como primeiro argumento quando
+    `progress` é informado. Uma nova entrada cancela o job anterior do mesmo
+    callback e resultados iguais são servidos do cache. Sem gerenciador
+    disponível, registra um callback síncrono comum.
+    
+    Os jobs rodam fora do worker; o perfil de memória (memoria.py) é medido
+    dentro do próprio job.
+    """
+    if background_callback_manager is not None:
+        registrar = app.callback(*args, background=True, progress=progress, cancel=cancel, **kwargs)
+        return lambda func: registrar(medir_funcao(func))
+    
+    def decorator(func):
+        if progress is None:
+            return app.callback(*args, **kwargs)(func)
+        
+        @functools.wraps(func)
+        def sem_progresso(*valores):
+            return func(lambda *_: None, *valores)
+        
+        return app.callback(*args, **kwargs)(sem_progresso)
+    
+    return decorator
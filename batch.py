@@ -0,0 +1,230 @@
+"""
+Processamento noturno em lote dos artefatos de análise de todos os usuários.
+
+Divide os usuários em partições por faixa de id e processa cada partição em
+um processo separado (ProcessPoolExecutor). Cada usuário é carregado com uma
+única consulta; os resultados (resumo mensal, previsões, anomalias de
+despesas e regras de categorização aprendidas) voltam ao processo principal,
+que é o único a gravar no banco, em lote, uma partição por vez. O status dos
+orçamentos do mês é avaliado na gravação, para a partição inteira de uma vez
+(db.avaliar_orcamentos), sobre o resumo mensal recém-gravado.
+
+Os artefatos são calculados fora da transação de escrita; por isso a versão
+dos dados de cada usuário é lida antes de carregá-lo e conferida na gravação.
+Um usuário que recebeu escritas nesse meio tempo (lançamento salvo, edição em
+lote) não é gravado e volta para a fila, até MAX_TENTATIVAS vezes; depois
+disso fica para a próxima execução.
+
+O progresso fica registrado em execucoes_lote: rodar de novo com o mesmo
+--execucao pula os usuários já concluídos. Com os snapshots Parquet como fonte
+do motor analítico, eles são regerados ao final.
+
+Uso:
+    python batch.py --processos 8
+    python batch.py --de-id 1000 --ate-id 1999 --execucao 2026-10-19
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import db
+from anomalias import calcular_artefatos_anomalias, gravar_anomalias
+from categorizacao import calcular_regras_aprendidas, gravar_regras_aprendidas
+
+# Quantidade de meses completos usados na previsão do mês corrente
+MESES_PREVISAO = 3
+
+# Vezes que um usuário alterado durante o processamento volta para a fila
+MAX_TENTATIVAS = 3
+
+# Posição do usuario_id nas linhas de cada artefato
+_POSICAO_USUARIO = {'resumo': 0, 'previsoes': 0, 'anomalias': 1, 'estatisticas': 0, 'regras': 0}
+
+# --- Cálculo (executado nos processos do pool) ---
+
+def carregar_transacoes_usuario(conn, usuario_id):
+    """Carrega todas as transações do usuário (inclusive arquivadas) com uma consulta."""
+    cursor = conn.cursor()
+    fonte = db._fonte_transacoes(cursor, "usuario_id = ?")
+    repeticoes = 2 if db._arquivo_anexado(cursor) else 1
+    return pd.read_sql_query(f"SELECT id, usuario_id, tipo, descricao, valor, data, categoria, efetuado FROM {fonte}", conn,
+                             params=[usuario_id] * repeticoes)
+
+def calcular_resumo_mensal(df):
+    """Agrupa as transações por mês, tipo e categoria (mesmo formato de resumo_mensal)."""
+    df = df.assign(
+        mes=df['data'].astype(str).str[:7],
+        valor_efetuado=np.where(df['efetuado'].fillna(0).astype(bool), df['valor'], 0.0)
+    )
+    return (df.groupby(['mes', 'tipo', 'categoria'], as_index=False)
+              .agg(total=('valor', 'sum'), total_efetuado=('valor_efetuado', 'sum'), quantidade=('valor', 'size')))
+
+def calcular_previsao(resumo, mes):
+    """
+    Prevê receitas e despesas do mês como a média dos últimos meses completos
+    (meses sem lançamentos contam como zero).
+    """
+    anteriores = pd.period_range(end=pd.Period(mes, freq='M') - 1, periods=MESES_PREVISAO, freq='M').strftime('%Y-%m')
+    mensal = (resumo.pivot_table(index='mes', columns='tipo', values='total', aggfunc='sum')
+                    .reindex(index=anteriores, columns=['receita', 'despesa'])
+                    .fillna(0))
+    return mensal.mean()
+
+def processar_particao(usuarios, mes):
+    """
+    Calcula os artefatos de uma partição de usuários: resumo mensal,
+    previsão, anomalias e regras de categorização.
+
+    Retorna um dicionário com as linhas a gravar e as versões dos dados
+    lidas antes do cálculo; não escreve no banco.
+    """
+    conn = db.conectar_bd(com_arquivo=True)
+    artefatos = {'usuarios': list(usuarios), 'mes': mes, 'resumo': [], 'previsoes': [],
+                 'anomalias': [], 'estatisticas': [], 'regras': [],
+                 'versoes': db._ler_versoes_usuarios(conn.cursor(), usuarios)}
+    for usuario_id in usuarios:
+        df = carregar_transacoes_usuario(conn, usuario_id)
+        resumo = calcular_resumo_mensal(df)
+        artefatos['resumo'] += [(usuario_id, *linha) for linha in resumo.itertuples(index=False)]
+
+        previsao = calcular_previsao(resumo, mes)
+        artefatos['previsoes'] += [(usuario_id, mes, tipo, float(valor)) for tipo, valor in previsao.items()]
+
+        anomalias, estatisticas = calcular_artefatos_anomalias(df[df['tipo'] == 'despesa'])
+        artefatos['anomalias'] += anomalias
+        artefatos['estatisticas'] += estatisticas
+        artefatos['regras'] += calcular_regras_aprendidas(df)
+
+    conn.close()
+    return artefatos
+
+# --- Gravação (processo principal) ---
+
+def gravar_artefatos(artefatos, execucao):
+    """
+    Grava os artefatos de uma partição em uma única transação.
+
+    A transação começa com o lock de escrita (BEGIN IMMEDIATE), então nenhuma
+    escrita entra entre a conferência das versões e o commit. Retorna os
+    usuários cujos dados mudaram desde o cálculo (não gravados).
+    """
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        versoes = db._ler_versoes_usuarios(cursor, artefatos['usuarios'])
+        alterados = [u for u in artefatos['usuarios'] if versoes[u] != artefatos['versoes'][u]]
+        usuarios = [u for u in artefatos['usuarios'] if versoes[u] == artefatos['versoes'][u]]
+        if alterados:
+            excluidos = set(alterados)
+            artefatos = {**artefatos, **{
+                nome: [linha for linha in artefatos[nome] if linha[posicao] not in excluidos]
+                for nome, posicao in _POSICAO_USUARIO.items()
+            }}
+        if not usuarios:
+            conn.rollback()
+            return alterados
+        marcadores = ', '.join('?' for _ in usuarios)
+
+        cursor.execute(f"DELETE FROM resumo_mensal WHERE usuario_id IN ({marcadores})", usuarios)
+        cursor.executemany("""
+            INSERT INTO resumo_mensal (usuario_id, mes, tipo, categoria, total, total_efetuado, quantidade)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, artefatos['resumo'])
+        cursor.executemany("""
+            INSERT OR REPLACE INTO previsoes (usuario_id, mes, tipo, valor) VALUES (?, ?, ?, ?)
+        """, artefatos['previsoes'])
+
+        # Orçamentos da partição em uma só avaliação vetorizada, já com o resumo novo
+        status = db._avaliar_orcamentos(conn, artefatos['mes'], usuarios)
+        cursor.executemany("""
+            INSERT OR REPLACE INTO status_orcamentos (usuario_id, mes, categoria, limite, gasto, utilizacao, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(int(l.usuario_id), l.mes, l.categoria, l.limite, l.gasto, l.utilizacao, l.status)
+              for l in status.itertuples()])
+        chaves = [(int(l.usuario_id), l.mes, l.categoria) for l in status.itertuples()]
+        db._remover_alertas_invalidos(cursor, chaves)
+        db._registrar_alertas_orcamento(cursor, chaves)
+        gravar_anomalias(cursor, usuarios, artefatos['anomalias'], artefatos['estatisticas'])
+        gravar_regras_aprendidas(cursor, usuarios, artefatos['regras'])
+        cursor.executemany("INSERT OR REPLACE INTO execucoes_lote (execucao, usuario_id) VALUES (?, ?)",
+                           [(execucao, usuario_id) for usuario_id in usuarios])
+        for usuario_id in usuarios:
+            db._incrementar_versao(cursor, usuario_id)
+        conn.commit()
+    finally:
+        conn.close()
+    return alterados
+
+# --- Orquestração ---
+
+def listar_usuarios(de_id, ate_id, execucao):
+    """Lista os usuários ativos da faixa que ainda não foram concluídos nesta execução."""
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT u.id FROM usuarios u
+        WHERE u.ativo = 1 AND u.id BETWEEN ? AND ?
+          AND NOT EXISTS (SELECT 1 FROM execucoes_lote e WHERE e.execucao = ? AND e.usuario_id = u.id)
+        ORDER BY u.id
+    """, (de_id, ate_id, execucao))
+    usuarios = [linha[0] for linha in cursor.fetchall()]
+    conn.close()
+    return usuarios
+
+def executar(de_id=0, ate_id=2**62, processos=None, tamanho_particao=100, execucao=None, mes=None):
+    """Processa os usuários da faixa e retorna quantos foram concluídos."""
+    execucao = execucao or datetime.now().date().isoformat()
+    mes = mes or datetime.now().strftime('%Y-%m')
+    usuarios = listar_usuarios(de_id, ate_id, execucao)
+    pendentes = usuarios
+
+    concluidos = 0
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        for tentativa in range(1, MAX_TENTATIVAS + 1):
+            particoes = [pendentes[i:i + tamanho_particao] for i in range(0, len(pendentes), tamanho_particao)]
+            futuros = [executor.submit(processar_particao, particao, mes) for particao in particoes]
+            pendentes = []
+            for futuro in as_completed(futuros):
+                artefatos = futuro.result()
+                alterados = gravar_artefatos(artefatos, execucao)
+                pendentes += alterados
+                concluidos += len(artefatos['usuarios']) - len(alterados)
+                print(f"{concluidos}/{len(usuarios)} usuários processados")
+            if not pendentes:
+                break
+            print(f"{len(pendentes)} usuário(s) alterado(s) durante o cálculo (tentativa {tentativa})")
+    if pendentes:
+        print(f"{len(pendentes)} usuário(s) ficam para a próxima execução com o mesmo --execucao")
+    return concluidos
+
+def main():
+    parser = argparse.ArgumentParser(description="Processamento em lote dos artefatos de análise do MoneyFlow")
+    parser.add_argument("--de-id", type=int, default=0, help="primeiro id de usuário da faixa")
+    parser.add_argument("--ate-id", type=int, default=2**62, help="último id de usuário da faixa")
+    parser.add_argument("--processos", type=int, default=os.cpu_count(), help="processos em paralelo")
+    parser.add_argument("--tamanho-particao", type=int, default=100, help="usuários por partição")
+    parser.add_argument("--execucao", help="identificador da execução para retomada (padrão: data de hoje)")
+    parser.add_argument("--mes", help="mês de referência AAAA-MM (padrão: mês atual)")
+    parser.add_argument("--arquivar", action="store_true", help="arquiva as transações antigas ao final")
+    args = parser.parse_args()
+
+    db.inicializar_bd()
+    inicio = time.perf_counter()
+    total = executar(args.de_id, args.ate_id, args.processos, args.tamanho_particao, args.execucao, args.mes)
+    print(f"Concluído: {total} usuários em {time.perf_counter() - inicio:.1f}s")
+
+    if args.arquivar:
+        print(f"Transações arquivadas: {db.arquivar_transacoes()}")
+    if analytics.FONTE == 'parquet' and analytics.duckdb is not None:
+        print(f"Snapshot Parquet: {analytics.exportar_parquet()} transações")
+
+if __name__ == "__main__":
+    main()
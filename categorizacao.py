@@ -0,0 +1,250 @@
+"""
+Categorização automática de transações pela descrição.
+
+As regras de cada usuário (palavras-chave ou expressões regulares) são
+compiladas uma vez: as palavras-chave em um dicionário e as expressões em
+uma única alternação, de modo que classificar uma descrição é uma passada
+pelo texto. As regras manuais têm prioridade sobre as aprendidas do
+histórico do usuário.
+"""
+
+import re
+
+import pandas as pd
+
+import db
+
+# Uma palavra só vira regra se aparecer em pelo menos esta quantidade de
+# transações e se esta fração delas estiver na mesma categoria
+MIN_OCORRENCIAS_REGRA = 3
+PUREZA_MIN_REGRA = 0.9
+
+# Palavras comuns demais para indicar uma categoria
+PALAVRAS_IGNORADAS = {'com', 'para', 'dos', 'das', 'por', 'uma', 'pagamento', 'compra', 'parcela'}
+
+# Palavras aprendidas: só letras, com pelo menos 3 caracteres
+_PADRAO_PALAVRA = r'\b[a-z]{3,}\b'
+
+def normalizar(texto):
+    """Minúsculas e sem acentos, para comparar descrições digitadas de formas diferentes."""
+    return db.normalizar_descricao(texto)
+
+def _normalizar_serie(serie):
+    """Versão vetorizada de normalizar()."""
+    return (serie.fillna('').astype(str).str.normalize('NFKD')
+                 .str.encode('ascii', 'ignore').str.decode('ascii').str.lower())
+
+def _palavras(texto):
+    """Palavras de um texto já normalizado."""
+    return tuple(re.findall(r'\w+', texto))
+
+def _expressao_combinavel(padrao):
+    """
+    Prepara a expressão de uma regra para a alternação: os grupos nomeados
+    viram grupos sem captura (dois com o mesmo nome não compilam juntos).
+    Retorna None se ela usa referências a grupos, que mudariam de número ou
+    de nome dentro da alternação, ou se não compila dentro de um grupo (como
+    as flags globais fora do início).
+    """
+    if re.search(r'\(\?P=|\\g<|\\[1-9]', padrao):
+        return None
+    convertida = re.sub(r'\(\?P<\w+>', '(?:', padrao)
+    try:
+        re.compile(f'(?:{convertida})')
+    except re.error:
+        return None
+    return convertida
+
+class Classificador:
+    """
+    Classificador compilado a partir de uma lista de regras.
+
+    Cada regra é uma tupla (padrao, regex, categoria, aprendida). As regras
+    manuais são avaliadas antes das aprendidas. Em cada camada, as expressões
+    regulares viram uma única alternação e as palavras-chave (uma ou mais
+    palavras) ficam em um dicionário consultado palavra a palavra, então o
+    custo cresce com o tamanho da descrição, não com a quantidade de regras.
+    As expressões são testadas antes das palavras-chave; entre estas vence a
+    ocorrência mais à esquerda (a mais longa, em empate).
+    """
+
+    def __init__(self, regras):
+        self._camadas = []
+        for aprendidas in (False, True):
+            camada = [(padrao, regex, categoria) for padrao, regex, categoria, aprendida in regras
+                      if bool(aprendida) == aprendidas]
+            if not camada:
+                continue
+
+            # Regras antigas que não entram na alternação são ignoradas
+            expressoes = []
+            for padrao, regex, categoria in camada:
+                convertida = _expressao_combinavel(padrao) if regex else None
+                if convertida is not None:
+                    expressoes.append((convertida, categoria))
+            combinada, categorias_regex = None, {}
+            if expressoes:
+                combinada = re.compile('|'.join(f'(?P<r{i}>{padrao})' for i, (padrao, _) in enumerate(expressoes)))
+                categorias_regex = {f'r{i}': categoria for i, (_, categoria) in enumerate(expressoes)}
+
+            chaves = {}
+            for padrao, regex, categoria in camada:
+                palavras = _palavras(normalizar(padrao))
+                if not regex and palavras:
+                    chaves.setdefault(palavras, categoria)
+            maximo = max((len(p) for p in chaves), default=0)
+
+            self._camadas.append((combinada, categorias_regex, chaves, maximo))
+
+    def classificar(self, descricao):
+        """Retorna a categoria da descrição, ou None se nenhuma regra casar."""
+        texto = normalizar(descricao)
+        palavras = None
+        for combinada, categorias_regex, chaves, maximo in self._camadas:
+            if combinada is not None:
+                encontrado = combinada.search(texto)
+                if encontrado:
+                    return categorias_regex[encontrado.lastgroup]
+            if chaves:
+                palavras = palavras if palavras is not None else _palavras(texto)
+                for inicio in range(len(palavras)):
+                    for tamanho in range(min(maximo, len(palavras) - inicio), 0, -1):
+                        categoria = chaves.get(palavras[inicio:inicio + tamanho])
+                        if categoria is not None:
+                            return categoria
+        return None
+
+    def classificar_varios(self, descricoes):
+        """Classifica uma sequência de descrições (None onde não houver regra)."""
+        return [self.classificar(descricao) for descricao in descricoes]
+
+# --- Regras no banco ---
+
+def ler_regras(usuario_id, tipo):
+    """Lista as regras do usuário para o tipo, manuais primeiro."""
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT padrao, regex, categoria, aprendida FROM regras_categoria
+        WHERE usuario_id = ? AND tipo = ?
+        ORDER BY aprendida, id
+    """, (usuario_id, tipo))
+    regras = cursor.fetchall()
+    conn.close()
+    return regras
+
+def adicionar_regra(usuario_id, tipo, padrao, categoria, regex=False):
+    """
+    Cria (ou atualiza) uma regra manual. Com regex=True o padrão é uma
+    expressão regular aplicada à descrição normalizada (sem acentos, em
+    minúsculas).
+    """
+    padrao = (padrao or '').strip()
+    if not padrao:
+        raise ValueError("O padrão da regra não pode ser vazio")
+    if regex:
+        try:
+            re.compile(padrao)
+        except re.error as e:
+            raise ValueError(f"Expressão regular inválida: {e}") from e
+        if _expressao_combinavel(padrao) is None:
+            raise ValueError("Expressões com referências a grupos (\\1, (?P=nome)) ou flags fora do início não são suportadas")
+        # A regra precisa compilar junto com as demais do usuário
+        try:
+            Classificador(ler_regras(usuario_id, tipo) + [(padrao, 1, categoria, 0)])
+        except re.error as e:
+            raise ValueError(f"A expressão não pode ser combinada com as regras existentes: {e}") from e
+
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO regras_categoria (usuario_id, tipo, padrao, regex, categoria, aprendida)
+            VALUES (?, ?, ?, ?, ?, 0)
+            ON CONFLICT(usuario_id, tipo, padrao, regex) DO UPDATE SET
+                categoria = excluded.categoria, aprendida = 0
+        """, (usuario_id, tipo, padrao, int(bool(regex)), categoria))
+        db._incrementar_versao(cursor, usuario_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+def remover_regra(usuario_id, tipo, padrao):
+    """Remove as regras do usuário com o padrão informado."""
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM regras_categoria WHERE usuario_id = ? AND tipo = ? AND padrao = ?",
+                       (usuario_id, tipo, padrao))
+        db._incrementar_versao(cursor, usuario_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+_cache_classificadores = db.CacheVersionado()
+
+def obter_classificador(usuario_id, tipo):
+    """Classificador compilado do usuário, recompilado quando os dados dele mudam."""
+    _, versao = db.ler_versao(usuario_id)
+    return _cache_classificadores.obter((usuario_id, tipo), versao,
+                                        lambda: Classificador(ler_regras(usuario_id, tipo)))
+
+def classificar(usuario_id, tipo, descricoes):
+    """Classifica uma lista de descrições com as regras do usuário."""
+    return obter_classificador(usuario_id, tipo).classificar_varios(descricoes)
+
+def sugerir_categoria(usuario_id, tipo, descricao):
+    """Categoria sugerida para uma descrição, ou None."""
+    return obter_classificador(usuario_id, tipo).classificar(descricao)
+
+# --- Aprendizado a partir do histórico ---
+
+def calcular_regras_aprendidas(df, min_ocorrencias=MIN_OCORRENCIAS_REGRA, pureza=PUREZA_MIN_REGRA):
+    """
+    Deriva regras de palavra-chave das transações já categorizadas.
+
+    Recebe um DataFrame com as colunas usuario_id, tipo, descricao e categoria
+    e retorna linhas (usuario_id, tipo, palavra, categoria) das palavras que
+    quase sempre aparecem com a mesma categoria, das mais frequentes às menos.
+    """
+    if df.empty:
+        return []
+
+    palavras = (df.assign(palavra=_normalizar_serie(df['descricao']).str.findall(_PADRAO_PALAVRA))
+                  .explode('palavra')
+                  .dropna(subset=['palavra']))
+    palavras = palavras[~palavras['palavra'].isin(PALAVRAS_IGNORADAS)]
+    # Cada transação conta uma vez por palavra
+    palavras = palavras.reset_index().drop_duplicates(['index', 'palavra'])
+
+    contagem = palavras.groupby(['usuario_id', 'tipo', 'palavra', 'categoria']).size().rename('n').reset_index()
+    contagem['total'] = contagem.groupby(['usuario_id', 'tipo', 'palavra'])['n'].transform('sum')
+    regras = contagem[(contagem['total'] >= min_ocorrencias) & (contagem['n'] >= pureza * contagem['total'])]
+    regras = regras.sort_values(['usuario_id', 'tipo', 'n'], ascending=[True, True, False])
+    return list(regras[['usuario_id', 'tipo', 'palavra', 'categoria']].itertuples(index=False, name=None))
+
+def gravar_regras_aprendidas(cursor, usuarios, regras):
+    """Substitui as regras aprendidas dos usuários (na transação corrente), sem tocar nas manuais."""
+    marcadores = ', '.join('?' for _ in usuarios)
+    cursor.execute(f"DELETE FROM regras_categoria WHERE aprendida = 1 AND usuario_id IN ({marcadores})",
+                   list(usuarios))
+    cursor.executemany("""
+        INSERT OR IGNORE INTO regras_categoria (usuario_id, tipo, padrao, regex, categoria, aprendida)
+        VALUES (?, ?, ?, 0, ?, 1)
+    """, regras)
+
+def aprender_regras(usuario_id):
+    """Reaprende as regras do usuário a partir de todo o histórico. Retorna quantas foram criadas."""
+    conn = db.conectar_bd(com_arquivo=True)
+    cursor = conn.cursor()
+    fonte = db._fonte_transacoes(cursor, "usuario_id = ?")
+    repeticoes = 2 if db._arquivo_anexado(cursor) else 1
+    df = pd.read_sql_query(f"SELECT usuario_id, tipo, descricao, categoria FROM {fonte}", conn,
+                           params=[usuario_id] * repeticoes)
+
+    regras = calcular_regras_aprendidas(df)
+    gravar_regras_aprendidas(cursor, [usuario_id], regras)
+    db._incrementar_versao(cursor, usuario_id)
+    conn.commit()
+    conn.close()
+    return len(regras)
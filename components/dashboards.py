@@ -12,7 +12,15 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import calendar
-from app import app
+import functools
+import os
+from analytics import fluxo_por_periodo, motor_ativo, totais_por_categoria
+from app import app, background_callback
+from serializacao import decodificar_transacoes
+from sessoes import usuario_da_sessao
+from db import (ler_resumo_mensal, ler_categorias, definir_orcamento, ler_utilizacao_orcamentos, ler_anomalias,
+                ler_alertas_orcamento, ler_totais_categorias, ler_transacoes, ler_data_limite_arquivo)
+import dash
 
 # --- Estilos ---
 card_icon = {
@@ -25,10 +33,114 @@ card_icon = {
 # Margem padrão para os gráficos
 graph_margin = dict(l=25, r=25, t=25, b=0)
 
+# --- Agrupamento temporal dos gráficos de evolução ---
+# Máximo de pontos (ou grupos de barras) por série, qualquer que seja o período
+MAX_PONTOS_SERIE = 120
+
+# Granularidades da mais fina para a mais grossa: (regra do pandas, nome, dias aproximados)
+GRANULARIDADES = [
+    ('D', 'dia', 1),
+    ('W-MON', 'semana', 7),
+    ('MS', 'mês', 30.44),
+    ('QS', 'trimestre', 91.31),
+    ('YS', 'ano', 365.25),
+]
+
+def escolher_granularidade(inicio, fim, max_pontos=MAX_PONTOS_SERIE):
+    """Retorna (regra, nome) da granularidade mais fina que cabe em max_pontos no período."""
+    dias = (pd.Timestamp(fim) - pd.Timestamp(inicio)).days + 1
+    for regra, nome, dias_periodo in GRANULARIDADES:
+        if dias / dias_periodo <= max_pontos:
+            return regra, nome
+    return GRANULARIDADES[-1][:2]
+
+def agrupar_por_periodo(df, regra):
+    """Soma os valores por período (rotulado pelo início do período), vetorizado."""
+    if df.empty:
+        return pd.Series(dtype=float)
+    agrupador = pd.Grouper(key='Data', freq=regra, label='left', closed='left') if regra.startswith('W') \
+        else pd.Grouper(key='Data', freq=regra)
+    return df[['Data', 'Valor']].groupby(agrupador)['Valor'].sum()
+
+def _periodo_dos_dados(start_date, end_date, *dfs):
+    """Período do filtro ou, sem ele, o período coberto pelos dados."""
+    if start_date and end_date:
+        return pd.to_datetime(start_date), pd.to_datetime(end_date)
+    datas = [df['Data'] for df in dfs if not df.empty]
+    if not datas:
+        hoje = pd.Timestamp.today().normalize()
+        return hoje, hoje
+    datas = pd.concat(datas)
+    return datas.min(), datas.max()
+
+# --- Período anterior ao histórico recente ---
+def _transacoes_do_periodo(data_receita, data_despesa, session_data, start_date, end_date):
+    """
+    Receitas e despesas para o período do filtro.
+
+    Os stores guardam só o histórico recente (desde a data de corte do
+    arquivo); se o período começa antes, ele é lido do banco limitado ao
+    intervalo pedido, anexando o arquivo só nesse caso.
+    """
+    vazio = pd.DataFrame({'Categoria': [], 'Data': [], 'Valor': []})
+    data_limite = ler_data_limite_arquivo()
+    usuario_id = usuario_da_sessao(session_data)
+    if data_limite is None or not usuario_id or (start_date and str(start_date)[:10] >= data_limite):
+        return tuple(decodificar_transacoes(data) if data else vazio.copy() for data in (data_receita, data_despesa))
+    return ler_transacoes(usuario_id, start_date, end_date)
+
+def _usuario_analitico(session_data, start_date, end_date):
+    """
+    Usuário cujas agregações do período vão para o motor analítico (DuckDB),
+    ou None: com o motor pandas os gráficos agregam as transações dos stores.
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if usuario_id and start_date and end_date and motor_ativo() == 'duckdb':
+        return usuario_id
+    return None
+
+def _totais_historico(session_data, tipo):
+    """Totais por categoria de todo o histórico (resumo mensal), ou vazio sem sessão."""
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
+        return pd.DataFrame({'Categoria': [], 'Valor': []})
+    return ler_totais_categorias(usuario_id, tipo)
+
+# --- Séries grandes (resolução completa) ---
+# Acima desta quantidade de pontos por série, as linhas passam a ser desenhadas
+# com WebGL e os eixos vão para o navegador como arrays binários (base64)
+LIMITE_PONTOS_WEBGL = int(os.environ.get("MONEYFLOW_LIMITE_WEBGL", 5000))
+
+def _serie_grande(x):
+    return len(x) > LIMITE_PONTOS_WEBGL
+
+def _arrays_binarios(x, y):
+    """
+    Converte datas e valores em arrays float64. O Plotly serializa arrays
+    numpy como arrays tipados em base64; as datas vão em milissegundos desde
+    1970, que o eixo de datas interpreta diretamente.
+    """
+    datas = pd.DatetimeIndex(x).as_unit('ms').asi8.astype('f8')
+    return datas, np.asarray(y, dtype='f8')
+
+def _serie_linha(nome, x, y, hovertemplate):
+    """Série de linha: Scatter comum ou, para séries grandes, Scattergl com arrays binários."""
+    if _serie_grande(x):
+        x, y = _arrays_binarios(x, y)
+        return go.Scattergl(name=nome, x=x, y=y, mode="lines", hovertemplate=hovertemplate)
+    return go.Scatter(name=nome, x=x, y=y, mode="lines", hovertemplate=hovertemplate)
+
+def _serie_barras(nome, x, y, hovertemplate):
+    """Série de barras, com arrays binários quando grande (não há variante WebGL de barras)."""
+    if _serie_grande(x):
+        x, y = _arrays_binarios(x, y)
+    return go.Bar(name=nome, x=x, y=y, hovertemplate=hovertemplate)
+
 # --- Layout Principal ---
-layout = dbc.Col([
-    # Linha 1: Cards de Resumo (Saldo, Receita, Despesa)
-    dbc.Row([
+@functools.lru_cache(maxsize=None)
+def _linha_cards():
+    """Linha 1: Cards de Resumo (Saldo, Receita, Despesa) — estática."""
+    return dbc.Row([
         # Saldo
         dbc.Col([
             dbc.CardGroup([
@@ -68,51 +180,119 @@ layout = dbc.Col([
                     style={"maxWidth": 75, "height": 100, "margin-left": "-10px"},
                 )])
             ], width=4),
-    ], style={"margin": "10px"}),
+    ], style={"margin": "10px"})
+
+def criar_layout():
+    """
+    Monta o layout do dashboard para uma nova sessão.
     
-    # Linha 2: Filtros e Gráfico 1 (Fluxo de Caixa)
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                html.Legend("Filtrar lançamentos", className="card-title"),
+    O período padrão do filtro (últimos 30 dias) é calculado na hora.
+    """
+    hoje = datetime.now().date()
+    _, cat_despesa = ler_categorias()
+    return dbc.Col([
+        _linha_cards(),
+        
+        # Linha 2: Filtros e Gráfico 1 (Fluxo de Caixa)
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    html.Legend("Filtrar lançamentos", className="card-title"),
                 
-                html.Label("Categorias das receitas"),
-                dcc.Dropdown(
-                    id="dropdown-receita", clearable=False, style={"width": "100%"},
-                    persistence=True, persistence_type="session", multi=True
-                ),
+                    html.Label("Categorias das receitas"),
+                    dcc.Dropdown(
+                        id="dropdown-receita", clearable=False, style={"width": "100%"},
+                        persistence=True, persistence_type="session", multi=True
+                    ),
                 
-                html.Label("Categorias das despesas", style={"margin-top": "10px"}),
-                dcc.Dropdown(
-                    id="dropdown-despesa", clearable=False, style={"width": "100%"},
-                    persistence=True, persistence_type="session", multi=True
-                ),
+                    html.Label("Categorias das despesas", style={"margin-top": "10px"}),
+                    dcc.Dropdown(
+                        id="dropdown-despesa", clearable=False, style={"width": "100%"},
+                        persistence=True, persistence_type="session", multi=True
+                    ),
                 
-                html.Legend("Período de Análise", style={"margin-top": "10px"}),
-                dcc.DatePickerRange(
-                    id='date-picker-config', month_format='Do MMM, YY',
-                    end_date_placeholder_text='Data...',
-                    start_date=datetime.now().date() - timedelta(days=30),
-                    end_date=datetime.now().date(),
-                    style={'z-index': '100'}
-                )
-            ], style={"height": "100%", "padding": "20px"}), 
-        ], width=4),
+                    html.Legend("Período de Análise", style={"margin-top": "10px"}),
+                    dcc.DatePickerRange(
+                        id='date-picker-config', month_format='Do MMM, YY',
+                        end_date_placeholder_text='Data...',
+                        start_date=hoje - timedelta(days=30),
+                        end_date=hoje,
+                        style={'z-index': '100'}
+                    ),
+                    dbc.Switch(
+                        id='switch-resolucao-completa', label="Resolução completa", value=False,
+                        persistence=True, persistence_type="session", style={"margin-top": "10px"}
+                    )
+                ], style={"height": "100%", "padding": "20px"}), 
+            ], width=4),
         
-        # Gráfico 1: Fluxo de Caixa Acumulado
-        dbc.Col(dbc.Card(dcc.Graph(id="graph1"), style={"height": "100%", "padding": "10px"}), width=8),
-    ], style={"margin": "10px"}),
-    
-    # Linha 3: Gráfico 2 (Barras) e Gráficos 3 e 4 (Pizza)
-    dbc.Row([
-        # Gráfico 2: Comparativo Receitas x Despesas (Barras)
-        dbc.Col(dbc.Card(dcc.Graph(id="graph2"), style={"padding": "10px"}), width=6),
-        # Gráfico 3: Pizza de Receitas
-        dbc.Col(dbc.Card(dcc.Graph(id="graph3"), style={"padding": "10px"}), width=3),
-        # Gráfico 4: Pizza de Despesas
-        dbc.Col(dbc.Card(dcc.Graph(id="graph4"), style={"padding": "10px"}), width=3),
-    ], style={"margin": "10px"})
-])
+            # Gráfico 1: Fluxo de Caixa Acumulado
+            dbc.Col(dbc.Card([
+                dbc.Progress(id="progress-graph1", value=0, style={"height": "3px"}),
+                dcc.Graph(id="graph1")
+            ], style={"height": "100%", "padding": "10px"}), width=8),
+        ], style={"margin": "10px"}),
+    
+        # Linha 3: Gráfico 2 (Barras) e Gráficos 3 e 4 (Pizza)
+        dbc.Row([
+            # Gráfico 2: Comparativo Receitas x Despesas (Barras)
+            dbc.Col(dbc.Card([
+                dbc.Progress(id="progress-graph2", value=0, style={"height": "3px"}),
+                dcc.Graph(id="graph2")
+            ], style={"padding": "10px"}), width=6),
+            # Gráfico 3: Pizza de Receitas
+            dbc.Col(dbc.Card(dcc.Graph(id="graph3"), style={"padding": "10px"}), width=3),
+            # Gráfico 4: Pizza de Despesas
+            dbc.Col(dbc.Card(dcc.Graph(id="graph4"), style={"padding": "10px"}), width=3),
+        ], style={"margin": "10px"}),
+    
+        # Linha 4: Comparativo Mensal (MoM e YoY a partir do resumo mensal)
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    html.Legend("Comparativo Mensal", className="card-title"),
+                    dbc.RadioItems(
+                        id="radio-horizonte-mensal",
+                        options=[{"label": f"{n} meses", "value": n} for n in (12, 24, 60)],
+                        value=12, inline=True,
+                        persistence=True, persistence_type="session"
+                    ),
+                    html.Div(id="comparativos-mensais", style={"margin-top": "10px"})
+                ], style={"height": "100%", "padding": "20px"}),
+            ], width=4),
+            dbc.Col(dbc.Card(dcc.Graph(id="graph-mensal"), style={"height": "100%", "padding": "10px"}), width=8),
+        ], style={"margin": "10px"}),
+    
+        # Linha 5: Orçamentos do mês por categoria de despesa
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    html.Legend("Definir Orçamento", className="card-title"),
+                    html.Label("Categoria"),
+                    dbc.Select(
+                        id="select-orcamento-categoria",
+                        options=[{"label": c, "value": c} for c in cat_despesa],
+                        value=cat_despesa[0] if cat_despesa else None
+                    ),
+                    html.Label("Limite mensal (vazio remove)", style={"margin-top": "10px"}),
+                    dbc.Input(id="input-orcamento-limite", type="number", min=0, placeholder="R$ 0,00"),
+                    dbc.Button("Salvar Orçamento", id="btn-salvar-orcamento", color="primary", style={"margin-top": "10px"})
+                ], style={"height": "100%", "padding": "20px"}),
+            ], width=4),
+            dbc.Col(dbc.Card([
+                html.Legend("Orçamentos do Mês", className="card-title"),
+                html.Div(id="painel-orcamentos")
+            ], style={"height": "100%", "padding": "20px"}), width=8),
+        ], style={"margin": "10px"}),
+    
+        # Linha 6: Despesas fora do padrão da categoria
+        dbc.Row([
+            dbc.Col(dbc.Card([
+                html.Legend("Despesas Fora do Padrão", className="card-title"),
+                html.Div(id="painel-anomalias")
+            ], style={"padding": "20px"}), width=12),
+        ], style={"margin": "10px"})
+    ])
 
 # --- Callbacks ---
 
@@ -121,19 +301,21 @@ layout = dbc.Col([
     [Output("dropdown-receita", "options"), 
      Output("dropdown-receita", "value"), 
      Output("p-receita-dashboards", "children")],
-    Input("store-receitas", "data")
+    Input("store-receitas", "data"),
+    State("store-user-session", "data")
 )
-def update_receitas_cards(data):
+def update_receitas_cards(data, session_data):
     """
     Atualiza o dropdown de receitas e o card de total de receitas.
 
+    Os totais vêm do resumo mensal, que inclui as receitas arquivadas.
     """
-    if not data: 
+    df = _totais_historico(session_data, 'receita')
+    if df.empty:
         return [], [], "R$ 0.00"
         
-    df = pd.DataFrame(data)
     valor = df['Valor'].sum()
-    categorias = df['Categoria'].unique().tolist()
+    categorias = df['Categoria'].tolist()
     options = [{"label": cat, "value": cat} for cat in categorias]
     
     # Retorna todas as categorias como valor padrão para o dropdown
@@ -143,19 +325,21 @@ def update_receitas_cards(data):
     [Output("dropdown-despesa", "options"), 
      Output("dropdown-despesa", "value"), 
      Output("p-despesa-dashboards", "children")],
-    Input("store-despesas", "data")
+    Input("store-despesas", "data"),
+    State("store-user-session", "data")
 )
-def update_despesas_cards(data):
+def update_despesas_cards(data, session_data):
     """
     Atualiza o dropdown de despesas e o card de total de despesas.
     
+    Os totais vêm do resumo mensal, que inclui as despesas arquivadas.
     """
-    if not data: 
+    df = _totais_historico(session_data, 'despesa')
+    if df.empty:
         return [], [], "R$ 0.00"
         
-    df = pd.DataFrame(data)
     valor = df['Valor'].sum()
-    categorias = df['Categoria'].unique().tolist()
+    categorias = df['Categoria'].tolist()
     options = [{"label": cat, "value": cat} for cat in categorias]
     
     # Retorna todas as categorias como valor padrão para o dropdown
@@ -164,30 +348,36 @@ def update_despesas_cards(data):
 @app.callback(
     Output("p-saldo-dashboards", "children"),
     [Input("store-receitas", "data"), 
-     Input("store-despesas", "data")]
+     Input("store-despesas", "data")],
+    State("store-user-session", "data")
 )
-def update_saldo_total(receitas_data, despesas_data):
+def update_saldo_total(receitas_data, despesas_data, session_data):
     """
     Calcula e exibe o saldo total (Receitas - Despesas).
 
     """
-    total_receitas = pd.DataFrame(receitas_data)['Valor'].sum() if receitas_data else 0
-    total_despesas = pd.DataFrame(despesas_data)['Valor'].sum() if despesas_data else 0
+    total_receitas = _totais_historico(session_data, 'receita')['Valor'].sum()
+    total_despesas = _totais_historico(session_data, 'despesa')['Valor'].sum()
     saldo = total_receitas - total_despesas
     
     return f"R$ {saldo:.2f}"
 
-# Gráfico 1 - Fluxo de Caixa Acumulado
-@app.callback(
+# Gráfico 1 - Fluxo de Caixa Acumulado (em segundo plano)
+@background_callback(
     Output('graph1', 'figure'),
     [Input('store-receitas', 'data'), 
      Input('store-despesas', 'data'),
      Input("dropdown-receita", "value"), 
      Input("dropdown-despesa", "value"),
      Input('date-picker-config', 'start_date'), 
-     Input('date-picker-config', 'end_date')]
+     Input('date-picker-config', 'end_date'),
+     Input('switch-resolucao-completa', 'value')],
+    State('store-user-session', 'data'),
+    progress=[Output('progress-graph1', 'value')],
+    cancel=[Input('url', 'pathname')]
 )
-def update_graph1(data_receita, data_despesa, receita_selecionada, despesa_selecionada, start_date, end_date):
+def update_graph1(set_progress, data_receita, data_despesa, receita_selecionada, despesa_selecionada, start_date, end_date,
+                  resolucao_completa=False, session_data=None):
     """
     Gera o gráfico de linha do fluxo de caixa acumulado.
     
@@ -197,9 +387,19 @@ def update_graph1(data_receita, data_despesa, receita_selecionada, despesa_selec
     receita_selecionada = receita_selecionada or []
     despesa_selecionada = despesa_selecionada or []
 
-    # Cria DataFrames vazios com colunas se não houver dados
-    df_receitas = pd.DataFrame(data_receita) if data_receita else pd.DataFrame({'Categoria': [], 'Data': [], 'Valor': []})
-    df_despesas = pd.DataFrame(data_despesa) if data_despesa else pd.DataFrame({'Categoria': [], 'Data': [], 'Valor': []})
+    usuario_id = None if resolucao_completa else _usuario_analitico(session_data, start_date, end_date)
+    if usuario_id:
+        # Agregado pelo motor analítico, sem carregar as transações
+        regra, granularidade = escolher_granularidade(start_date, end_date)
+        periodos = fluxo_por_periodo(usuario_id, regra, start_date, end_date, categorias_receita=receita_selecionada,
+                                     categorias_despesa=despesa_selecionada).set_index('periodo')
+        set_progress((50,))
+        return _figura_fluxo_acumulado(set_progress, periodos['receitas'] - periodos['despesas'], granularidade)
+
+    # Dados dos stores ou, para períodos anteriores a eles, do banco
+    df_receitas, df_despesas = _transacoes_do_periodo(data_receita, data_despesa, session_data, start_date, end_date)
+
+    set_progress((10,))
 
     # 1. Filtra pelos valores selecionados nos dropdowns
     df_receitas = df_receitas[df_receitas['Categoria'].isin(receita_selecionada)]
@@ -217,24 +417,32 @@ def update_graph1(data_receita, data_despesa, receita_selecionada, despesa_selec
         df_receitas = df_receitas[(df_receitas['Data'] >= start_date) & (df_receitas['Data'] <= end_date)]
         df_despesas = df_despesas[(df_despesas['Data'] >= start_date) & (df_despesas['Data'] <= end_date)]
 
-    # 3. Agrupa os dados por data
-    df_rc = df_receitas.set_index("Data")[["Valor"]].groupby("Data").sum().rename(columns={"Valor": "Receita"}) if not df_receitas.empty else pd.DataFrame()
-    df_ds = df_despesas.set_index("Data")[["Valor"]].groupby("Data").sum().rename(columns={"Valor": "Despesa"}) if not df_despesas.empty else pd.DataFrame()
-
-    # 4. Junta os dois dataframes e calcula o acumulado
-    df_acum = df_rc.join(df_ds, how="outer").fillna(0)
-
-    # Garante que ambas as colunas 'Receita' e 'Despesa' existam após o join
-    if 'Receita' not in df_acum:
-        df_acum['Receita'] = 0
-    if 'Despesa' not in df_acum:
-        df_acum['Despesa'] = 0
-
-    df_acum["Acum"] = (df_acum["Receita"] - df_acum["Despesa"]).cumsum()
+    set_progress((50,))
+
+    # 3. Agrupa por período, com a granularidade escolhida pelo tamanho do intervalo,
+    # ou um ponto por lançamento na resolução completa
+    df_receitas['Data'] = pd.to_datetime(df_receitas['Data'])
+    df_despesas['Data'] = pd.to_datetime(df_despesas['Data'])
+    if resolucao_completa:
+        granularidade = 'lançamento'
+        fluxo = pd.concat([df_receitas.set_index('Data')['Valor'], -df_despesas.set_index('Data')['Valor']])
+        fluxo = fluxo.sort_index(kind='stable')
+    else:
+        regra, granularidade = escolher_granularidade(*_periodo_dos_dados(start_date, end_date, df_receitas, df_despesas))
+        fluxo = agrupar_por_periodo(df_receitas, regra).sub(agrupar_por_periodo(df_despesas, regra), fill_value=0)
+    return _figura_fluxo_acumulado(set_progress, fluxo, granularidade)
+
+def _figura_fluxo_acumulado(set_progress, fluxo, granularidade):
+    """Figura do fluxo de caixa acumulado a partir do saldo por período."""
+    # 4. Calcula o acumulado
+    df_acum = fluxo.cumsum().to_frame("Acum")
+    set_progress((80,))
 
     # 5. Cria a figura
     fig = go.Figure()
-    fig.add_trace(go.Scatter(name="Fluxo de caixa", x=df_acum.index, y=df_acum["Acum"], mode="lines"))
+    fig.add_trace(_serie_linha("Fluxo de caixa", df_acum.index, df_acum["Acum"],
+                               f"{granularidade} de %{{x|%d/%m/%Y}}<br>R$ %{{y:.2f}}<extra></extra>"))
+    fig.update_xaxes(type="date")
     
     # Estilização
     fig.update_layout(
@@ -242,32 +450,49 @@ def update_graph1(data_receita, data_despesa, receita_selecionada, despesa_selec
         height=250, 
         paper_bgcolor='rgba(0,0,0,0)', 
         plot_bgcolor='rgba(0,0,0,0)',
-        title="Fluxo de Caixa Acumulado"
+        title=f"Fluxo de Caixa Acumulado (por {granularidade})"
     )
+    set_progress((100,))
     return fig
 
-# Gráfico 2 - Comparativo Receitas x Despesas (Barras)
-@app.callback(
+# Gráfico 2 - Comparativo Receitas x Despesas (Barras, em segundo plano)
+@background_callback(
     Output('graph2', 'figure'),
     [Input('store-receitas', 'data'), 
      Input('store-despesas', 'data'),
      Input('dropdown-receita', 'value'), 
      Input('dropdown-despesa', 'value'),
      Input('date-picker-config', 'start_date'), 
-     Input('date-picker-config', 'end_date')]
+     Input('date-picker-config', 'end_date'),
+     Input('switch-resolucao-completa', 'value')],
+    State('store-user-session', 'data'),
+    progress=[Output('progress-graph2', 'value')],
+    cancel=[Input('url', 'pathname')]
 )
-def update_graph2(data_receita, data_despesa, receita_selecionada, despesa_selecionada, start_date, end_date):
+def update_graph2(set_progress, data_receita, data_despesa, receita_selecionada, despesa_selecionada, start_date, end_date,
+                  resolucao_completa=False, session_data=None):
     """
     Gera o gráfico de barras comparativo de Receitas e Despesas por data.
     """
     fig = go.Figure()
     
-    if not data_receita and not data_despesa:
+    usuario_id = _usuario_analitico(session_data, start_date, end_date)
+    if usuario_id:
+        # Agregado pelo motor analítico, sem carregar as transações
+        regra, granularidade = ('D', 'dia') if resolucao_completa else escolher_granularidade(start_date, end_date)
+        categorias_selecionadas = (receita_selecionada or []) + (despesa_selecionada or [])
+        periodos = fluxo_por_periodo(usuario_id, regra, start_date, end_date, categorias_receita=categorias_selecionadas,
+                                     categorias_despesa=categorias_selecionadas).set_index('periodo')
+        set_progress((50,))
+        series = {"Receitas": periodos['receitas'], "Despesas": periodos['despesas']}
+        return _figura_comparativo(set_progress, fig, series, granularidade)
+
+    df_rc, df_ds = _transacoes_do_periodo(data_receita, data_despesa, session_data, start_date, end_date)
+    if df_rc.empty and df_ds.empty:
         fig.update_layout(title="Nenhum dado para exibir", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
         return fig
 
-    df_rc = pd.DataFrame(data_receita) if data_receita else pd.DataFrame()
-    df_ds = pd.DataFrame(data_despesa) if data_despesa else pd.DataFrame()
+    set_progress((10,))
 
     # Adiciona a coluna 'Output' para diferenciar Receitas e Despesas
     if not df_rc.empty: df_rc["Output"] = "Receitas"
@@ -291,15 +516,21 @@ def update_graph2(data_receita, data_despesa, receita_selecionada, despesa_selec
     categorias_selecionadas = (receita_selecionada or []) + (despesa_selecionada or [])
     df_final = df_final[df_final["Categoria"].isin(categorias_selecionadas)]
 
-    # 3. Cria o gráfico de barras
-    fig = px.bar(
-        df_final, 
-        x="Data", 
-        y="Valor", 
-        color="Output", 
-        barmode="group",
-        title="Comparativo Receitas x Despesas"
-    )
+    set_progress((50,))
+
+    # 3. Agrupa por período (uma barra por período e série, não por lançamento)
+    regra, granularidade = ('D', 'dia') if resolucao_completa else escolher_granularidade(start_date, end_date)
+    series = {output: agrupar_por_periodo(df_final[df_final["Output"] == output], regra)
+              for output in ("Receitas", "Despesas")}
+    return _figura_comparativo(set_progress, fig, series, granularidade)
+
+def _figura_comparativo(set_progress, fig, series, granularidade):
+    """Barras de receitas e despesas por período."""
+    for output, serie in series.items():
+        fig.add_trace(_serie_barras(output, serie.index, serie.values,
+                                    f"{granularidade} de %{{x|%d/%m/%Y}}<br>R$ %{{y:.2f}}<extra></extra>"))
+    fig.update_layout(barmode="group", title=f"Comparativo Receitas x Despesas (por {granularidade})")
+    fig.update_xaxes(type="date")
     
     # Estilização
     fig.update_layout(
@@ -308,6 +539,7 @@ def update_graph2(data_receita, data_despesa, receita_selecionada, despesa_selec
         paper_bgcolor='rgba(0,0,0,0)', 
         plot_bgcolor='rgba(0,0,0,0)'
     )
+    set_progress((100,))
     return fig
 
 # Gráfico 3 - Pizza de Receitas (Corrigido para filtrar por data)
@@ -316,27 +548,34 @@ def update_graph2(data_receita, data_despesa, receita_selecionada, despesa_selec
     [Input('store-receitas', 'data'),
      Input('dropdown-receita', 'value'),
      Input('date-picker-config', 'start_date'),
-     Input('date-picker-config', 'end_date')]
+     Input('date-picker-config', 'end_date')],
+    State('store-user-session', 'data')
 )
-def update_pie_receita(data_receita, receita_selecionada, start_date, end_date):
+def update_pie_receita(data_receita, receita_selecionada, start_date, end_date, session_data):
     """
     Gera o gráfico de pizza de Receitas, filtrando por categoria e data.
     
     """
-    if not data_receita or not receita_selecionada:
+    if not receita_selecionada:
         return go.Figure(layout={'title': 'Receitas', 'paper_bgcolor': 'rgba(0,0,0,0)', 'plot_bgcolor': 'rgba(0,0,0,0)'})
 
-    df = pd.DataFrame(data_receita)
-    
-    # 1. Filtra por categoria
-    df = df[df['Categoria'].isin(receita_selecionada)]
+    usuario_id = _usuario_analitico(session_data, start_date, end_date)
+    if usuario_id:
+        # Totais do período agregados pelo motor analítico
+        df = totais_por_categoria(usuario_id, 'receita', start_date, end_date)
+        df = df[df['categoria'].isin(receita_selecionada)].rename(columns={'categoria': 'Categoria', 'total': 'Valor'})
+    else:
+        df = _transacoes_do_periodo(data_receita, None, session_data, start_date, end_date)[0]
 
-    # 2. Filtra por período de data (Correção de Bug)
-    if start_date and end_date:
-        df['Data'] = pd.to_datetime(df['Data'])
-        start_date = pd.to_datetime(start_date)
-        end_date = pd.to_datetime(end_date)
-        df = df[(df['Data'] >= start_date) & (df['Data'] <= end_date)]
+        # 1. Filtra por categoria
+        df = df[df['Categoria'].isin(receita_selecionada)]
+
+        # 2. Filtra por período de data (Correção de Bug)
+        if start_date and end_date:
+            df['Data'] = pd.to_datetime(df['Data'])
+            start_date = pd.to_datetime(start_date)
+            end_date = pd.to_datetime(end_date)
+            df = df[(df['Data'] >= start_date) & (df['Data'] <= end_date)]
 
     if df.empty:
         return go.Figure(layout={'title': 'Receitas', 'paper_bgcolor': 'rgba(0,0,0,0)', 'plot_bgcolor': 'rgba(0,0,0,0)'})
@@ -365,27 +604,34 @@ def update_pie_receita(data_receita, receita_selecionada, start_date, end_date):
     [Input('store-despesas', 'data'),
      Input('dropdown-despesa', 'value'),
      Input('date-picker-config', 'start_date'),
-     Input('date-picker-config', 'end_date')]
+     Input('date-picker-config', 'end_date')],
+    State('store-user-session', 'data')
 )
-def update_pie_despesa(data_despesa, despesa_selecionada, start_date, end_date):
+def update_pie_despesa(data_despesa, despesa_selecionada, start_date, end_date, session_data):
     """
     Gera o gráfico de pizza de Despesas, filtrando por categoria e data.
     
     """
-    if not data_despesa or not despesa_selecionada:
+    if not despesa_selecionada:
         return go.Figure(layout={'title': 'Despesas', 'paper_bgcolor': 'rgba(0,0,0,0)', 'plot_bgcolor': 'rgba(0,0,0,0)'})
 
-    df = pd.DataFrame(data_despesa)
-    
-    # 1. Filtra por categoria
-    df = df[df['Categoria'].isin(despesa_selecionada)]
+    usuario_id = _usuario_analitico(session_data, start_date, end_date)
+    if usuario_id:
+        # Totais do período agregados pelo motor analítico
+        df = totais_por_categoria(usuario_id, 'despesa', start_date, end_date)
+        df = df[df['categoria'].isin(despesa_selecionada)].rename(columns={'categoria': 'Categoria', 'total': 'Valor'})
+    else:
+        df = _transacoes_do_periodo(None, data_despesa, session_data, start_date, end_date)[1]
 
-    # 2. Filtra por período de data (Correção de Bug)
-    if start_date and end_date:
-        df['Data'] = pd.to_datetime(df['Data'])
-        start_date = pd.to_datetime(start_date)
-        end_date = pd.to_datetime(end_date)
-        df = df[(df['Data'] >= start_date) & (df['Data'] <= end_date)]
+        # 1. Filtra por categoria
+        df = df[df['Categoria'].isin(despesa_selecionada)]
+
+        # 2. Filtra por período de data (Correção de Bug)
+        if start_date and end_date:
+            df['Data'] = pd.to_datetime(df['Data'])
+            start_date = pd.to_datetime(start_date)
+            end_date = pd.to_datetime(end_date)
+            df = df[(df['Data'] >= start_date) & (df['Data'] <= end_date)]
 
     if df.empty:
         return go.Figure(layout={'title': 'Despesas', 'paper_bgcolor': 'rgba(0,0,0,0)', 'plot_bgcolor': 'rgba(0,0,0,0)'})
@@ -407,3 +653,171 @@ def update_pie_despesa(data_despesa, despesa_selecionada, start_date, end_date):
         plot_bgcolor='rgba(0,0,0,0)'
     )
     return fig
+
+
+# Gráfico 5 - Comparativo Mensal (MoM e YoY)
+def calcular_comparativos_mensais(df_resumo):
+    """
+    Calcula, a partir do resumo mensal, os totais por mês e as variações
+    mês a mês (MoM) e ano a ano (YoY) de receitas, despesas e saldo.
+    
+    Retorna um DataFrame indexado por mês ('AAAA-MM') sem lacunas.
+    """
+    colunas = ['receita', 'despesa']
+    if df_resumo.empty:
+        return pd.DataFrame(columns=colunas + ['saldo', 'pendente'])
+    
+    totais = df_resumo.pivot_table(index='mes', columns='tipo', values='total', aggfunc='sum', fill_value=0)
+    efetuados = df_resumo.pivot_table(index='mes', columns='tipo', values='total_efetuado', aggfunc='sum', fill_value=0)
+    
+    # Meses sem lançamentos entram com zero para que shift(12) seja exatamente um ano
+    meses = pd.period_range(totais.index.min(), totais.index.max(), freq='M').strftime('%Y-%m')
+    totais = totais.reindex(index=meses, columns=colunas, fill_value=0)
+    efetuados = efetuados.reindex(index=meses, columns=colunas, fill_value=0)
+    
+    df = totais.copy()
+    df['saldo'] = df['receita'] - df['despesa']
+    df['pendente'] = (totais - efetuados).sum(axis=1)
+    
+    base = df[['receita', 'despesa', 'saldo']]
+    for sufixo, periodos in (('mom', 1), ('yoy', 12)):
+        anterior = base.shift(periodos)
+        variacao = (base - anterior) / anterior.abs()
+        df[[f'{c}_{sufixo}' for c in base.columns]] = variacao.replace([np.inf, -np.inf], np.nan).to_numpy()
+    
+    return df
+
+def _formatar_variacao(valor):
+    """Formata uma variação percentual (ou '-' quando indefinida)."""
+    return "-" if pd.isna(valor) else f"{valor:+.1%}"
+
+@app.callback(
+    [Output('graph-mensal', 'figure'),
+     Output('comparativos-mensais', 'children')],
+    [Input('store-receitas', 'data'),
+     Input('store-despesas', 'data'),
+     Input('radio-horizonte-mensal', 'value')],
+    State('store-user-session', 'data')
+)
+def update_comparativo_mensal(data_receita, data_despesa, horizonte, session_data):
+    """
+    Gera o gráfico de receitas, despesas e saldo por mês, com MoM e YoY.
+    
+    Lê apenas o resumo mensal, sem percorrer as transações do período.
+    """
+    fig = go.Figure(layout={'title': 'Comparativo Mensal', 'paper_bgcolor': 'rgba(0,0,0,0)', 'plot_bgcolor': 'rgba(0,0,0,0)'})
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
+        return fig, ""
+    
+    # Busca 12 meses a mais para que o primeiro mês exibido tenha YoY
+    horizonte = horizonte or 12
+    mes_inicio = (pd.Period(datetime.now(), freq='M') - (horizonte + 11)).strftime('%Y-%m')
+    df = calcular_comparativos_mensais(ler_resumo_mensal(usuario_id, mes_inicio=mes_inicio))
+    if df.empty:
+        return fig, html.P("Nenhum lançamento registrado.")
+    
+    df_exibido = df.tail(horizonte)
+    fig.add_trace(go.Bar(name="Receitas", x=df_exibido.index, y=df_exibido['receita'],
+                         customdata=df_exibido['receita_mom'], hovertemplate="R$ %{y:.2f}<br>MoM %{customdata:+.1%}"))
+    fig.add_trace(go.Bar(name="Despesas", x=df_exibido.index, y=df_exibido['despesa'],
+                         customdata=df_exibido['despesa_mom'], hovertemplate="R$ %{y:.2f}<br>MoM %{customdata:+.1%}"))
+    fig.add_trace(go.Scatter(name="Saldo", x=df_exibido.index, y=df_exibido['saldo'], mode="lines+markers"))
+    fig.update_layout(
+        margin=graph_margin, 
+        height=300, 
+        barmode="group",
+        title="Comparativo Mensal"
+    )
+    
+    # Resumo do mês mais recente
+    mes = df.iloc[-1]
+    resumo = html.Div([
+        html.H6(f"Mês {df.index[-1]}"),
+        html.P(f"Receitas: R$ {mes['receita']:.2f} (MoM {_formatar_variacao(mes['receita_mom'])}, YoY {_formatar_variacao(mes['receita_yoy'])})"),
+        html.P(f"Despesas: R$ {mes['despesa']:.2f} (MoM {_formatar_variacao(mes['despesa_mom'])}, YoY {_formatar_variacao(mes['despesa_yoy'])})"),
+        html.P(f"Saldo: R$ {mes['saldo']:.2f} (MoM {_formatar_variacao(mes['saldo_mom'])}, YoY {_formatar_variacao(mes['saldo_yoy'])})"),
+        html.P(f"Pendente: R$ {mes['pendente']:.2f}", className="text-muted"),
+    ])
+    return fig, resumo
+
+
+# Painel de Orçamentos do Mês
+@app.callback(
+    Output('painel-orcamentos', 'children'),
+    [Input('store-despesas', 'data'),
+     Input('btn-salvar-orcamento', 'n_clicks')],
+    [State('select-orcamento-categoria', 'value'),
+     State('input-orcamento-limite', 'value'),
+     State('store-user-session', 'data')]
+)
+def update_orcamentos(data_despesa, n_clicks, categoria, limite, session_data):
+    """
+    Salva o orçamento informado (se o botão foi clicado) e exibe a utilização
+    de cada orçamento no mês atual, com os alertas registrados no mês.
+    
+    A utilização vem do resumo mensal e os alertas são registrados quando
+    uma despesa salva cruza o limiar, ambos atualizados na própria escrita.
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
+        return ""
+    
+    if dash.callback_context.triggered_id == 'btn-salvar-orcamento' and categoria:
+        definir_orcamento(usuario_id, categoria, limite)
+    
+    df = ler_utilizacao_orcamentos(usuario_id)
+    if df.empty:
+        return html.P("Nenhum orçamento definido.", className="text-muted")
+    
+    cores = {'ok': 'success', 'alerta': 'warning', 'estourado': 'danger'}
+    
+    # Um alerta por categoria: o nível mais grave registrado no mês
+    df_alertas = ler_alertas_orcamento(usuario_id)
+    df_alertas = df_alertas.sort_values('nivel', key=lambda n: n != 'estourado', kind='stable').drop_duplicates('categoria')
+    utilizacao = df.set_index('categoria')['utilizacao']
+    alertas = [
+        dbc.Alert(
+            f"{linha.categoria}: {'orçamento estourado' if linha.nivel == 'estourado' else 'limiar de alerta atingido'} "
+            f"em {str(linha.data_criacao)[:10]} ({utilizacao.get(linha.categoria, linha.utilizacao):.0%} utilizado)",
+            color=cores[linha.nivel]
+        )
+        for linha in df_alertas.itertuples()
+    ]
+    barras = [
+        html.Div([
+            html.Small(f"{linha.categoria} — R$ {linha.gasto:.2f} / R$ {linha.limite:.2f}"),
+            dbc.Progress(value=min(linha.utilizacao, 1) * 100, color=cores[linha.status],
+                         label=f"{linha.utilizacao:.0%}", style={"height": "18px", "margin-bottom": "8px"})
+        ])
+        for linha in df.itertuples()
+    ]
+    return alertas + barras
+
+
+# Painel de Despesas Fora do Padrão
+@app.callback(
+    Output('painel-anomalias', 'children'),
+    Input('store-despesas', 'data'),
+    State('store-user-session', 'data')
+)
+def update_anomalias(data_despesa, session_data):
+    """
+    Lista as despesas mais recentes marcadas como incomuns para a categoria.
+    
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
+        return ""
+    
+    df = ler_anomalias(usuario_id)
+    if df.empty:
+        return html.P("Nenhuma despesa fora do padrão.", className="text-muted")
+    
+    alertas = []
+    for linha in df.to_dict('records'):
+        texto = f"{linha['Data']} — {linha['Categoria']}: R$ {linha['Valor']:.2f} ({linha['Descrição'] or '-'})"
+        if linha['Mediana']:
+            texto += f", {linha['Valor'] / linha['Mediana']:.1f}x a mediana da categoria"
+        alertas.append(dbc.Alert(texto, color="warning"))
+    return alertas
@@ -3,8 +3,11 @@ Componente responsável pela exibição de extratos e relatórios detalhados
 das transações financeiras do aplicativo.
 """
 
+import base64
+import io
+
 import dash
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 from dash import dash_table
 from dash.dash_table.Format import Group
 from dash import dcc
@@ -13,80 +16,353 @@ import dash_bootstrap_components as dbc
 import plotly.express as px
 import pandas as pd
 
-from app import app
+from app import app, background_callback
+from serializacao import codificar_transacoes, decodificar_transacoes
+from categorizacao import classificar, normalizar
+from sessoes import usuario_da_sessao
+from snapshots import ler_transacoes_usuario
+from db import (buscar_transacoes, ler_categorias, recategorizar_transacoes,
+                alternar_efetuado, excluir_transacoes, salvar_transacoes_em_lote, adicionar_categoria,
+                ler_extrato, ler_totais_categorias)
+
+# Quantidade de resultados por página na busca
+TAMANHO_PAGINA_BUSCA = 10
+
+# Lançamentos por página no extrato completo (renderizados com virtualização)
+TAMANHO_PAGINA_EXTRATO = 200
+
+# Categoria usada na importação quando nenhuma regra reconhece a descrição
+CATEGORIA_PADRAO_IMPORTACAO = 'Outros'
 
 # =========  Layout  =========== #
-layout = dbc.Col([
-    dbc.Row([
-        html.Legend("Tabela de despesas"),
-        html.Div(id="tabela-despesas", className="dbc"),
-    ]),
-    
-    dbc.Row([
-        dbc.Col([
-            dcc.Graph(id='bar-graph', style={"margin-right": "20px"}),
-        ], width=9),
+def criar_layout():
+    """
+    Monta o layout dos extratos para uma nova sessão.
+    
+    As categorias da edição em lote são lidas na hora (do cache).
+    """
+    _, cat_despesa = ler_categorias()
+    return dbc.Col([
+        dbc.Row([
+            html.Legend("Buscar lançamentos"),
+            dbc.Input(
+                id="input-busca-extratos",
+                placeholder="Buscar pela descrição...",
+                type="search",
+                debounce=True,
+                style={"margin-bottom": "10px"}
+            ),
+            html.Small(id="info-busca-extratos", className="text-muted"),
+            html.Div(dash_table.DataTable(
+                id="tabela-busca",
+                data=[],
+                columns=[{"name": i, "id": i} for i in ['Data', 'Tipo', 'Categoria', 'Valor', 'Descrição']],
+                style_cell={'textAlign': 'left'},
+                style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'},
+                page_current=0,
+                page_size=TAMANHO_PAGINA_BUSCA,
+                page_action="custom"
+            ), className="dbc"),
+        ], style={"margin-bottom": "20px"}),
+    
+        dbc.Tabs([
+            dbc.Tab(label="Despesas", tab_id="aba-despesas", children=[
+                dbc.Row([
+                    html.Legend("Tabela de despesas"),
+                    dcc.Upload(
+                        id="upload-extratos",
+                        children=html.Div(["Importar CSV (data, descrição, valor e, opcionalmente, tipo e categoria)"]),
+                        style={"borderWidth": "1px", "borderStyle": "dashed", "borderRadius": "5px",
+                               "textAlign": "center", "padding": "10px", "margin-bottom": "5px"}
+                    ),
+                    html.Small(id="info-importacao-extratos", className="text-muted", style={"margin-bottom": "10px"}),
+                    dbc.Row([
+                        dbc.Col(dbc.Select(
+                            id="select-extratos-categoria",
+                            options=[{"label": c, "value": c} for c in cat_despesa],
+                            placeholder="Nova categoria"
+                        ), width=3),
+                        dbc.Col(dbc.ButtonGroup([
+                            dbc.Button("Recategorizar", id="btn-extratos-recategorizar", color="primary", outline=True),
+                            dbc.Button("Alternar efetuado", id="btn-extratos-efetuado", color="secondary", outline=True),
+                            dbc.Button("Excluir", id="btn-extratos-excluir", color="danger", outline=True),
+                        ]), width=6),
+                        dbc.Col(html.Small(id="info-extratos-edicao", className="text-muted"), width=3),
+                    ], style={"margin-bottom": "10px"}),
+                    dbc.Progress(id="progress-extratos", value=0, style={"height": "3px"}),
+                    html.Div(id="tabela-despesas", className="dbc"),
+                ]),
+
+                dbc.Row([
+                    dbc.Col([
+                        dcc.Graph(id='bar-graph', style={"margin-right": "20px"}),
+                    ], width=9),
         
-        dbc.Col([
-            dbc.Card(
-                dbc.CardBody([
-                    html.H4("Despesas"),
-                    html.Legend("R$ -", id="valor_despesa_card", style={'font-size': '60px'}),
-                    html.H6("Total de despesas"),
-                ], style={'text-align': 'center', 'padding-top': '30px'}))
-        ], width=3),
-    ]),
-], style={"padding": "10px"})
+                    dbc.Col([
+                        dbc.Card(
+                            dbc.CardBody([
+                                html.H4("Despesas"),
+                                html.Legend("R$ -", id="valor_despesa_card", style={'font-size': '60px'}),
+                                html.H6("Total de despesas"),
+                            ], style={'text-align': 'center', 'padding-top': '30px'}))
+                    ], width=3),
+                ]),
+            ]),
+
+            dbc.Tab(label="Extrato completo", tab_id="aba-extrato", children=[
+                html.Small(id="info-extrato", className="text-muted"),
+                html.Div(dash_table.DataTable(
+                    id="tabela-extrato",
+                    data=[],
+                    columns=[{"name": i, "id": i} for i in ['Data', 'Tipo', 'Categoria', 'Descrição', 'Valor', 'Saldo']],
+                    style_cell={'textAlign': 'left'},
+                    style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'},
+                    style_data_conditional=[
+                        {'if': {'filter_query': '{Tipo} = "despesa"', 'column_id': 'Valor'}, 'color': 'crimson'},
+                        {'if': {'filter_query': '{Saldo} < 0', 'column_id': 'Saldo'}, 'color': 'crimson'},
+                    ],
+                    page_current=0,
+                    page_size=TAMANHO_PAGINA_EXTRATO,
+                    page_action="custom",
+                    virtualization=True,
+                    fixed_rows={'headers': True},
+                    style_table={'height': '600px', 'overflowY': 'auto'}
+                ), className="dbc"),
+            ]),
+        ], active_tab="aba-despesas"),
+    ], style={"padding": "10px"})
 
 # --- Callbacks ---
 
-# Tabela
+# Busca por descrição (FTS5, paginada no servidor)
 @app.callback(
+    [Output('tabela-busca', 'data'),
+     Output('tabela-busca', 'page_count'),
+     Output('info-busca-extratos', 'children')],
+    [Input('input-busca-extratos', 'value'),
+     Input('tabela-busca', 'page_current')],
+    State('store-user-session', 'data')
+)
+def buscar_lancamentos(termo, pagina, session_data):
+    """
+    Busca os lançamentos do usuário pela descrição e exibe a página pedida.
+    
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if not termo or not usuario_id:
+        return [], 0, ""
+    
+    # Um novo termo sempre começa da primeira página
+    if dash.callback_context.triggered_id == 'input-busca-extratos':
+        pagina = 0
+    
+    df, total = buscar_transacoes(usuario_id, termo, pagina or 0, TAMANHO_PAGINA_BUSCA)
+    paginas = -(-total // TAMANHO_PAGINA_BUSCA)
+    return df.to_dict('records'), paginas, f"{total} lançamento(s) encontrado(s)"
+
+# Extrato completo com saldo (paginado no servidor)
+@app.callback(
+    [Output('tabela-extrato', 'data'),
+     Output('tabela-extrato', 'page_count'),
+     Output('info-extrato', 'children')],
+    [Input('tabela-extrato', 'page_current'),
+     Input('store-receitas', 'data'),
+     Input('store-despesas', 'data')],
+    State('store-user-session', 'data')
+)
+def exibir_extrato(pagina, data_receita, data_despesa, session_data):
+    """
+    Exibe uma página do extrato de receitas e despesas com o saldo após cada
+    lançamento, recarregada quando os lançamentos mudam.
+    
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
+        return [], 0, ""
+    
+    df, total = ler_extrato(usuario_id, pagina or 0, TAMANHO_PAGINA_EXTRATO)
+    df['Valor'] = df['Valor'].round(2)
+    df['Saldo'] = df['Saldo'].round(2)
+    paginas = max(1, -(-total // TAMANHO_PAGINA_EXTRATO))
+    return df.to_dict('records'), paginas, f"{total} lançamento(s)"
+
+# Tabela (em segundo plano)
+@background_callback(
     Output('tabela-despesas', 'children'),
-    Input('store-despesas', 'data')
+    Input('store-despesas', 'data'),
+    progress=[Output('progress-extratos', 'value')],
+    cancel=[Input('url', 'pathname')]
 )
-def imprimir_tabela(data):
+def imprimir_tabela(set_progress, data):
     """
     Gera e exibe a tabela de despesas com os dados mais recentes.
     
+    O store guarda o histórico desde a data de corte do arquivo; as despesas
+    arquivadas aparecem no extrato completo e na busca.
     """
     if not data:
         return html.Div("Nenhuma despesa encontrada.")
     
-    df = pd.DataFrame(data)
+    set_progress((10,))
+    df = decodificar_transacoes(data)
     df['Data'] = pd.to_datetime(df['Data']).dt.date
     df = df.fillna('-')
     df = df.sort_values(by='Data', ascending=False)
+    set_progress((60,))
 
+    # O id fica nos registros (identifica as linhas selecionadas), mas não é exibido
     tabela = dash_table.DataTable(
+        id='tabela-extratos',
         data=df.to_dict('records'), 
-        columns=[{"name": i, "id": i} for i in df.columns],
+        columns=[{"name": i, "id": i} for i in df.columns if i != 'id'],
         style_cell={'textAlign': 'left'},
         style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'},
         page_size=10,
         sort_action="native",
-        filter_action="native"
+        filter_action="native",
+        row_selectable="multi",
+        selected_row_ids=[]
     )
 
+    set_progress((100,))
     return tabela
 
-            
+
+# Importação de CSV com categorização automática
+def _ler_csv_importado(contents):
+    """
+    Lê o CSV enviado pelo dcc.Upload e devolve um DataFrame com as colunas
+    tipo, descricao, valor, data, categoria e efetuado.
+    
+    Os cabeçalhos são comparados sem acentos e sem maiúsculas; sem coluna
+    tipo, valores negativos são despesas e positivos, receitas.
+    """
+    _, conteudo = contents.split(',', 1)
+    texto = base64.b64decode(conteudo).decode('utf-8-sig')
+    df = pd.read_csv(io.StringIO(texto), sep=None, engine='python')
+    df.columns = [normalizar(c).strip() for c in df.columns]
+    
+    faltando = {'data', 'descricao', 'valor'} - set(df.columns)
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(sorted(faltando))}")
+    
+    valor = pd.to_numeric(df['valor'].astype(str).str.replace(',', '.'), errors='raise')
+    if 'tipo' in df.columns:
+        tipo = df['tipo'].map(normalizar).str.strip()
+    else:
+        tipo = pd.Series(['despesa' if v < 0 else 'receita' for v in valor], index=df.index)
+    
+    return pd.DataFrame({
+        'tipo': tipo,
+        'descricao': df['descricao'].fillna('').astype(str),
+        'valor': valor.abs(),
+        'data': pd.to_datetime(df['data'], dayfirst=True).dt.date.astype(str),
+        'categoria': df['categoria'] if 'categoria' in df.columns else None,
+        'efetuado': df['efetuado'].fillna(1).astype(int) if 'efetuado' in df.columns else 1,
+    })
+
+@app.callback(
+    [Output('store-receitas', 'data', allow_duplicate=True),
+     Output('store-despesas', 'data', allow_duplicate=True),
+     Output('info-importacao-extratos', 'children')],
+    Input('upload-extratos', 'contents'),
+    State('store-user-session', 'data'),
+    prevent_initial_call=True
+)
+def importar_extrato(contents, session_data):
+    """
+    Importa as transações do CSV em uma única gravação, ignorando as que já
+    existem (reimportar um extrato sobreposto não duplica). Linhas sem
+    categoria são classificadas pelas regras do usuário.
+    
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if not contents or not usuario_id:
+        return dash.no_update, dash.no_update, ""
+    
+    try:
+        df = _ler_csv_importado(contents)
+    except Exception as e:
+        return dash.no_update, dash.no_update, f"Não foi possível ler o arquivo: {e}"
+    
+    df = df[df['tipo'].isin(['receita', 'despesa'])].copy()
+    for tipo in ('receita', 'despesa'):
+        sem_categoria = (df['tipo'] == tipo) & df['categoria'].isna()
+        df.loc[sem_categoria, 'categoria'] = classificar(usuario_id, tipo, df.loc[sem_categoria, 'descricao'])
+    
+    nao_classificadas = df['categoria'].isna()
+    for tipo in df.loc[nao_classificadas, 'tipo'].unique():
+        adicionar_categoria(CATEGORIA_PADRAO_IMPORTACAO, tipo)
+    df.loc[nao_classificadas, 'categoria'] = CATEGORIA_PADRAO_IMPORTACAO
+    
+    linhas = [(l.tipo, l.descricao, float(l.valor), l.data, l.categoria, int(l.efetuado), 0, usuario_id)
+              for l in df.itertuples(index=False)]
+    ids = salvar_transacoes_em_lote(linhas, ignorar_duplicadas=True)
+    
+    df_receitas, df_despesas = ler_transacoes_usuario(usuario_id)
+    mensagem = (f"{len(ids)} transação(ões) importada(s), {len(linhas) - len(ids)} duplicada(s) ignorada(s); "
+                f"{len(linhas) - int(nao_classificadas.sum())} categorizada(s) automaticamente ou pelo arquivo.")
+    return codificar_transacoes(df_receitas), codificar_transacoes(df_despesas), mensagem
+
+# Edição em lote das despesas selecionadas
 @app.callback(
+    [Output('store-despesas', 'data', allow_duplicate=True),
+     Output('info-extratos-edicao', 'children')],
+    [Input('btn-extratos-recategorizar', 'n_clicks'),
+     Input('btn-extratos-efetuado', 'n_clicks'),
+     Input('btn-extratos-excluir', 'n_clicks')],
+    [State('tabela-extratos', 'selected_row_ids'),
+     State('select-extratos-categoria', 'value'),
+     State('store-user-session', 'data')],
+    prevent_initial_call=True
+)
+def editar_selecionadas(n_recategorizar, n_efetuado, n_excluir, ids, categoria, session_data):
+    """
+    Aplica a ação do botão clicado a todas as despesas selecionadas, com um
+    único comando no banco, e recarrega as despesas.
+    
+    """
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
+        return dash.no_update, ""
+    if not ids:
+        return dash.no_update, "Nenhuma despesa selecionada."
+    
+    acao = dash.callback_context.triggered_id
+    if acao == 'btn-extratos-recategorizar':
+        if not categoria:
+            return dash.no_update, "Escolha a nova categoria."
+        alteradas = recategorizar_transacoes(usuario_id, ids, categoria)
+        mensagem = f"{alteradas} despesa(s) movida(s) para {categoria}."
+    elif acao == 'btn-extratos-efetuado':
+        alteradas = alternar_efetuado(usuario_id, ids)
+        mensagem = f"{alteradas} despesa(s) atualizada(s)."
+    else:
+        alteradas = excluir_transacoes(usuario_id, ids)
+        mensagem = f"{alteradas} despesa(s) excluída(s)."
+    
+    _, df_despesas = ler_transacoes_usuario(usuario_id)
+    return codificar_transacoes(df_despesas), mensagem
+            
+@background_callback(
     Output('bar-graph', 'figure'),
-    [Input('store-despesas', 'data'),]
+    [Input('store-despesas', 'data'),],
+    State('store-user-session', 'data'),
+    cancel=[Input('url', 'pathname')]
 )
-def bar_chart(data):
+def bar_chart(data, session_data):
     """
     Gera o gráfico de barras das despesas agrupadas por categoria.
    
+    Os totais vêm do resumo mensal, que inclui as despesas arquivadas.
     """
-    if not data:
+    usuario_id = usuario_da_sessao(session_data)
+    df_grouped = ler_totais_categorias(usuario_id, 'despesa') if usuario_id else pd.DataFrame()
+    if df_grouped.empty:
         fig = px.bar(title="Nenhuma despesa para exibir")
         fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
         return fig
     
-    df = pd.DataFrame(data)   
-    df_grouped = df.groupby("Categoria").sum()[["Valor"]].reset_index()
     graph = px.bar(df_grouped, x='Categoria', y='Valor', title="Despesas por Categoria")
     graph.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
     return graph
@@ -94,16 +370,17 @@ def bar_chart(data):
 # Simple card
 @app.callback(
     Output('valor_despesa_card', 'children'),
-    Input('store-despesas', 'data')
+    Input('store-despesas', 'data'),
+    State('store-user-session', 'data')
 )
-def display_desp(data):
+def display_desp(data, session_data):
     """
-    Calcula e exibe o total de despesas no card.
+    Calcula e exibe o total de despesas no card (todo o histórico, pelo resumo mensal).
    
     """
-    if not data:
+    usuario_id = usuario_da_sessao(session_data)
+    if not usuario_id:
         return "R$ 0.00"
     
-    df = pd.DataFrame(data)
-    valor = df['Valor'].sum()
+    valor = ler_totais_categorias(usuario_id, 'despesa')['Valor'].sum()
     return f"R$ {valor:.2f}"
\ No newline at end of file
@@ -2,11 +2,13 @@
 Componente responsável pela interface de login e registro de usuários
 do aplicativo.
 """
+import functools
 from dash import html, dcc, callback_context
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
 from app import app
 from db import autenticar_usuario, criar_usuario
+from sessoes import criar_sessao
 
 # --- Estilos CSS ---
 login_card_style = {
@@ -27,125 +29,131 @@ button_style = {
     'margin-bottom': '10px'
 }
 # --- Layout da Tela de Login ---
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    # Logo e título
-                    html.Div([
-                        html.H2("MoneyFlow", className="text-center text-primary mb-4"),
-                        html.P("Gerencie suas finanças de forma inteligente", 
-                               className="text-center text-muted mb-4")
-                    ]),
-                    
-                    # Alertas para feedback
-                    html.Div(id="login-alert", className="mb-3"),
-                    
-                    # Formulário de Login
-                    html.Div([
-                        dbc.InputGroup([
-                            dbc.InputGroupText(html.I(className="fa fa-user")),
-                            dbc.Input(
-                                id="login-username",
-                                placeholder="Usuário ou Email",
-                                type="text",
-                                style=input_style
-                            )
-                        ], className="mb-3"),
-                        
-                        dbc.InputGroup([
-                            dbc.InputGroupText(html.I(className="fa fa-lock")),
-                            dbc.Input(
-                                id="login-password",
-                                placeholder="Senha",
-                                type="password",
-                                style=input_style
-                            )
-                        ], className="mb-3"),
-                        
-                        dbc.Button(
-                            "Entrar",
-                            id="login-button",
-                            color="primary",
-                            style=button_style
-                        ),
-                        
-                        html.Hr(),
-                        
-                        html.P("Não tem uma conta?", className="text-center mb-2"),
-                        dbc.Button(
-                            "Criar Conta",
-                            id="show-register-button",
-                            color="outline-primary",
-                            style=button_style
-                        )
-                    ], id="login-form"),
-                    
-                    # Formulário de Registro (inicialmente oculto)
-                    html.Div([
-                        dbc.InputGroup([
-                            dbc.InputGroupText(html.I(className="fa fa-user")),
-                            dbc.Input(
-                                id="register-username",
-                                placeholder="Nome de Usuário",
-                                type="text",
-                                style=input_style
-                            )
-                        ], className="mb-3"),
+@functools.lru_cache(maxsize=None)
+def criar_layout():
+    """
+    Monta a tela de login. Como não tem partes dinâmicas, é construída uma
+    única vez e reaproveitada em todas as sessões.
+    """
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        # Logo e título
+                        html.Div([
+                            html.H2("MoneyFlow", className="text-center text-primary mb-4"),
+                            html.P("Gerencie suas finanças de forma inteligente", 
+                                   className="text-center text-muted mb-4")
+                        ]),
                         
-                        dbc.InputGroup([
-                            dbc.InputGroupText(html.I(className="fa fa-envelope")),
-                            dbc.Input(
-                                id="register-email",
-                                placeholder="Email",
-                                type="email",
-                                style=input_style
-                            )
-                        ], className="mb-3"),
+                        # Alertas para feedback
+                        html.Div(id="login-alert", className="mb-3"),
                         
-                        dbc.InputGroup([
-                            dbc.InputGroupText(html.I(className="fa fa-lock")),
-                            dbc.Input(
-                                id="register-password",
-                                placeholder="Senha",
-                                type="password",
-                                style=input_style
+                        # Formulário de Login
+                        html.Div([
+                            dbc.InputGroup([
+                                dbc.InputGroupText(html.I(className="fa fa-user")),
+                                dbc.Input(
+                                    id="login-username",
+                                    placeholder="Usuário ou Email",
+                                    type="text",
+                                    style=input_style
+                                )
+                            ], className="mb-3"),
+                            
+                            dbc.InputGroup([
+                                dbc.InputGroupText(html.I(className="fa fa-lock")),
+                                dbc.Input(
+                                    id="login-password",
+                                    placeholder="Senha",
+                                    type="password",
+                                    style=input_style
+                                )
+                            ], className="mb-3"),
+                            
+                            dbc.Button(
+                                "Entrar",
+                                id="login-button",
+                                color="primary",
+                                style=button_style
+                            ),
+                            
+                            html.Hr(),
+                            
+                            html.P("Não tem uma conta?", className="text-center mb-2"),
+                            dbc.Button(
+                                "Criar Conta",
+                                id="show-register-button",
+                                color="outline-primary",
+                                style=button_style
                             )
-                        ], className="mb-3"),
+                        ], id="login-form"),
                         
-                        dbc.InputGroup([
-                            dbc.InputGroupText(html.I(className="fa fa-lock")),
-                            dbc.Input(
-                                id="register-confirm-password",
-                                placeholder="Confirmar Senha",
-                                type="password",
-                                style=input_style
+                        # Formulário de Registro (inicialmente oculto)
+                        html.Div([
+                            dbc.InputGroup([
+                                dbc.InputGroupText(html.I(className="fa fa-user")),
+                                dbc.Input(
+                                    id="register-username",
+                                    placeholder="Nome de Usuário",
+                                    type="text",
+                                    style=input_style
+                                )
+                            ], className="mb-3"),
+                            
+                            dbc.InputGroup([
+                                dbc.InputGroupText(html.I(className="fa fa-envelope")),
+                                dbc.Input(
+                                    id="register-email",
+                                    placeholder="Email",
+                                    type="email",
+                                    style=input_style
+                                )
+                            ], className="mb-3"),
+                            
+                            dbc.InputGroup([
+                                dbc.InputGroupText(html.I(className="fa fa-lock")),
+                                dbc.Input(
+                                    id="register-password",
+                                    placeholder="Senha",
+                                    type="password",
+                                    style=input_style
+                                )
+                            ], className="mb-3"),
+                            
+                            dbc.InputGroup([
+                                dbc.InputGroupText(html.I(className="fa fa-lock")),
+                                dbc.Input(
+                                    id="register-confirm-password",
+                                    placeholder="Confirmar Senha",
+                                    type="password",
+                                    style=input_style
+                                )
+                            ], className="mb-3"),
+                            
+                            dbc.Button(
+                                "Criar Conta",
+                                id="register-button",
+                                color="success",
+                                style=button_style
+                            ),
+                            
+                            html.Hr(),
+                            
+                            html.P("Já tem uma conta?", className="text-center mb-2"),
+                            dbc.Button(
+                                "Fazer Login",
+                                id="show-login-button",
+                                color="outline-success",
+                                style=button_style
                             )
-                        ], className="mb-3"),
-                        
-                        dbc.Button(
-                            "Criar Conta",
-                            id="register-button",
-                            color="success",
-                            style=button_style
-                        ),
-                        
-                        html.Hr(),
-                        
-                        html.P("Já tem uma conta?", className="text-center mb-2"),
-                        dbc.Button(
-                            "Fazer Login",
-                            id="show-login-button",
-                            color="outline-success",
-                            style=button_style
-                        )
-                    ], id="register-form", style={"display": "none"})
-                ])
-            ], style=login_card_style)
-        ], width=12)
-    ], justify="center")
-], fluid=True, style={"min-height": "100vh", "background-color": "#f8f9fa"})
+                        ], id="register-form", style={"display": "none"})
+                    ])
+                ], style=login_card_style)
+            ], width=12)
+        ], justify="center")
+    ], fluid=True, style={"min-height": "100vh", "background-color": "#f8f9fa"})
 
 # --- Callbacks ---#
 
@@ -201,10 +209,11 @@ def process_login(n_clicks, username, password):
             dismissable=True
         )
         
-        # Retorna dados da sessão
+        # Retorna dados da sessão; o usuário é identificado pelo id de sessão
+        # assinado, validado no servidor a cada callback
         session_data = {
             'logged_in': True,
-            'user_id': usuario['id'],
+            'sessao': criar_sessao(usuario['id']),
             'username': usuario['username'],
             'email': usuario['email']
         }
@@ -7,6 +7,8 @@ import dash
 from dash import html, dcc
 from dash.dependencies import Input, Output, State
 import random
+import uuid
+import functools
 import dash_bootstrap_components as dbc
 from app import app
 from datetime import datetime, date
@@ -15,14 +17,17 @@ import sqlite3
 import base64
 import os
 
+from serializacao import codificar_transacoes
+from categorizacao import sugerir_categoria
+from sessoes import usuario_da_sessao
+from snapshots import ler_transacoes_usuario
+
 # Importa as funções do banco de dados
 from db import (
-    conectar_bd, 
-    ler_transacoes, 
     ler_categorias, 
-    cat_receita, 
-    cat_despesa,
-    salvar_transacao
+    salvar_transacao,
+    adicionar_categoria,
+    remover_categorias
 )
 
 # ========= CONFIGURAÇÕES ========= #
@@ -46,7 +51,7 @@ def get_frase_motivacional():
     return random.choice(FRASES_MOTIVACIONAIS)
 
 # ========= FUNÇÕES AUXILIARES ========= #
-def create_receita_modal_body():
+def create_receita_modal_body(cat_receita):
     """Cria o corpo do modal de receita."""
     return [
         # Linha 1: Descrição e Valor
@@ -56,6 +61,7 @@ def create_receita_modal_body():
                 dbc.Input(
                     placeholder="Ex.: Salário, Freelance, Dividendos...", 
                     id="txt-receita",
+                    debounce=True,
                     className="modal-input"
                 )
             ], width=6), 
@@ -101,7 +107,8 @@ def create_receita_modal_body():
                 dbc.Select(
                     id='select_receita', 
                     options=[{'label': i, 'value': i} for i in cat_receita],
-                    value=cat_receita[0] if cat_receita else None,
+                    value=None,
+                    placeholder="Sugerida pela descrição",
                     className="modal-select"
                 )
             ], width=4)
@@ -118,7 +125,7 @@ def create_receita_modal_body():
         html.Div(id='id_teste_receita')
     ]
 
-def create_despesa_modal_body():
+def create_despesa_modal_body(cat_despesa):
     """Cria o corpo do modal de despesa."""
     return [
         # Linha 1: Descrição e Valor
@@ -128,6 +135,7 @@ def create_despesa_modal_body():
                 dbc.Input(
                     placeholder="Ex.: Aluguel, Supermercado, Transporte...", 
                     id="txt-despesa",
+                    debounce=True,
                     className="modal-input"
                 )
             ], width=6), 
@@ -173,7 +181,8 @@ def create_despesa_modal_body():
                 dbc.Select(
                     id='select_despesa', 
                     options=[{'label': i, 'value': i} for i in cat_despesa],
-                    value=cat_despesa[0] if cat_despesa else None,
+                    value=None,
+                    placeholder="Sugerida pela descrição",
                     className="modal-select"
                 )
             ], width=4)
@@ -228,17 +237,55 @@ def create_category_management_section(tipo):
     ])
 
 # ========= LAYOUT PRINCIPAL ========= #
-layout = dbc.Col([
-    # Cabeçalho
-    html.H1("MoneyFlow", className="text-primary"),
-    html.P("By Uesley", className="text-info"),
-    html.Hr(),
-    
-    # Seção com Mensagem Motivacional
-    html.Div([
+# As partes estáticas são montadas uma única vez e reaproveitadas; apenas as
+# partes dinâmicas (categorias, datas, frase) são geradas a cada sessão.
+
+@functools.lru_cache(maxsize=None)
+def _cabecalho():
+    """Cabeçalho da barra lateral (estático)."""
+    return (
+        html.H1("MoneyFlow", className="text-primary"),
+        html.P("By Uesley", className="text-info"),
+        html.Hr(),
+    )
+
+@functools.lru_cache(maxsize=None)
+def _botoes_acao():
+    """Botões de ação rápida (estáticos)."""
+    return dbc.Row([
+        dbc.Col([
+            dbc.Button(
+                color='success', 
+                id='open-novo-receita', 
+                children=['+ Receita'],
+                className="action-button"
+            )
+        ], width=6), 
+        dbc.Col([
+            dbc.Button(
+                color='danger', 
+                id='open-novo-despesa', 
+                children=['- Despesa'],
+                className="action-button"
+            )
+        ], width=6)
+    ], className="action-buttons-row")
+
+@functools.lru_cache(maxsize=None)
+def _navegacao():
+    """Navegação principal (estática)."""
+    return dbc.Nav([
+        dbc.NavLink("📊 Dashboard", href="/dashboards", active="exact", className="nav-link-custom"), 
+        dbc.NavLink("📋 Extratos", href="/extratos", active="exact", className="nav-link-custom"),
+        dbc.NavLink("🚪 Sair", href="/logout", active="exact", className="nav-link-custom")
+    ], vertical=True, pills=True, id='nav_buttons')
+
+def criar_secao_motivacional():
+    """Seção com a mensagem motivacional, sorteada a cada sessão."""
+    return html.Div([
         # Store para manter o estado da frase
         dcc.Store(id='store-frase-motivacional', data={'frase': get_frase_motivacional()}),
-        
+
         # Mensagem Motivacional
         html.Div([
             html.P(
@@ -280,67 +327,62 @@ layout = dbc.Col([
         'background': '#f8f9fa',
         'border-radius': '10px',
         'margin-bottom': '20px'
-    }),
-    
-    # Botões de Ação Rápida
-    dbc.Row([
-        dbc.Col([
-            dbc.Button(
-                color='success', 
-                id='open-novo-receita', 
-                children=['+ Receita'],
-                className="action-button"
-            )
-        ], width=6), 
-        dbc.Col([
-            dbc.Button(
-                color='danger', 
-                id='open-novo-despesa', 
-                children=['- Despesa'],
-                className="action-button"
-            )
-        ], width=6)
-    ], className="action-buttons-row"),
-    
-    # Modal para Adicionar Receita
-    dbc.Modal([
-        dbc.ModalHeader(dbc.ModalTitle('➕ Adicionar Receita')),
-        dbc.ModalBody(create_receita_modal_body()),
-        dbc.ModalFooter([
-            dbc.Button("Adicionar Receita", id="salvar_receita", color="success"),
-            dbc.Popover(
-                dbc.PopoverBody("✅ Receita Salva com Sucesso!"),
-                target="salvar_receita",
-                placement="left",
-                trigger="click"
-            )
-        ])
-    ], id="modal-novo-receita", size="lg", is_open=False, centered=True, backdrop=True),
-    
-    # Modal para Adicionar Despesa
-    dbc.Modal([
-        dbc.ModalHeader(dbc.ModalTitle('➖ Adicionar Despesa')),
-        dbc.ModalBody(create_despesa_modal_body()),
-        dbc.ModalFooter([
-            dbc.Button("Adicionar Despesa", id="salvar_despesa", color="danger"),
-            dbc.Popover(
-                dbc.PopoverBody("✅ Despesa Salva com Sucesso!"),
-                target="salvar_despesa",
-                placement="left",
-                trigger="click"
-            )
-        ])
-    ], id="modal-novo-despesa", size="lg", is_open=False, centered=True, backdrop=True),
-    
-    html.Hr(),
+    })
+
+def criar_modais(cat_receita, cat_despesa):
+    """Modais de receita e despesa com as categorias atuais."""
+    return [
+        # Modal para Adicionar Receita
+        dbc.Modal([
+            dbc.ModalHeader(dbc.ModalTitle('➕ Adicionar Receita')),
+            dbc.ModalBody(create_receita_modal_body(cat_receita)),
+            dbc.ModalFooter([
+                dbc.Button("Adicionar Receita", id="salvar_receita", color="success"),
+                dbc.Popover(
+                    dbc.PopoverBody("✅ Receita Salva com Sucesso!"),
+                    target="salvar_receita",
+                    placement="left",
+                    trigger="click"
+                )
+            ])
+        ], id="modal-novo-receita", size="lg", is_open=False, centered=True, backdrop=True),
+
+        # Modal para Adicionar Despesa
+        dbc.Modal([
+            dbc.ModalHeader(dbc.ModalTitle('➖ Adicionar Despesa')),
+            dbc.ModalBody(create_despesa_modal_body(cat_despesa)),
+            dbc.ModalFooter([
+                dbc.Button("Adicionar Despesa", id="salvar_despesa", color="danger"),
+                dbc.Popover(
+                    dbc.PopoverBody("✅ Despesa Salva com Sucesso!"),
+                    target="salvar_despesa",
+                    placement="left",
+                    trigger="click"
+                )
+            ])
+        ], id="modal-novo-despesa", size="lg", is_open=False, centered=True, backdrop=True),
+
+        # Chaves de idempotência dos formulários
+        dcc.Store(id='store-chave-receita'),
+        dcc.Store(id='store-chave-despesa')
+    ]
+
+def criar_layout():
+    """
+    Monta a barra lateral para uma nova sessão.
     
-    # Navegação Principal
-    dbc.Nav([
-        dbc.NavLink("📊 Dashboard", href="/dashboards", active="exact", className="nav-link-custom"), 
-        dbc.NavLink("📋 Extratos", href="/extratos", active="exact", className="nav-link-custom"),
-        dbc.NavLink("🚪 Sair", href="/logout", active="exact", className="nav-link-custom")
-    ], vertical=True, pills=True, id='nav_buttons')
-], id='sidebar_completa')
+    As categorias vêm do cache versionado de ler_categorias e as datas dos
+    formulários são sempre as do dia atual.
+    """
+    cat_receita, cat_despesa = ler_categorias()
+    return dbc.Col([
+        *_cabecalho(),
+        criar_secao_motivacional(),
+        _botoes_acao(),
+        *criar_modais(cat_receita, cat_despesa),
+        html.Hr(),
+        _navegacao()
+    ], id='sidebar_completa')
 
 # ========= CALLBACKS ========= #
 
@@ -369,6 +411,29 @@ def toggle_despesa_modal(open_clicks, save_clicks, is_open):
         return not is_open
     return is_open
 
+# CALLBACK: Chave de idempotência de cada abertura do formulário
+# (cliques repetidos em "Adicionar" reenviam a mesma chave e não duplicam).
+# A categoria começa vazia a cada abertura para ser sugerida pela descrição.
+@app.callback(
+    [Output('store-chave-receita', 'data'),
+     Output('select_receita', 'value', allow_duplicate=True)],
+    Input('open-novo-receita', 'n_clicks'),
+    prevent_initial_call=True
+)
+def new_receita_key(n_clicks):
+    """Gera uma nova chave ao abrir o modal de receita e limpa a categoria (volta a ser sugerida)."""
+    return uuid.uuid4().hex, None
+
+@app.callback(
+    [Output('store-chave-despesa', 'data'),
+     Output('select_despesa', 'value', allow_duplicate=True)],
+    Input('open-novo-despesa', 'n_clicks'),
+    prevent_initial_call=True
+)
+def new_despesa_key(n_clicks):
+    """Gera uma nova chave ao abrir o modal de despesa e limpa a categoria (volta a ser sugerida)."""
+    return uuid.uuid4().hex, None
+
 # CALLBACK: Salvar Transações
 @app.callback(
     Output('store-receitas', 'data'),
@@ -378,10 +443,11 @@ def toggle_despesa_modal(open_clicks, save_clicks, is_open):
      State("date-receitas", "date"),
      State("switches-input-receita", "value"),
      State("select_receita", "value"),
-     State("store-user-session", "data")],
+     State("store-user-session", "data"),
+     State("store-chave-receita", "data")],
     prevent_initial_call=True
 )
-def save_receita(n_clicks, descricao, valor, data_str, switches, categoria, session_data):
+def save_receita(n_clicks, descricao, valor, data_str, switches, categoria, session_data, chave):
     """Salva uma nova receita no banco de dados."""
     if not n_clicks or not valor:
         return dash.no_update
@@ -391,14 +457,15 @@ def save_receita(n_clicks, descricao, valor, data_str, switches, categoria, sess
         data = pd.to_datetime(data_str).date() if data_str else datetime.today().date()
         efetuado = 1 if switches and 1 in switches else 0
         fixo = 1 if switches and 2 in switches else 0
-        usuario_id = session_data.get('user_id') if session_data else None
+        usuario_id = usuario_da_sessao(session_data)
+        categoria = categoria or categoria_sugerida('receita', descricao, usuario_id)
         
         # Salva no banco
-        salvar_transacao('receita', descricao, float(valor), data, categoria, efetuado, fixo, usuario_id)
+        salvar_transacao('receita', descricao, float(valor), data, categoria, efetuado, fixo, usuario_id, chave=chave)
         
         # Recarrega os dados
-        df_receitas, _ = ler_transacoes(usuario_id)
-        return df_receitas.to_dict('records') if not df_receitas.empty else []
+        df_receitas, _ = ler_transacoes_usuario(usuario_id)
+        return codificar_transacoes(df_receitas)
         
     except Exception as e:
         print(f"❌ Erro ao salvar receita: {e}")
@@ -412,10 +479,11 @@ def save_receita(n_clicks, descricao, valor, data_str, switches, categoria, sess
      State("date-despesas", "date"),
      State("switches-input-despesa", "value"),
      State("select_despesa", "value"),
-     State("store-user-session", "data")],
+     State("store-user-session", "data"),
+     State("store-chave-despesa", "data")],
     prevent_initial_call=True
 )
-def save_despesa(n_clicks, descricao, valor, data_str, switches, categoria, session_data):
+def save_despesa(n_clicks, descricao, valor, data_str, switches, categoria, session_data, chave):
     """Salva uma nova despesa no banco de dados."""
     if not n_clicks or not valor:
         return dash.no_update
@@ -425,19 +493,67 @@ def save_despesa(n_clicks, descricao, valor, data_str, switches, categoria, sess
         data = pd.to_datetime(data_str).date() if data_str else datetime.today().date()
         efetuado = 1 if switches and 1 in switches else 0
         fixo = 1 if switches and 2 in switches else 0
-        usuario_id = session_data.get('user_id') if session_data else None
+        usuario_id = usuario_da_sessao(session_data)
+        categoria = categoria or categoria_sugerida('despesa', descricao, usuario_id)
         
         # Salva no banco
-        salvar_transacao('despesa', descricao, float(valor), data, categoria, efetuado, fixo, usuario_id)
+        salvar_transacao('despesa', descricao, float(valor), data, categoria, efetuado, fixo, usuario_id, chave=chave)
         
         # Recarrega os dados
-        _, df_despesas = ler_transacoes(usuario_id)
-        return df_despesas.to_dict('records') if not df_despesas.empty else []
+        _, df_despesas = ler_transacoes_usuario(usuario_id)
+        return codificar_transacoes(df_despesas)
         
     except Exception as e:
         print(f"❌ Erro ao salvar despesa: {e}")
         return dash.no_update
     
+# CALLBACK: Sugestão de categoria pela descrição
+@app.callback(
+    Output('select_receita', 'value'),
+    Input('txt-receita', 'value'),
+    State('select_receita', 'value'),
+    State('store-user-session', 'data'),
+    prevent_initial_call=True
+)
+def suggest_receita_category(descricao, atual, session_data):
+    """Sugere a categoria da receita a partir da descrição digitada."""
+    return suggest_category('receita', descricao, atual, session_data)
+
+@app.callback(
+    Output('select_despesa', 'value'),
+    Input('txt-despesa', 'value'),
+    State('select_despesa', 'value'),
+    State('store-user-session', 'data'),
+    prevent_initial_call=True
+)
+def suggest_despesa_category(descricao, atual, session_data):
+    """Sugere a categoria da despesa a partir da descrição digitada."""
+    return suggest_category('despesa', descricao, atual, session_data)
+
+def suggest_category(tipo, descricao, atual, session_data):
+    """Função genérica de sugestão; só preenche a categoria se nenhuma estiver escolhida."""
+    usuario_id = usuario_da_sessao(session_data)
+    if not descricao or not usuario_id or atual:
+        return dash.no_update
+    
+    categoria = sugerir_categoria(usuario_id, tipo, descricao)
+    return categoria if categoria in _categorias_do_tipo(tipo) else dash.no_update
+
+def _categorias_do_tipo(tipo):
+    categorias_receita, categorias_despesa = ler_categorias()
+    return categorias_receita if tipo == 'receita' else categorias_despesa
+
+def categoria_sugerida(tipo, descricao, usuario_id):
+    """
+    Categoria para salvar uma transação sem categoria escolhida: a sugerida
+    pelas regras do usuário ou, sem sugestão válida, a primeira do tipo.
+    """
+    validas = _categorias_do_tipo(tipo)
+    categoria = sugerir_categoria(usuario_id, tipo, descricao) if descricao else None
+    if categoria in validas:
+        return categoria
+    return validas[0] if validas else None
+
 # CALLBACK: Gerenciamento de Categorias
 @app.callback(
     [Output("select_receita", "options"),
@@ -469,30 +585,11 @@ def manage_categories(tipo, add_clicks, remove_clicks, nova_categoria, categoria
     """Função genérica para gerenciar categorias."""
     # Adicionar nova categoria
     if add_clicks and nova_categoria:
-        conn = conectar_bd()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT OR IGNORE INTO categorias (nome, tipo) VALUES (?, ?)", 
-                          (nova_categoria.strip(), tipo))
-            conn.commit()
-        except Exception as e:
-            print(f"❌ Erro ao adicionar categoria: {e}")
-        finally:
-            conn.close()
+        adicionar_categoria(nova_categoria, tipo)
     
     # Remover categorias selecionadas
     if remove_clicks and categorias_remover:
-        conn = conectar_bd()
-        cursor = conn.cursor()
-        try:
-            placeholders = ', '.join('?' for _ in categorias_remover)
-            cursor.execute(f"DELETE FROM categorias WHERE nome IN ({placeholders}) AND tipo = ?", 
-                          categorias_remover + [tipo])
-            conn.commit()
-        except Exception as e:
-            print(f"❌ Erro ao remover categorias: {e}")
-        finally:
-            conn.close()
+        remover_categorias(categorias_remover, tipo)
     
     # Atualiza a lista de categorias
     categorias_receita, categorias_despesa = ler_categorias()
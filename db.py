@@ -3,17 +3,45 @@ Módulo responsável pela configuração e gerenciamento do banco de dados SQLit
 """
 
 import sqlite3
+import numpy as np
 import pandas as pd
 import hashlib
+import json
 import secrets
+import threading
+import queue
+import os
+import sys
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
 
 # --- Configuração do Banco de Dados ---
-DB_FILE = "financas.db"
+DB_FILE = os.environ.get("MONEYFLOW_DB", "financas.db")
 
-def conectar_bd():
-    """Cria uma conexão com o banco de dados SQLite."""
-    return sqlite3.connect(DB_FILE)
+# Banco de arquivo com as transações antigas (ANEXADO como "arquivo")
+ARQUIVO_FILE = os.environ.get("MONEYFLOW_DB_ARQUIVO", "financas_arquivo.db")
+
+# Transações mais antigas que este horizonte (em dias) vão para o arquivo
+HORIZONTE_ARQUIVO_DIAS = int(os.environ.get("MONEYFLOW_HORIZONTE_ARQUIVO", 365))
+
+# Tempo máximo (segundos) que uma conexão espera pelo lock de escrita do SQLite
+TIMEOUT_BD = 30
+
+def conectar_bd(com_arquivo=False):
+    """
+    Cria uma conexão com o banco de dados SQLite.
+    
+    Com com_arquivo=True, anexa o banco de arquivo como o esquema "arquivo".
+    """
+    conn = sqlite3.connect(DB_FILE, timeout=TIMEOUT_BD)
+    conn.create_function("assinatura_transacao", 4, calcular_assinatura, deterministic=True)
+    if com_arquivo:
+        conn.execute("ATTACH DATABASE ? AS arquivo", (ARQUIVO_FILE,))
+        _criar_tabelas_arquivo(conn.cursor())
+    return conn
 
 def verificar_e_atualizar_esquema():
     """Verifica e atualiza o esquema do banco de dados se necessário."""
@@ -40,13 +68,99 @@ def verificar_e_atualizar_esquema():
         conn.commit()
         print("Coluna salt adicionada com sucesso!")
     
+    # Verifica se a coluna 'assinatura' (detecção de duplicadas) existe
+    try:
+        cursor.execute("SELECT assinatura FROM transacoes LIMIT 1")
+    except sqlite3.OperationalError:
+        print("Adicionando coluna assinatura à tabela transacoes...")
+        cursor.execute("ALTER TABLE transacoes ADD COLUMN assinatura TEXT")
+        cursor.execute("""
+            UPDATE transacoes SET assinatura = assinatura_transacao(usuario_id, data, valor, descricao)
+            WHERE assinatura IS NULL
+        """)
+        conn.commit()
+        print("Coluna assinatura adicionada com sucesso!")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transacoes_assinatura ON transacoes (usuario_id, assinatura)")
+    conn.commit()
+    
+    # Popula o resumo mensal para bancos criados antes da tabela existir
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM resumo_mensal)")
+    resumo_vazio = not cursor.fetchone()[0]
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM transacoes WHERE usuario_id IS NOT NULL)")
+    if resumo_vazio and cursor.fetchone()[0]:
+        print("Gerando resumo mensal a partir das transações existentes...")
+        _reconstruir_resumo_mensal(cursor)
+        conn.commit()
+        print("Resumo mensal gerado com sucesso!")
+    
     conn.close()
 
+def _criar_tabelas_arquivo(cursor):
+    """Cria a tabela de transações arquivadas no banco anexado, se necessário."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS arquivo.transacoes (
+        id INTEGER PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        descricao TEXT,
+        valor REAL NOT NULL,
+        data DATE NOT NULL,
+        categoria TEXT NOT NULL,
+        efetuado INTEGER,
+        fixo INTEGER,
+        usuario_id INTEGER,
+        assinatura TEXT
+    )
+    """)
+    try:
+        cursor.execute("SELECT assinatura FROM arquivo.transacoes LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE arquivo.transacoes ADD COLUMN assinatura TEXT")
+        cursor.execute("""
+            UPDATE arquivo.transacoes SET assinatura = assinatura_transacao(usuario_id, data, valor, descricao)
+        """)
+        cursor.connection.commit()
+    cursor.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_usuario_data ON transacoes (usuario_id, data)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS arquivo.idx_arquivo_assinatura ON transacoes (usuario_id, assinatura)")
+
+    # Índice de texto completo próprio do arquivo: ao arquivar, as linhas saem
+    # do índice principal (trigger de exclusão) e entram neste
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM arquivo.sqlite_master WHERE name = 'transacoes_fts')")
+    fts_existia = cursor.fetchone()[0]
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS arquivo.transacoes_fts USING fts5(
+        descricao, usuario_id,
+        content='transacoes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS arquivo.transacoes_fts_ai AFTER INSERT ON transacoes BEGIN
+        INSERT INTO transacoes_fts (rowid, descricao, usuario_id) VALUES (new.id, new.descricao, new.usuario_id);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS arquivo.transacoes_fts_ad AFTER DELETE ON transacoes BEGIN
+        INSERT INTO transacoes_fts (transacoes_fts, rowid, descricao, usuario_id) VALUES ('delete', old.id, old.descricao, old.usuario_id);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS arquivo.transacoes_fts_au AFTER UPDATE OF descricao, usuario_id ON transacoes BEGIN
+        INSERT INTO transacoes_fts (transacoes_fts, rowid, descricao, usuario_id) VALUES ('delete', old.id, old.descricao, old.usuario_id);
+        INSERT INTO transacoes_fts (rowid, descricao, usuario_id) VALUES (new.id, new.descricao, new.usuario_id);
+    END
+    """)
+    if not fts_existia:
+        cursor.execute("INSERT INTO arquivo.transacoes_fts (transacoes_fts) VALUES ('rebuild')")
+        cursor.connection.commit()
+
 def inicializar_bd():
     """Cria as tabelas do banco de dados e insere dados iniciais."""
     conn = conectar_bd()
     cursor = conn.cursor()
 
+    # WAL permite leituras concorrentes enquanto uma escrita está em andamento
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     # Tabela unificada para transações financeiras (COM usuario_id)
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS transacoes (
@@ -59,6 +173,7 @@ def inicializar_bd():
         efetuado INTEGER,
         fixo INTEGER,
         usuario_id INTEGER,
+        assinatura TEXT,
         FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
     )
     """)
@@ -85,6 +200,182 @@ def inicializar_bd():
     )
     """)
     
+    # Resumo mensal por usuário e categoria, mantido a cada escrita
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS resumo_mensal (
+        usuario_id INTEGER NOT NULL,
+        mes TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        total_efetuado REAL NOT NULL DEFAULT 0,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (usuario_id, mes, tipo, categoria)
+    )
+    """)
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_data ON transacoes (usuario_id, data)")
+    
+    # Índice de texto completo das descrições (FTS5), sincronizado por triggers
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'transacoes_fts')")
+    fts_existia = cursor.fetchone()[0]
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS transacoes_fts USING fts5(
+        descricao, usuario_id,
+        content='transacoes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """)
+    cursor.executescript("""
+    CREATE TRIGGER IF NOT EXISTS transacoes_fts_ai AFTER INSERT ON transacoes BEGIN
+        INSERT INTO transacoes_fts (rowid, descricao, usuario_id) VALUES (new.id, new.descricao, new.usuario_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS transacoes_fts_ad AFTER DELETE ON transacoes BEGIN
+        INSERT INTO transacoes_fts (transacoes_fts, rowid, descricao, usuario_id) VALUES ('delete', old.id, old.descricao, old.usuario_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS transacoes_fts_au AFTER UPDATE OF descricao, usuario_id ON transacoes BEGIN
+        INSERT INTO transacoes_fts (transacoes_fts, rowid, descricao, usuario_id) VALUES ('delete', old.id, old.descricao, old.usuario_id);
+        INSERT INTO transacoes_fts (rowid, descricao, usuario_id) VALUES (new.id, new.descricao, new.usuario_id);
+    END;
+    """)
+    if not fts_existia:
+        cursor.execute("INSERT INTO transacoes_fts (transacoes_fts) VALUES ('rebuild')")
+    
+    # Orçamentos mensais por categoria de despesa e alertas já disparados
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS orcamentos (
+        usuario_id INTEGER NOT NULL,
+        categoria TEXT NOT NULL,
+        limite REAL NOT NULL,
+        alerta REAL NOT NULL DEFAULT 0.8,
+        PRIMARY KEY (usuario_id, categoria),
+        FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alertas_orcamento (
+        usuario_id INTEGER NOT NULL,
+        mes TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        nivel TEXT NOT NULL,
+        utilizacao REAL NOT NULL,
+        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (usuario_id, mes, categoria, nivel)
+    )
+    """)
+    
+    # Estatísticas robustas por categoria (mediana/MAD) e despesas anômalas
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS estatisticas_categoria (
+        usuario_id INTEGER NOT NULL,
+        categoria TEXT NOT NULL,
+        n INTEGER NOT NULL DEFAULT 0,
+        mediana REAL NOT NULL DEFAULT 0,
+        mad REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (usuario_id, categoria)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS anomalias (
+        transacao_id INTEGER PRIMARY KEY,
+        usuario_id INTEGER NOT NULL,
+        categoria TEXT NOT NULL,
+        valor REAL NOT NULL,
+        escore REAL NOT NULL,
+        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_anomalias_usuario ON anomalias (usuario_id, transacao_id)")
+    
+    # Artefatos do processamento em lote (batch.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS previsoes (
+        usuario_id INTEGER NOT NULL,
+        mes TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        valor REAL NOT NULL,
+        PRIMARY KEY (usuario_id, mes, tipo)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS status_orcamentos (
+        usuario_id INTEGER NOT NULL,
+        mes TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        limite REAL NOT NULL,
+        gasto REAL NOT NULL,
+        utilizacao REAL NOT NULL,
+        status TEXT NOT NULL,
+        PRIMARY KEY (usuario_id, mes, categoria)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS execucoes_lote (
+        execucao TEXT NOT NULL,
+        usuario_id INTEGER NOT NULL,
+        data_conclusao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (execucao, usuario_id)
+    )
+    """)
+    
+    # Regras de categorização automática (manuais e aprendidas do histórico)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS regras_categoria (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usuario_id INTEGER NOT NULL,
+        tipo TEXT NOT NULL,
+        padrao TEXT NOT NULL,
+        regex INTEGER NOT NULL DEFAULT 0,
+        categoria TEXT NOT NULL,
+        aprendida INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (usuario_id, tipo, padrao, regex),
+        FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+    )
+    """)
+    
+    # Data de corte do arquivo: transações anteriores podem estar no arquivo
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS controle_arquivo (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        data_limite DATE NOT NULL
+    )
+    """)
+    
+    # Tabela de versões dos dados (coerência de caches entre processos)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS versoes_dados (
+        escopo TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    
+    # Sessões de login (o navegador guarda apenas o id assinado)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sessoes (
+        id TEXT PRIMARY KEY,
+        usuario_id INTEGER NOT NULL,
+        expira REAL NOT NULL,
+        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS configuracoes (
+        chave TEXT PRIMARY KEY,
+        valor TEXT NOT NULL
+    )
+    """)
+    
+    # Chaves de idempotência dos formulários (um clique repetido não duplica)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS chaves_idempotencia (
+        chave TEXT PRIMARY KEY,
+        usuario_id INTEGER NOT NULL,
+        transacao_id INTEGER,
+        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    
     # Adicionar categorias iniciais apenas uma vez
     cursor.execute("SELECT COUNT(*) FROM categorias")
     if cursor.fetchone()[0] == 0:
@@ -101,6 +392,147 @@ def inicializar_bd():
     # Verifica e atualiza o esquema se necessário
     verificar_e_atualizar_esquema()
 
+# --- Versões dos Dados ---
+
+ESCOPO_GLOBAL = 'global'
+
+def _escopo_usuario(usuario_id):
+    """Retorna a chave de escopo de versão de um usuário."""
+    return f'usuario:{usuario_id}'
+
+def _incrementar_versao(cursor, usuario_id=None):
+    """
+    Incrementa a versão dos dados dentro da transação corrente.
+    
+    Escritas de um usuário incrementam apenas o escopo dele; escritas em dados
+    compartilhados (categorias, usuários) incrementam o escopo global.
+    """
+    escopo = _escopo_usuario(usuario_id) if usuario_id is not None else ESCOPO_GLOBAL
+    cursor.execute("""
+        INSERT INTO versoes_dados (escopo, versao) VALUES (?, 1)
+        ON CONFLICT(escopo) DO UPDATE SET versao = versao + 1
+    """, (escopo,))
+
+def ler_versao(usuario_id=None):
+    """
+    Lê as versões atuais dos dados com uma única consulta.
+    
+    Retorna uma tupla (versao_global, versao_usuario). Deve ser chamada no
+    início da requisição pelos caches em memória para detectar escritas feitas
+    por outros workers.
+    """
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    escopos = (ESCOPO_GLOBAL, _escopo_usuario(usuario_id))
+    cursor.execute("SELECT escopo, versao FROM versoes_dados WHERE escopo IN (?, ?)", escopos)
+    versoes = dict(cursor.fetchall())
+    conn.close()
+    
+    versao_usuario = versoes.get(escopos[1], 0) if usuario_id is not None else 0
+    return versoes.get(ESCOPO_GLOBAL, 0), versao_usuario
+
+def _ler_versoes_usuarios(cursor, usuarios):
+    """Versões atuais dos dados de vários usuários ({usuario_id: versao}), em uma consulta."""
+    escopos = {_escopo_usuario(usuario_id): usuario_id for usuario_id in usuarios}
+    cursor.execute("SELECT escopo, versao FROM versoes_dados WHERE escopo IN (SELECT value FROM json_each(?))",
+                   (json.dumps(list(escopos)),))
+    versoes = dict(cursor.fetchall())
+    return {usuario_id: versoes.get(escopo, 0) for escopo, usuario_id in escopos.items()}
+
+class CacheVersionado:
+    """
+    Cache em memória do processo invalidado pela versão dos dados no banco.
+    
+    Cada entrada guarda a versão com que foi calculada; se a versão lida no
+    início da requisição for diferente, o valor é recarregado.
+    """
+
+    def __init__(self):
+        self._entradas = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave, versao, carregar):
+        """Retorna o valor da chave para a versão informada, recarregando se necessário."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+        if entrada is not None and entrada[0] == versao:
+            return entrada[1]
+        
+        valor = carregar()
+        with self._lock:
+            self._entradas[chave] = (versao, valor)
+        return valor
+
+    def limpar(self):
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            self._entradas.clear()
+
+_cache_categorias = CacheVersionado()
+
+class CacheTTL:
+    """
+    Cache LRU em memória do processo com validade por entrada.
+    
+    Dentro da validade, obter() é apenas uma consulta ao dicionário. Vencida
+    a validade, se uma função de versão foi informada ela é consultada: com a
+    versão inalterada a entrada só é renovada; caso contrário é recarregada.
+    """
+
+    def __init__(self, maximo=10000, validade=30):
+        self.maximo = maximo
+        self.validade = validade
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave, carregar, versao=None, guardar_vazio=True):
+        """
+        Retorna o valor da chave, recarregando-o quando vencido ou desatualizado.
+        
+        Com guardar_vazio=False um resultado None não fica no cache: o que não
+        existia pode ter sido criado por outro processo logo em seguida.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                if agora < entrada[2]:
+                    return entrada[0]
+        
+        versao_atual = versao() if versao is not None else None
+        if entrada is not None and versao is not None and entrada[1] == versao_atual:
+            valor = entrada[0]
+        else:
+            valor = carregar()
+        if valor is None and not guardar_vazio:
+            return None
+        
+        with self._lock:
+            self._entradas[chave] = (valor, versao_atual, agora + self.validade)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def remover(self, chave):
+        """Remove uma entrada (após uma escrita feita por este processo)."""
+        with self._lock:
+            self._entradas.pop(chave, None)
+
+    def limpar(self):
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            self._entradas.clear()
+
+# Usuários e credenciais: validade curta e conferência da versão global,
+# que muda a cada escrita em usuarios
+_cache_usuarios = CacheTTL(maximo=10000, validade=30)
+
+def _versao_global():
+    """Versão global dos dados (para o cache de usuários)."""
+    return ler_versao()[0]
+
 # --- Funções de Hash ---
 
 def hash_password(password):
@@ -116,37 +548,64 @@ def verificar_password(password, stored_hash, salt):
 
 # --- Funções de Transações ---
 
-def ler_transacoes(usuario_id=None):
-    """Lê transações do banco de dados filtrando por usuário."""
-    conn = conectar_bd()
+def normalizar_descricao(texto):
+    """Descrição em minúsculas, sem acentos e com espaços simples, para comparações."""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ' '.join(texto.encode('ascii', 'ignore').decode('ascii').lower().split())
+
+def calcular_assinatura(usuario_id, data, valor, descricao):
+    """
+    Assinatura de uma transação para detectar duplicadas: hash do usuário,
+    dia, valor em centavos e descrição normalizada.
+    """
+    chave = f"{usuario_id}|{str(data)[:10]}|{round(float(valor) * 100)}|{normalizar_descricao(descricao)}"
+    return hashlib.sha1(chave.encode('utf-8')).hexdigest()
+
+def ler_transacoes(usuario_id=None, data_inicio=None, data_fim=None):
+    """
+    Lê transações do banco de dados filtrando por usuário e, opcionalmente,
+    por período (datas 'AAAA-MM-DD', inclusivas).
     
-    # Query base para transações
-    if usuario_id:
-        query_receitas = """
-        SELECT valor as Valor, efetuado as Efetuado, fixo as Fixo, 
-               data as Data, categoria as Categoria, descricao as Descrição 
-        FROM transacoes 
-        WHERE tipo='receita' AND usuario_id = ?
-        """
-        query_despesas = """
-        SELECT valor as Valor, efetuado as Efetuado, fixo as Fixo, 
-               data as Data, categoria as Categoria, descricao as Descrição 
-        FROM transacoes 
-        WHERE tipo='despesa' AND usuario_id = ?
-        """
-        
-        df_receitas = pd.read_sql_query(query_receitas, conn, params=(usuario_id,))
-        df_despesas = pd.read_sql_query(query_despesas, conn, params=(usuario_id,))
-    else:
+    O banco de arquivo só é consultado quando o período começa antes da data
+    de corte do arquivo (ou quando nenhum início é informado).
+    """
+    colunas = ['Valor', 'Efetuado', 'Fixo', 'Data', 'Categoria', 'Descrição', 'id']
+    if not usuario_id:
         # Se não tem usuario_id, retorna DataFrame vazio para novo usuário
-        df_receitas = pd.DataFrame(columns=['Valor', 'Efetuado', 'Fixo', 'Data', 'Categoria', 'Descrição'])
-        df_despesas = pd.DataFrame(columns=['Valor', 'Efetuado', 'Fixo', 'Data', 'Categoria', 'Descrição'])
+        return pd.DataFrame(columns=colunas), pd.DataFrame(columns=colunas)
+    
+    data_limite = ler_data_limite_arquivo()
+    data_inicio = str(data_inicio)[:10] if data_inicio else None
+    data_fim = str(data_fim)[:10] if data_fim else None
+    usa_arquivo = data_limite is not None and (data_inicio is None or data_inicio < data_limite)
+    
+    filtro = "tipo = ? AND usuario_id = ?"
+    params = [usuario_id]
+    if data_inicio:
+        filtro += " AND data >= ?"
+        params.append(data_inicio)
+    if data_fim:
+        filtro += " AND data <= ?"
+        params.append(data_fim)
+    
+    conn = conectar_bd(com_arquivo=usa_arquivo)
+    fonte = _fonte_transacoes(conn.cursor(), filtro)
+    query = f"""
+    SELECT valor as Valor, efetuado as Efetuado, fixo as Fixo, 
+           data as Data, categoria as Categoria, descricao as Descrição, id
+    FROM {fonte}
+    ORDER BY data, id
+    """
+    
+    repeticoes = 2 if usa_arquivo else 1
+    df_receitas = pd.read_sql_query(query, conn, params=['receita', *params] * repeticoes)
+    df_despesas = pd.read_sql_query(query, conn, params=['despesa', *params] * repeticoes)
     
     conn.close()
     return df_receitas, df_despesas
 
-def ler_categorias():
-    """Lê categorias do banco de dados."""
+def _carregar_categorias():
+    """Lê categorias diretamente do banco de dados."""
     conn = conectar_bd()
     df_cat = pd.read_sql_query("SELECT nome, tipo FROM categorias", conn)
     conn.close()
@@ -155,20 +614,902 @@ def ler_categorias():
     cat_despesa = df_cat[df_cat['tipo'] == 'despesa']['nome'].tolist()
     return cat_receita, cat_despesa
 
-def salvar_transacao(tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id=None):
-    """Salva uma transação no banco de dados."""
-    if usuario_id is None:
-        raise ValueError("usuário_id é obrigatório para salvar transações")
+def _expressao_busca(termo):
+    """
+    Converte o texto digitado em uma expressão FTS5 segura: cada palavra vira
+    um prefixo entre aspas e todas precisam aparecer na descrição.
+    """
+    palavras = [p.replace('"', '""') for p in termo.split()]
+    return ' AND '.join(f'"{p}"*' for p in palavras)
+
+def buscar_transacoes(usuario_id, termo, pagina=0, tamanho=20):
+    """
+    Busca transações do usuário pela descrição usando o índice FTS5.
     
+    Retorna (DataFrame da página, total de resultados), ordenados por
+    relevância (bm25). Com o arquivo, os índices das transações recentes e
+    das arquivadas são consultados juntos.
+    """
+    colunas = ['id', 'Tipo', 'Data', 'Categoria', 'Valor', 'Efetuado', 'Descrição']
+    expressao = _expressao_busca(termo or '')
+    if not usuario_id or not expressao:
+        return pd.DataFrame(columns=colunas), 0
+
+    # Filtra pelo usuário dentro do próprio índice (coluna usuario_id indexada)
+    consulta = f'{{usuario_id}}: "{int(usuario_id)}" AND {{descricao}}: ({expressao})'
+
+    conn = conectar_bd(com_arquivo=ler_data_limite_arquivo() is not None)
+    cursor = conn.cursor()
+    esquemas = ['main', 'arquivo'] if _arquivo_anexado(cursor) else ['main']
+    resultados = ' UNION ALL '.join(f"""
+        SELECT t.id, t.tipo as Tipo, t.data as Data, t.categoria as Categoria,
+               t.valor as Valor, t.efetuado as Efetuado, t.descricao as "Descrição", f.rank
+        FROM {esquema}.transacoes_fts(?) f
+        JOIN {esquema}.transacoes t ON t.id = f.rowid
+    """ for esquema in esquemas)
+    df = pd.read_sql_query(f"""
+        SELECT id, Tipo, Data, Categoria, Valor, Efetuado, "Descrição" FROM ({resultados})
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """, conn, params=(*[consulta] * len(esquemas), tamanho, pagina * tamanho))
+    total = 0
+    for esquema in esquemas:
+        cursor.execute(f"SELECT COUNT(*) FROM {esquema}.transacoes_fts(?)", (consulta,))
+        total += cursor.fetchone()[0]
+    conn.close()
+
+    return df, total
+
+def ler_categorias():
+    """Lê categorias, reaproveitando o cache enquanto a versão global não mudar."""
+    versao_global, _ = ler_versao()
+    cat_receita, cat_despesa = _cache_categorias.obter('categorias', versao_global, _carregar_categorias)
+    return list(cat_receita), list(cat_despesa)
+
+def adicionar_categoria(nome, tipo):
+    """Adiciona uma categoria (ignora se já existir)."""
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("INSERT OR IGNORE INTO categorias (nome, tipo) VALUES (?, ?)", (nome.strip(), tipo))
+        if cursor.rowcount:
+            _incrementar_versao(cursor)
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Erro ao adicionar categoria: {e}")
+    finally:
+        conn.close()
+
+def remover_categorias(nomes, tipo):
+    """Remove as categorias informadas de um tipo."""
     conn = conectar_bd()
     cursor = conn.cursor()
+    try:
+        placeholders = ', '.join('?' for _ in nomes)
+        cursor.execute(f"DELETE FROM categorias WHERE nome IN ({placeholders}) AND tipo = ?", 
+                      list(nomes) + [tipo])
+        if cursor.rowcount:
+            _incrementar_versao(cursor)
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Erro ao remover categorias: {e}")
+    finally:
+        conn.close()
+
+# --- Arquivo de Transações Antigas ---
+
+_COLUNAS_TRANSACAO = "id, tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id, assinatura"
+
+def _arquivo_anexado(cursor):
+    """Indica se o banco de arquivo está anexado à conexão do cursor."""
+    cursor.execute("PRAGMA database_list")
+    return any(nome == 'arquivo' for _, nome, _ in cursor.fetchall())
+
+def _fonte_transacoes(cursor, filtro):
+    """
+    Retorna a expressão FROM das transações que satisfazem o filtro SQL,
+    incluindo as arquivadas quando o arquivo está anexado.
+    
+    Com o arquivo, os parâmetros do filtro devem ser passados duas vezes.
+    """
+    if not _arquivo_anexado(cursor):
+        return f"(SELECT {_COLUNAS_TRANSACAO} FROM main.transacoes WHERE {filtro})"
+    return f"""(
+        SELECT {_COLUNAS_TRANSACAO} FROM main.transacoes WHERE {filtro}
+        UNION ALL
+        SELECT {_COLUNAS_TRANSACAO} FROM arquivo.transacoes WHERE {filtro}
+    )"""
+
+def ler_data_limite_arquivo():
+    """Retorna a data de corte do arquivo ('AAAA-MM-DD'), ou None se nada foi arquivado."""
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    cursor.execute("SELECT data_limite FROM controle_arquivo WHERE id = 1")
+    linha = cursor.fetchone()
+    conn.close()
+    return linha[0] if linha else None
+
+def arquivar_transacoes(horizonte_dias=None):
+    """
+    Move as transações mais antigas que o horizonte para o banco de arquivo.
+    
+    O resumo mensal não é alterado, então os totais por mês continuam
+    disponíveis sem consultar o arquivo. Retorna a quantidade movida.
+    """
+    horizonte_dias = HORIZONTE_ARQUIVO_DIAS if horizonte_dias is None else horizonte_dias
+    corte = (datetime.now().date() - pd.Timedelta(days=horizonte_dias)).isoformat()
+    
+    conn = conectar_bd(com_arquivo=True)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT usuario_id FROM main.transacoes WHERE data < ?", (corte,))
+        usuarios = [linha[0] for linha in cursor.fetchall()]
+        
+        # INSERT OR IGNORE torna a operação segura para ser repetida
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO arquivo.transacoes ({_COLUNAS_TRANSACAO})
+            SELECT {_COLUNAS_TRANSACAO} FROM main.transacoes WHERE data < ?
+        """, (corte,))
+        cursor.execute("DELETE FROM main.transacoes WHERE data < ?", (corte,))
+        movidas = cursor.rowcount
+        
+        cursor.execute("""
+            INSERT INTO controle_arquivo (id, data_limite) VALUES (1, ?)
+            ON CONFLICT(id) DO UPDATE SET data_limite = MAX(data_limite, excluded.data_limite)
+        """, (corte,))
+        for usuario_id in usuarios:
+            _incrementar_versao(cursor, usuario_id)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    return movidas
+
+# --- Resumo Mensal ---
+
+def _mes_da_data(data):
+    """Retorna o mês ('AAAA-MM') de uma data em texto, date ou datetime."""
+    return str(data)[:7]
+
+def _atualizar_resumo_mensal(cursor, linhas, sinal=1):
+    """
+    Aplica ao resumo mensal o efeito das linhas inseridas (sinal=1) ou
+    removidas (sinal=-1), dentro da transação corrente.
+    
+    As linhas seguem o formato de _inserir_transacoes.
+    """
+    deltas = {}
+    for tipo, _, valor, data, categoria, efetuado, _, usuario_id in linhas:
+        chave = (usuario_id, _mes_da_data(data), tipo, categoria)
+        total, total_efetuado, quantidade = deltas.get(chave, (0.0, 0.0, 0))
+        valor = float(valor) * sinal
+        deltas[chave] = (total + valor, total_efetuado + (valor if efetuado else 0.0), quantidade + sinal)
+    
+    cursor.executemany("""
+        INSERT INTO resumo_mensal (usuario_id, mes, tipo, categoria, total, total_efetuado, quantidade)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(usuario_id, mes, tipo, categoria) DO UPDATE SET
+            total = total + excluded.total,
+            total_efetuado = total_efetuado + excluded.total_efetuado,
+            quantidade = quantidade + excluded.quantidade
+    """, [chave + delta for chave, delta in deltas.items()])
+    
+    if sinal < 0:
+        cursor.execute("DELETE FROM resumo_mensal WHERE quantidade <= 0")
+
+def _reconstruir_resumo_mensal(cursor, usuario_id=None):
+    """Recalcula o resumo mensal a partir das transações (de um usuário ou de todos)."""
+    filtro = "usuario_id = ?" if usuario_id is not None else "usuario_id IS NOT NULL"
+    params = (usuario_id,) if usuario_id is not None else ()
+    
+    cursor.execute(f"DELETE FROM resumo_mensal WHERE {filtro}", params)
+    cursor.execute(f"""
+        INSERT INTO resumo_mensal (usuario_id, mes, tipo, categoria, total, total_efetuado, quantidade)
+        SELECT usuario_id, substr(data, 1, 7), tipo, categoria,
+               SUM(valor), SUM(CASE WHEN efetuado THEN valor ELSE 0 END), COUNT(*)
+        FROM {_fonte_transacoes(cursor, filtro)}
+        GROUP BY usuario_id, substr(data, 1, 7), tipo, categoria
+    """, params * (2 if _arquivo_anexado(cursor) else 1))
+
+def reconstruir_resumo_mensal(usuario_id=None):
+    """Recalcula e grava o resumo mensal (de um usuário ou de todos)."""
+    conn = conectar_bd(com_arquivo=True)
+    cursor = conn.cursor()
+    _reconstruir_resumo_mensal(cursor, usuario_id)
+    if usuario_id is not None:
+        _incrementar_versao(cursor, usuario_id)
+    conn.commit()
+    conn.close()
+
+def ler_resumo_mensal(usuario_id, mes_inicio=None, mes_fim=None):
+    """
+    Lê o resumo mensal de um usuário, opcionalmente limitado a um intervalo
+    de meses ('AAAA-MM', inclusivo).
+    """
+    query = """
+        SELECT mes, tipo, categoria, total, total_efetuado, quantidade
+        FROM resumo_mensal
+        WHERE usuario_id = ?
+    """
+    params = [usuario_id]
+    if mes_inicio:
+        query += " AND mes >= ?"
+        params.append(mes_inicio)
+    if mes_fim:
+        query += " AND mes <= ?"
+        params.append(mes_fim)
+    
+    conn = conectar_bd()
+    df = pd.read_sql_query(query + " ORDER BY mes", conn, params=params)
+    conn.close()
+    return df
+
+def ler_totais_categorias(usuario_id, tipo):
+    """
+    Total de cada categoria de um tipo em todo o histórico do usuário
+    (inclusive o arquivado), somado no resumo mensal.
+    """
+    conn = conectar_bd()
+    df = pd.read_sql_query("""
+        SELECT categoria AS Categoria, SUM(total) AS Valor
+        FROM resumo_mensal
+        WHERE usuario_id = ? AND tipo = ?
+        GROUP BY categoria
+        ORDER BY categoria
+    """, conn, params=(usuario_id, tipo))
+    conn.close()
+    return df
+
+# --- Extrato Unificado ---
+
+def _saldo_inicial_mes(cursor, usuario_id, mes):
+    """Saldo (receitas - despesas) acumulado antes do mês, lido do resumo mensal."""
     cursor.execute("""
-        INSERT INTO transacoes (tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id))
+        SELECT COALESCE(SUM(CASE tipo WHEN 'receita' THEN total ELSE -total END), 0)
+        FROM resumo_mensal WHERE usuario_id = ? AND mes < ?
+    """, (usuario_id, mes))
+    return cursor.fetchone()[0]
+
+def ler_extrato(usuario_id, pagina=0, tamanho=100):
+    """
+    Lê uma página do extrato com receitas e despesas juntas, da mais recente
+    para a mais antiga, com o saldo após cada lançamento.
+
+    O saldo parte do saldo inicial do mês do lançamento mais antigo da
+    página (resumo mensal) e é acumulado em SQL com uma função de janela
+    apenas desde o início desse mês, sem percorrer o histórico anterior.
+    Retorna (DataFrame, total de lançamentos).
+    """
+    conn = conectar_bd(com_arquivo=ler_data_limite_arquivo() is not None)
+    cursor = conn.cursor()
+    repeticoes = 2 if _arquivo_anexado(cursor) else 1
+
+    cursor.execute("SELECT COALESCE(SUM(quantidade), 0) FROM resumo_mensal WHERE usuario_id = ?", (usuario_id,))
+    total = cursor.fetchone()[0]
+
+    # Limites da página: lançamentos mais recente e mais antigo
+    cursor.execute(f"""
+        SELECT data, id FROM {_fonte_transacoes(cursor, "usuario_id = ?")}
+        ORDER BY data DESC, id DESC LIMIT ? OFFSET ?
+    """, [usuario_id] * repeticoes + [tamanho, pagina * tamanho])
+    limites = cursor.fetchall()
+    if not limites:
+        conn.close()
+        return pd.DataFrame(columns=['id', 'Data', 'Tipo', 'Categoria', 'Descrição', 'Valor', 'Efetuado', 'Saldo']), total
+    (data_fim, id_fim), (data_inicio, id_inicio) = limites[0], limites[-1]
+
+    mes = _mes_da_data(data_inicio)
+    saldo_inicial = _saldo_inicial_mes(cursor, usuario_id, mes)
+    fonte = _fonte_transacoes(cursor, "usuario_id = ? AND data >= ? AND data <= ?")
+    df = pd.read_sql_query(f"""
+        SELECT id, Data, Tipo, Categoria, Descrição, Valor, Efetuado, Saldo FROM (
+            SELECT id, data AS Data, tipo AS Tipo, categoria AS Categoria, descricao AS Descrição,
+                   valor AS Valor, efetuado AS Efetuado,
+                   ? + SUM(CASE tipo WHEN 'receita' THEN valor ELSE -valor END)
+                       OVER (ORDER BY data, id ROWS UNBOUNDED PRECEDING) AS Saldo
+            FROM {fonte}
+        )
+        WHERE (Data, id) >= (?, ?) AND (Data, id) <= (?, ?)
+        ORDER BY Data DESC, id DESC
+    """, conn, params=[saldo_inicial, *[usuario_id, f"{mes}-01", str(data_fim)] * repeticoes,
+                       data_inicio, id_inicio, data_fim, id_fim])
+    conn.close()
+    return df, total
+
+# --- Orçamentos ---
+
+def _chaves_orcamento(linhas):
+    """Chaves (usuário, mês, categoria) de orçamento afetadas pelas linhas de despesa."""
+    return {(linha[7], _mes_da_data(linha[3]), linha[4]) for linha in linhas if linha[0] == 'despesa'}
+
+def _verificar_alertas_orcamento(cursor, linhas):
+    """
+    Registra os alertas de orçamento cruzados pelas despesas inseridas.
+    
+    Usa o resumo mensal já atualizado, então o custo depende apenas das
+    categorias afetadas, não do histórico. Cada nível ('alerta' ao atingir o
+    limiar, 'estourado' ao passar do limite) é registrado uma vez por mês.
+    """
+    _registrar_alertas_orcamento(cursor, _chaves_orcamento(linhas))
+
+def _registrar_alertas_orcamento(cursor, chaves):
+    """Registra os alertas que o resumo mensal atual dispara nas chaves (usuário, mês, categoria)."""
+    if not chaves:
+        return
+    
+    cursor.executemany("""
+        INSERT OR IGNORE INTO alertas_orcamento (usuario_id, mes, categoria, nivel, utilizacao)
+        SELECT o.usuario_id, r.mes, o.categoria,
+               CASE WHEN r.total >= o.limite THEN 'estourado' ELSE 'alerta' END,
+               r.total / o.limite
+        FROM orcamentos o
+        JOIN resumo_mensal r
+          ON r.usuario_id = o.usuario_id AND r.categoria = o.categoria AND r.tipo = 'despesa'
+        WHERE o.usuario_id = ? AND r.mes = ? AND o.categoria = ?
+          AND o.limite > 0 AND r.total >= o.limite * o.alerta
+    """, list(chaves))
+
+def _remover_alertas_invalidos(cursor, chaves):
+    """
+    Remove das chaves (usuário, mês, categoria) os alertas cujo nível o
+    resumo mensal atual não atinge mais (gasto reduzido ou orçamento
+    alterado/removido).
+    """
+    cursor.executemany("""
+        DELETE FROM alertas_orcamento
+        WHERE usuario_id = ? AND mes = ? AND categoria = ?
+          AND NOT EXISTS (
+            SELECT 1 FROM orcamentos o
+            JOIN resumo_mensal r
+              ON r.usuario_id = o.usuario_id AND r.categoria = o.categoria AND r.tipo = 'despesa'
+            WHERE o.usuario_id = alertas_orcamento.usuario_id AND o.categoria = alertas_orcamento.categoria
+              AND r.mes = alertas_orcamento.mes AND o.limite > 0
+              AND r.total >= o.limite * CASE alertas_orcamento.nivel WHEN 'estourado' THEN 1 ELSE o.alerta END
+          )
+    """, list(chaves))
+
+def definir_orcamento(usuario_id, categoria, limite, alerta=0.8):
+    """
+    Define o orçamento mensal de uma categoria de despesa do usuário.
+    
+    Um limite vazio ou zero remove o orçamento. Os alertas do mês atual são
+    reavaliados com o novo limite.
+    """
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    if limite:
+        cursor.execute("""
+            INSERT INTO orcamentos (usuario_id, categoria, limite, alerta) VALUES (?, ?, ?, ?)
+            ON CONFLICT(usuario_id, categoria) DO UPDATE SET limite = excluded.limite, alerta = excluded.alerta
+        """, (usuario_id, categoria, float(limite), alerta))
+    else:
+        cursor.execute("DELETE FROM orcamentos WHERE usuario_id = ? AND categoria = ?", (usuario_id, categoria))
+    chaves = [(usuario_id, _mes_da_data(datetime.now().date()), categoria)]
+    _remover_alertas_invalidos(cursor, chaves)
+    _registrar_alertas_orcamento(cursor, chaves)
+    _incrementar_versao(cursor, usuario_id)
     conn.commit()
     conn.close()
 
+def _classificar_orcamentos(df):
+    """Calcula utilização e status (ok/alerta/estourado) de forma vetorizada."""
+    df['utilizacao'] = np.where(df['limite'] > 0, df['gasto'] / df['limite'], 0.0)
+    df['status'] = np.select(
+        [df['utilizacao'] >= 1, df['utilizacao'] >= df['alerta']],
+        ['estourado', 'alerta'],
+        default='ok'
+    )
+    return df
+
+def ler_utilizacao_orcamentos(usuario_id, mes=None):
+    """
+    Retorna os orçamentos do usuário com o gasto do mês ('AAAA-MM', padrão:
+    mês atual), a utilização e o status de cada categoria.
+    """
+    mes = mes or _mes_da_data(datetime.now().date())
+    conn = conectar_bd()
+    df = pd.read_sql_query("""
+        SELECT o.categoria, o.limite, o.alerta, COALESCE(r.total, 0) AS gasto
+        FROM orcamentos o
+        LEFT JOIN resumo_mensal r
+          ON r.usuario_id = o.usuario_id AND r.categoria = o.categoria
+         AND r.tipo = 'despesa' AND r.mes = ?
+        WHERE o.usuario_id = ?
+        ORDER BY o.categoria
+    """, conn, params=(mes, usuario_id))
+    conn.close()
+    return _classificar_orcamentos(df)
+
+def _avaliar_orcamentos(conn, mes, usuarios=None):
+    """Avaliação dos orçamentos na conexão informada (enxerga a transação aberta dela)."""
+    filtro, params = "", [mes]
+    if usuarios is not None:
+        filtro = "WHERE o.usuario_id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps([int(u) for u in usuarios]))
+    df = pd.read_sql_query(f"""
+        SELECT o.usuario_id, o.categoria, o.limite, o.alerta, COALESCE(r.total, 0) AS gasto
+        FROM orcamentos o
+        LEFT JOIN resumo_mensal r
+          ON r.usuario_id = o.usuario_id AND r.categoria = o.categoria
+         AND r.tipo = 'despesa' AND r.mes = ?
+        {filtro}
+    """, conn, params=params)
+    df['mes'] = mes
+    return _classificar_orcamentos(df)
+
+def avaliar_orcamentos(mes=None, usuarios=None):
+    """
+    Avalia de uma só vez os orçamentos de todos os usuários (ou dos
+    informados) em um mês (fechamento mensal): uma consulta e um cálculo
+    vetorizado.
+    """
+    mes = mes or _mes_da_data(datetime.now().date())
+    conn = conectar_bd()
+    df = _avaliar_orcamentos(conn, mes, usuarios)
+    conn.close()
+    return df
+
+def ler_alertas_orcamento(usuario_id, mes=None):
+    """Lista os alertas de orçamento disparados para o usuário no mês, do mais recente ao mais antigo."""
+    mes = mes or _mes_da_data(datetime.now().date())
+    conn = conectar_bd()
+    df = pd.read_sql_query("""
+        SELECT categoria, nivel, utilizacao, data_criacao
+        FROM alertas_orcamento
+        WHERE usuario_id = ? AND mes = ?
+        ORDER BY data_criacao DESC
+    """, conn, params=(usuario_id, mes))
+    conn.close()
+    return df
+
+# --- Anomalias de Despesas ---
+
+# Escore robusto acima do qual uma despesa é marcada como anômala
+LIMIAR_ANOMALIA = 3.5
+
+# Mínimo de despesas na categoria antes de começar a marcar anomalias
+MIN_AMOSTRAS_ANOMALIA = 8
+
+# Passo relativo da atualização incremental da mediana e do MAD
+TAXA_ESTATISTICAS = 0.1
+
+# Últimas despesas da categoria usadas na mediana e no MAD exatos
+JANELA_ANOMALIA = 30
+
+def escore_robusto(valor, mediana, mad):
+    """
+    Escore robusto (unilateral) de um valor: quantos desvios, estimados pelo
+    MAD, ele está acima da mediana. Funciona com escalares e arrays NumPy.
+    """
+    escala = np.maximum(1.4826 * mad, np.maximum(np.abs(mediana) * 0.1, 0.01))
+    return (valor - mediana) / escala
+
+def _atualizar_estatisticas(n, mediana, mad, valor):
+    """
+    Atualiza mediana e MAD com uma nova observação em O(1).
+    
+    Nas primeiras observações usa médias simples; depois, uma aproximação
+    estocástica que move cada estimativa um passo na direção do novo valor.
+    A reconstrução em lote (anomalias.py) recalcula os valores exatos.
+    """
+    n += 1
+    if n <= MIN_AMOSTRAS_ANOMALIA:
+        mediana += (valor - mediana) / n
+        mad += (abs(valor - mediana) - mad) / n
+    else:
+        passo = TAXA_ESTATISTICAS * max(mad, abs(mediana) * 0.01, 0.01)
+        mediana += passo * np.sign(valor - mediana)
+        mad += passo * np.sign(abs(valor - mediana) - mad)
+    return n, mediana, max(mad, 0.0)
+
+def _verificar_anomalias(cursor, linhas, ids):
+    """
+    Marca as despesas inseridas que fogem do padrão da categoria e atualiza as
+    estatísticas guardadas, com uma leitura por chave (usuário, categoria).
+    """
+    estatisticas = {}
+    anomalias = []
+    for linha, transacao_id in zip(linhas, ids):
+        tipo, _, valor, _, categoria, _, _, usuario_id = linha
+        if tipo != 'despesa':
+            continue
+        
+        chave = (usuario_id, categoria)
+        if chave not in estatisticas:
+            cursor.execute("""
+                SELECT n, mediana, mad FROM estatisticas_categoria WHERE usuario_id = ? AND categoria = ?
+            """, chave)
+            estatisticas[chave] = cursor.fetchone() or (0, 0.0, 0.0)
+        n, mediana, mad = estatisticas[chave]
+        
+        valor = float(valor)
+        escore = float(escore_robusto(valor, mediana, mad))
+        if n >= MIN_AMOSTRAS_ANOMALIA and escore > LIMIAR_ANOMALIA:
+            anomalias.append((transacao_id, usuario_id, categoria, valor, escore))
+        estatisticas[chave] = _atualizar_estatisticas(n, mediana, mad, valor)
+    
+    cursor.executemany("""
+        INSERT OR REPLACE INTO anomalias (transacao_id, usuario_id, categoria, valor, escore) VALUES (?, ?, ?, ?, ?)
+    """, anomalias)
+    cursor.executemany("""
+        INSERT OR REPLACE INTO estatisticas_categoria (usuario_id, categoria, n, mediana, mad) VALUES (?, ?, ?, ?, ?)
+    """, [chave + tuple(valores) for chave, valores in estatisticas.items()])
+
+def _recalcular_estatisticas(cursor, chaves):
+    """
+    Recalcula n, mediana e MAD das chaves (usuário, categoria) a partir das
+    últimas JANELA_ANOMALIA despesas de cada uma, como a reconstrução em lote.
+    Usado nas edições, em que um valor sai da categoria e a atualização
+    incremental não tem como desfazê-lo.
+    """
+    repeticoes = 2 if _arquivo_anexado(cursor) else 1
+    fonte = _fonte_transacoes(cursor, "usuario_id = ? AND categoria = ? AND tipo = 'despesa'")
+    for chave in chaves:
+        cursor.execute(f"SELECT COUNT(*) FROM {fonte}", chave * repeticoes)
+        n = cursor.fetchone()[0]
+        if not n:
+            cursor.execute("DELETE FROM estatisticas_categoria WHERE usuario_id = ? AND categoria = ?", chave)
+            continue
+        cursor.execute(f"SELECT valor FROM {fonte} ORDER BY data DESC, id DESC LIMIT ?",
+                       (*chave * repeticoes, JANELA_ANOMALIA))
+        valores = np.array([linha[0] for linha in cursor.fetchall()], dtype=float)
+        mediana = float(np.median(valores))
+        mad = float(np.median(np.abs(valores - mediana)))
+        cursor.execute("""
+            INSERT OR REPLACE INTO estatisticas_categoria (usuario_id, categoria, n, mediana, mad) VALUES (?, ?, ?, ?, ?)
+        """, (*chave, n, mediana, mad))
+
+def ler_anomalias(usuario_id, limite=10):
+    """Lista as despesas anômalas mais recentes do usuário (inclusive as arquivadas)."""
+    conn = conectar_bd(com_arquivo=ler_data_limite_arquivo() is not None)
+    cursor = conn.cursor()
+    repeticoes = 2 if _arquivo_anexado(cursor) else 1
+    df = pd.read_sql_query(f"""
+        SELECT t.data as Data, a.categoria as Categoria, t.descricao as Descrição,
+               a.valor as Valor, a.escore as Escore, e.mediana as Mediana
+        FROM anomalias a
+        JOIN {_fonte_transacoes(cursor, "usuario_id = ?")} t ON t.id = a.transacao_id
+        LEFT JOIN estatisticas_categoria e ON e.usuario_id = a.usuario_id AND e.categoria = a.categoria
+        WHERE a.usuario_id = ?
+        ORDER BY t.data DESC, a.transacao_id DESC
+        LIMIT ?
+    """, conn, params=(*[usuario_id] * repeticoes, usuario_id, limite))
+    conn.close()
+    return df
+
+# Tempo que uma chave de idempotência continua bloqueando repetições
+VALIDADE_CHAVE_HORAS = 24
+
+def _inserir_transacoes(cursor, linhas, chaves=None):
+    """
+    Insere transações dentro da transação corrente do cursor.
+    
+    Cada linha é uma tupla (tipo, descricao, valor, data, categoria, efetuado,
+    fixo, usuario_id). Retorna a lista de ids gerados, na mesma ordem.
+    
+    chaves, se informada, traz a chave de idempotência de cada linha (ou
+    None). A chave é registrada na mesma transação da inserção: uma linha
+    cuja chave já existe não é gravada e recebe o id da primeira gravação.
+    """
+    chaves = chaves or [None] * len(linhas)
+    if any(chave is not None for chave in chaves):
+        cursor.execute("DELETE FROM chaves_idempotencia WHERE data_criacao < datetime('now', ?)",
+                       (f'-{VALIDADE_CHAVE_HORAS} hours',))
+    
+    ids, inseridas, ids_inseridas = [], [], []
+    for linha, chave in zip(linhas, chaves):
+        tipo, descricao, valor, data, _, _, _, usuario_id = linha
+        if chave is not None:
+            cursor.execute("INSERT OR IGNORE INTO chaves_idempotencia (chave, usuario_id) VALUES (?, ?)",
+                           (chave, usuario_id))
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT transacao_id FROM chaves_idempotencia WHERE chave = ?", (chave,))
+                ids.append(cursor.fetchone()[0])
+                continue
+        cursor.execute("""
+            INSERT INTO transacoes (tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id, assinatura) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (*linha, calcular_assinatura(usuario_id, data, valor, descricao)))
+        transacao_id = cursor.lastrowid
+        if chave is not None:
+            cursor.execute("UPDATE chaves_idempotencia SET transacao_id = ? WHERE chave = ?", (transacao_id, chave))
+        ids.append(transacao_id)
+        inseridas.append(linha)
+        ids_inseridas.append(transacao_id)
+    
+    if inseridas:
+        _atualizar_resumo_mensal(cursor, inseridas)
+        _verificar_alertas_orcamento(cursor, inseridas)
+        _verificar_anomalias(cursor, inseridas, ids_inseridas)
+        for usuario_id in {linha[7] for linha in inseridas}:
+            _incrementar_versao(cursor, usuario_id)
+    return ids
+
+def salvar_transacao(tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id=None, aguardar=True,
+                     chave=None):
+    """
+    Salva uma transação no banco de dados e retorna o id gerado.
+    
+    Se o gravador em lote estiver ativo, a escrita é enfileirada; com
+    aguardar=False é retornado o Future que será resolvido com o id.
+    
+    Com uma chave de idempotência (gerada pelo formulário), repetições da
+    mesma chave não gravam de novo e retornam o id da primeira gravação; a
+    chave é registrada na mesma transação da inserção.
+    """
+    if usuario_id is None:
+        raise ValueError("usuário_id é obrigatório para salvar transações")
+    
+    linha = (tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id)
+    
+    gravador = _gravador
+    if gravador is not None and gravador.ativo:
+        futuro = gravador.enviar(linha, chave)
+    else:
+        futuro = Future()
+        conn = conectar_bd()
+        cursor = conn.cursor()
+        try:
+            transacao_id, = _inserir_transacoes(cursor, [linha], [chave])
+            conn.commit()
+            futuro.set_result(transacao_id)
+        except Exception as e:
+            futuro.set_exception(e)
+        finally:
+            conn.close()
+    
+    return futuro.result(timeout=TIMEOUT_BD) if aguardar else futuro
+
+def salvar_transacoes_em_lote(linhas, ignorar_duplicadas=False):
+    """
+    Salva várias transações em uma única transação do banco (importações).
+    
+    Cada linha segue o formato de _inserir_transacoes. Com
+    ignorar_duplicadas=True, linhas cuja assinatura já existe no histórico
+    (inclusive no arquivo) não são gravadas; uma linha repetida N vezes no
+    lote só é gravada nas ocorrências que passam das já existentes.
+    Retorna os ids gerados.
+    """
+    if any(linha[7] is None for linha in linhas):
+        raise ValueError("usuário_id é obrigatório para salvar transações")
+    
+    conn = conectar_bd(com_arquivo=ignorar_duplicadas and ler_data_limite_arquivo() is not None)
+    cursor = conn.cursor()
+    try:
+        if ignorar_duplicadas:
+            linhas = [linhas[i] for i in _posicoes_novas(cursor, linhas)]
+        ids = _inserir_transacoes(cursor, linhas) if linhas else []
+        conn.commit()
+    finally:
+        conn.close()
+    return ids
+
+def _posicoes_novas(cursor, linhas):
+    """
+    Posições das linhas que não duplicam o histórico, em uma única consulta:
+    as assinaturas do lote vão para uma tabela temporária e são cruzadas com
+    o índice (usuario_id, assinatura).
+    """
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS importacao (posicao INTEGER, usuario_id INTEGER, assinatura TEXT)")
+    cursor.execute("DELETE FROM temp.importacao")
+    cursor.executemany("INSERT INTO temp.importacao VALUES (?, ?, ?)", [
+        (posicao, usuario_id, calcular_assinatura(usuario_id, data, valor, descricao))
+        for posicao, (_, descricao, valor, data, _, _, _, usuario_id) in enumerate(linhas)
+    ])
+    
+    filtro = "usuario_id IN (SELECT DISTINCT usuario_id FROM temp.importacao) " \
+             "AND assinatura IN (SELECT assinatura FROM temp.importacao)"
+    cursor.execute(f"""
+        WITH existentes AS (
+            SELECT usuario_id, assinatura, COUNT(*) AS n
+            FROM {_fonte_transacoes(cursor, filtro)}
+            GROUP BY usuario_id, assinatura
+        ),
+        lote AS (
+            SELECT posicao, usuario_id, assinatura,
+                   ROW_NUMBER() OVER (PARTITION BY usuario_id, assinatura ORDER BY posicao) AS ocorrencia
+            FROM temp.importacao
+        )
+        SELECT l.posicao FROM lote l
+        LEFT JOIN existentes e ON e.usuario_id = l.usuario_id AND e.assinatura = l.assinatura
+        WHERE l.ocorrencia > COALESCE(e.n, 0)
+        ORDER BY l.posicao
+    """)
+    posicoes = [linha[0] for linha in cursor.fetchall()]
+    cursor.execute("DELETE FROM temp.importacao")
+    return posicoes
+
+# --- Edição de Transações em Lote ---
+
+# Os ids vão como um único parâmetro JSON, sem limite de variáveis do SQLite
+_FILTRO_IDS = "usuario_id = ? AND id IN (SELECT value FROM json_each(?))"
+
+def _tabelas_transacoes(cursor):
+    """Tabelas de transações da conexão (a principal e, se anexada, a do arquivo)."""
+    return ['main.transacoes', 'arquivo.transacoes'] if _arquivo_anexado(cursor) else ['main.transacoes']
+
+def _selecionar_linhas(cursor, usuario_id, ids_json):
+    """Lê as transações selecionadas no formato de _inserir_transacoes."""
+    linhas = []
+    for tabela in _tabelas_transacoes(cursor):
+        cursor.execute(f"""
+            SELECT tipo, descricao, valor, data, categoria, efetuado, fixo, usuario_id
+            FROM {tabela} WHERE {_FILTRO_IDS}
+        """, (usuario_id, ids_json))
+        linhas += cursor.fetchall()
+    return linhas
+
+def _editar_transacoes(usuario_id, ids, atualizacao=None, params=()):
+    """
+    Aplica uma alteração (trecho SET) ou, sem ela, a exclusão às transações
+    do usuário com os ids informados, em uma única transação.
+
+    Cada tabela recebe um só comando para todos os ids; o resumo mensal é
+    ajustado pela diferença entre as linhas antes e depois, e as estatísticas
+    das categorias e os alertas de orçamento só são recalculados nas chaves
+    que essa diferença atinge. Retorna a quantidade de transações afetadas.
+    """
+    if usuario_id is None:
+        raise ValueError("usuário_id é obrigatório para editar transações")
+    ids_json = json.dumps([int(i) for i in ids])
+
+    conn = conectar_bd(com_arquivo=ler_data_limite_arquivo() is not None)
+    cursor = conn.cursor()
+    try:
+        antigas = _selecionar_linhas(cursor, usuario_id, ids_json)
+        if not antigas:
+            return 0
+
+        for tabela in _tabelas_transacoes(cursor):
+            if atualizacao is None:
+                cursor.execute(f"DELETE FROM {tabela} WHERE {_FILTRO_IDS}", (usuario_id, ids_json))
+            else:
+                cursor.execute(f"UPDATE {tabela} SET {atualizacao} WHERE {_FILTRO_IDS}",
+                               (*params, usuario_id, ids_json))
+        novas = _selecionar_linhas(cursor, usuario_id, ids_json)
+
+        _atualizar_resumo_mensal(cursor, antigas, sinal=-1)
+        _atualizar_resumo_mensal(cursor, novas)
+
+        # Orçamentos: alertas que deixaram de valer saem, os novos entram
+        chaves_orcamento = _chaves_orcamento(antigas) | _chaves_orcamento(novas)
+        _remover_alertas_invalidos(cursor, chaves_orcamento)
+        _registrar_alertas_orcamento(cursor, chaves_orcamento)
+
+        # Estatísticas: só as categorias com despesas entrando ou saindo
+        antes = Counter((l[7], l[4], l[2]) for l in antigas if l[0] == 'despesa')
+        depois = Counter((l[7], l[4], l[2]) for l in novas if l[0] == 'despesa')
+        _recalcular_estatisticas(cursor, sorted({(u, categoria) for u, categoria, _ in (antes - depois) + (depois - antes)}))
+
+        if atualizacao is None:
+            cursor.execute("DELETE FROM anomalias WHERE transacao_id IN (SELECT value FROM json_each(?))", (ids_json,))
+        else:
+            repeticoes = 2 if _arquivo_anexado(cursor) else 1
+            cursor.execute(f"""
+                UPDATE anomalias SET categoria = t.categoria
+                FROM {_fonte_transacoes(cursor, _FILTRO_IDS)} t WHERE t.id = anomalias.transacao_id
+            """, (usuario_id, ids_json) * repeticoes)
+        _incrementar_versao(cursor, usuario_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return len(antigas)
+
+def recategorizar_transacoes(usuario_id, ids, categoria):
+    """Move as transações selecionadas para outra categoria."""
+    return _editar_transacoes(usuario_id, ids, "categoria = ?", (categoria,))
+
+def alternar_efetuado(usuario_id, ids):
+    """Inverte o status de efetuado de cada transação selecionada."""
+    return _editar_transacoes(usuario_id, ids, "efetuado = CASE WHEN efetuado THEN 0 ELSE 1 END")
+
+def excluir_transacoes(usuario_id, ids):
+    """Exclui as transações selecionadas."""
+    return _editar_transacoes(usuario_id, ids)
+
+# --- Gravador em Lote ---
+
+class GravadorTransacoes:
+    """
+    Thread única de escrita que agrupa inserções de transações em lotes.
+    
+    Os callbacks enfileiram linhas e recebem um Future; a thread mantém uma
+    única conexão e confirma cada lote com um só commit, evitando disputa
+    pelo lock de escrita do SQLite entre sessões concorrentes.
+    """
+
+    def __init__(self, tamanho_lote=200, intervalo=0.005):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self._fila = queue.Queue()
+        self._thread = None
+
+    @property
+    def ativo(self):
+        """Indica se a thread de escrita está em execução."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def iniciar(self):
+        """Inicia a thread de escrita (idempotente)."""
+        if not self.ativo:
+            self._thread = threading.Thread(target=self._executar, name="gravador-transacoes", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        """Processa o que estiver pendente na fila e encerra a thread."""
+        if self.ativo:
+            self._fila.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def enviar(self, linha, chave=None):
+        """Enfileira uma linha para inserção e retorna o Future com o id gerado."""
+        futuro = Future()
+        self._fila.put((linha, chave, futuro))
+        return futuro
+
+    def _coletar_lote(self, primeiro):
+        """Junta ao primeiro item o que chegar na fila dentro do intervalo do lote."""
+        lote = [primeiro]
+        while len(lote) < self.tamanho_lote:
+            try:
+                item = self._fila.get(timeout=self.intervalo)
+            except queue.Empty:
+                break
+            if item is None:
+                self._fila.put(None)
+                break
+            lote.append(item)
+        return lote
+
+    def _executar(self):
+        conn = conectar_bd()
+        try:
+            while True:
+                item = self._fila.get()
+                if item is None:
+                    break
+                self._gravar(conn, self._coletar_lote(item))
+        finally:
+            conn.close()
+
+    def _gravar(self, conn, lote):
+        """Grava o lote em uma única transação; em caso de erro, isola a linha problemática."""
+        cursor = conn.cursor()
+        try:
+            ids = _inserir_transacoes(cursor, [linha for linha, _, _ in lote], [chave for _, chave, _ in lote])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if len(lote) > 1:
+                for item in lote:
+                    self._gravar(conn, [item])
+            else:
+                _, _, futuro = lote[0]
+                futuro.set_exception(sys.exc_info()[1])
+            return
+        
+        for (_, _, futuro), transacao_id in zip(lote, ids):
+            futuro.set_result(transacao_id)
+
+_gravador = None
+
+def iniciar_gravador(**kwargs):
+    """Ativa o gravador em lote para as chamadas de salvar_transacao."""
+    global _gravador
+    if _gravador is None:
+        _gravador = GravadorTransacoes(**kwargs)
+    _gravador.iniciar()
+    return _gravador
+
+def parar_gravador():
+    """Desativa o gravador em lote, gravando o que estiver pendente."""
+    global _gravador
+    if _gravador is not None:
+        _gravador.parar()
+        _gravador = None
+
 # --- Funções de Autenticação ---
 
 def criar_usuario(username, email, password):
@@ -194,9 +1535,11 @@ def criar_usuario(username, email, password):
         
         # Obtém o ID do novo usuário
         user_id = cursor.lastrowid
+        _incrementar_versao(cursor)
         
         conn.commit()
         conn.close()
+        _cache_usuarios.limpar()
         return True, f"Usuário criado com sucesso: Seja bem vindo(a) ao MoneyFlow {username}"
         
     except sqlite3.Error as e:
@@ -204,20 +1547,33 @@ def criar_usuario(username, email, password):
     except Exception as e:
         return False, f"Erro ao criar usuário: {str(e)}"
 
+def _ler_credenciais(username_or_email):
+    """Lê do banco a linha de credenciais de um usuário ativo, ou None."""
+    conn = conectar_bd()
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        SELECT id, username, email, password_hash, salt, ativo 
+        FROM usuarios 
+        WHERE (username = ? OR email = ?) AND ativo = 1
+    """, (username_or_email, username_or_email))
+    
+    usuario = cursor.fetchone()
+    conn.close()
+    return usuario
+
 def autenticar_usuario(username_or_email, password):
-    """Autentica um usuário."""
+    """
+    Autentica um usuário.
+    
+    As credenciais ficam no cache de usuários; só a verificação da senha é
+    feita a cada tentativa. Um login inexistente não é guardado: a conta pode
+    ter acabado de ser criada em outro worker.
+    """
     try:
-        conn = conectar_bd()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, username, email, password_hash, salt, ativo 
-            FROM usuarios 
-            WHERE (username = ? OR email = ?) AND ativo = 1
-        """, (username_or_email, username_or_email))
-        
-        usuario = cursor.fetchone()
-        conn.close()
+        usuario = _cache_usuarios.obter(('login', username_or_email),
+                                        lambda: _ler_credenciais(username_or_email), _versao_global,
+                                        guardar_vazio=False)
         
         if usuario and verificar_password(password, usuario[3], usuario[4]):
             return {
@@ -233,8 +1589,8 @@ def autenticar_usuario(username_or_email, password):
         print(f"Erro na autenticação: {e}")
         return None
 
-def buscar_usuario_por_id(usuario_id):
-    """Busca usuário por ID."""
+def _ler_usuario(usuario_id):
+    """Lê do banco um usuário ativo por ID."""
     conn = conectar_bd()
     cursor = conn.cursor()
     
@@ -253,6 +1609,11 @@ def buscar_usuario_por_id(usuario_id):
     
     return None
 
+def buscar_usuario_por_id(usuario_id):
+    """Busca usuário por ID (do cache de usuários, sem consultar o banco na maioria das vezes)."""
+    usuario = _cache_usuarios.obter(('id', usuario_id), lambda: _ler_usuario(usuario_id), _versao_global)
+    return dict(usuario) if usuario else None
+
 # --- Variáveis globais ---
 cat_receita = []
 cat_despesa = []
@@ -262,7 +1623,8 @@ def inicializar_app():
     global cat_receita, cat_despesa
     inicializar_bd()
     cat_receita, cat_despesa = ler_categorias()
+    
+    # Gravador em lote opcional (MONEYFLOW_GRAVADOR_LOTE=1)
+    if os.environ.get("MONEYFLOW_GRAVADOR_LOTE") == "1":
+        iniciar_gravador()
     print("Aplicativo inicializado com sucesso!")
-
-# Inicializa ao importar o módulo
-inicializar_app()
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Configuração do gunicorn para produção:
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+
+O aplicativo é carregado e aquecido uma vez no mestre (preload_app) e os
+workers nascem por fork, compartilhando a memória por copy-on-write.
+"""
+
+import os
+
+bind = os.environ.get("MONEYFLOW_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("MONEYFLOW_WORKERS", (os.cpu_count() or 1) * 2 + 1))
+threads = int(os.environ.get("MONEYFLOW_THREADS", 4))
+preload_app = True
+timeout = 120
+
+def post_fork(server, worker):
+    """Inicializa o worker recém-criado (conexões e threads não vêm do mestre)."""
+    import wsgi
+    wsgi.iniciar_worker()
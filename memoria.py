@@ -0,0 +1,170 @@
+"""
+Perfil de alocação de memória por callback (opcional, com tracemalloc).
+
+Ativado com MONEYFLOW_PERFIL_MEMORIA=1. Para cada chamada medida de um
+callback registra o pico de memória alocada acima do que já estava alocado no
+início (as alocações transitórias de DataFrames, to_datetime etc.). A cada
+AMOSTRA_SITIOS chamadas medidas do mesmo callback, compara snapshots de antes
+e depois e registra as linhas que mais retiveram memória; a comparação
+custa segundos com um heap grande e roda em uma thread separada, fora da
+requisição.
+
+Uma chamada é medida por vez em cada processo (o tracemalloc é global):
+chamadas simultâneas seguem sem medição, e o que outras threads alocarem
+durante uma medição entra no pico dela. As métricas são agregadas no cache
+compartilhado (diskcache), então somam os workers e os processos dos
+callbacks em segundo plano; sem o diskcache, ficam na memória do processo.
+"""
+
+import functools
+import linecache
+import os
+import threading
+import tracemalloc
+
+ATIVO = os.environ.get("MONEYFLOW_PERFIL_MEMORIA") == "1"
+
+# Quadros guardados por alocação (1 basta para agrupar por linha e custa
+# bem menos) e frequência da comparação de snapshots
+QUADROS_TRACEMALLOC = int(os.environ.get("MONEYFLOW_QUADROS_MEMORIA", 1))
+AMOSTRA_SITIOS = int(os.environ.get("MONEYFLOW_AMOSTRA_SITIOS", 20))
+MAX_SITIOS = 10
+
+CACHE_DIR = os.environ.get("MONEYFLOW_CACHE_DIR", "./cache")
+
+if ATIVO and not tracemalloc.is_tracing():
+    tracemalloc.start(QUADROS_TRACEMALLOC)
+
+_lock_medicao = threading.Lock()
+_contagem_local = {}
+
+def _reiniciar_apos_fork():
+    # O fork pode acontecer no meio de uma medição de outra thread
+    global _lock_medicao
+    _lock_medicao = threading.Lock()
+
+os.register_at_fork(after_in_child=_reiniciar_apos_fork)
+
+class _RegistroLocal:
+    """Métricas na memória do processo (sem diskcache)."""
+
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def atualizar(self, chave, funcao):
+        with self._lock:
+            self._dados[chave] = funcao(self._dados.get(chave))
+
+    def itens(self):
+        with self._lock:
+            return dict(self._dados)
+
+class _RegistroCompartilhado:
+    """Métricas no diskcache, compartilhadas entre processos."""
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def atualizar(self, chave, funcao):
+        with self._cache.transact():
+            self._cache.set(chave, funcao(self._cache.get(chave)))
+
+    def itens(self):
+        return {chave: self._cache.get(chave) for chave in self._cache.iterkeys()}
+
+def _criar_registro():
+    try:
+        import diskcache
+    except ImportError:
+        return _RegistroLocal()
+    return _RegistroCompartilhado(diskcache.Cache(os.path.join(CACHE_DIR, "memoria")))
+
+_registro = _criar_registro() if ATIVO else _RegistroLocal()
+
+def _vazio():
+    return {'chamadas': 0, 'pico_total': 0, 'pico_max': 0, 'pico_ultimo': 0, 'sitios': {}}
+
+def _acumular_pico(pico):
+    def funcao(atual):
+        atual = atual or _vazio()
+        atual['chamadas'] += 1
+        atual['pico_total'] += pico
+        atual['pico_max'] = max(atual['pico_max'], pico)
+        atual['pico_ultimo'] = pico
+        return atual
+    return funcao
+
+def _acumular_sitios(sitios):
+    def funcao(atual):
+        atual = atual or _vazio()
+        for local, tamanho in sitios:
+            atual['sitios'][local] = atual['sitios'].get(local, 0) + tamanho
+        atual['sitios'] = dict(sorted(atual['sitios'].items(), key=lambda item: -item[1])[:MAX_SITIOS])
+        return atual
+    return funcao
+
+def _registrar_sitios(nome, antes, depois):
+    """Acumula as linhas que mais retiveram memória entre dois snapshots."""
+    ignorados = (tracemalloc.__file__, linecache.__file__, __file__)
+    sitios = []
+    for diferenca in depois.compare_to(antes, 'lineno'):
+        if diferenca.size_diff <= 0 or len(sitios) == MAX_SITIOS:
+            break
+        quadro = diferenca.traceback[0]
+        if quadro.filename in ignorados:
+            continue
+        codigo = linecache.getline(quadro.filename, quadro.lineno).strip()
+        sitios.append((f"{quadro.filename}:{quadro.lineno} {codigo}", diferenca.size_diff))
+    _registro.atualizar(nome, _acumular_sitios(sitios))
+
+def iniciar(nome):
+    """Começa a medir uma chamada do callback; retorna o estado da medição ou None."""
+    if not ATIVO or not _lock_medicao.acquire(blocking=False):
+        return None
+    contagem = _contagem_local[nome] = _contagem_local.get(nome, 0) + 1
+    antes = tracemalloc.take_snapshot() if (contagem - 1) % AMOSTRA_SITIOS == 0 else None
+    tracemalloc.reset_peak()
+    return nome, tracemalloc.get_traced_memory()[0], antes
+
+def concluir(medicao):
+    """Termina a medição iniciada por iniciar() e acumula o resultado."""
+    if medicao is None:
+        return
+    nome, inicio, antes = medicao
+    try:
+        pico = max(tracemalloc.get_traced_memory()[1] - inicio, 0)
+        depois = tracemalloc.take_snapshot() if antes is not None else None
+    finally:
+        _lock_medicao.release()
+    _registro.atualizar(nome, _acumular_pico(pico))
+
+    # Não é daemon: um job em segundo plano espera a thread antes de terminar
+    if depois is not None:
+        threading.Thread(target=_registrar_sitios, args=(nome, antes, depois), name="sitios-memoria").start()
+
+def medir_funcao(func):
+    """Decorador que mede cada chamada de func (usado nos callbacks em segundo plano)."""
+    @functools.wraps(func)
+    def medida(*args, **kwargs):
+        medicao = iniciar(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            concluir(medicao)
+    return medida
+
+def ler_metricas():
+    """Métricas por callback: chamadas medidas, pico médio/máximo/último (bytes) e sítios."""
+    metricas = {}
+    for nome, dados in sorted(_registro.itens().items()):
+        if not dados:
+            continue
+        metricas[nome] = {
+            'chamadas': dados['chamadas'],
+            'pico_medio': dados['pico_total'] // dados['chamadas'],
+            'pico_max': dados['pico_max'],
+            'pico_ultimo': dados['pico_ultimo'],
+            'sitios': [{'local': local, 'bytes': tamanho} for local, tamanho in dados['sitios'].items()],
+        }
+    return metricas
@@ -10,7 +10,11 @@ import dash_bootstrap_components as dbc
 
 from app import app
 from components import sidebar, dashboards, extratos, login
-from db import ler_transacoes, ler_categorias, buscar_usuario_por_id
+import admin
+from db import ler_categorias
+from serializacao import codificar_transacoes
+from sessoes import validar_sessao, usuario_da_sessao, encerrar_sessao
+from snapshots import ler_transacoes_usuario
 import pandas as pd
 
 
@@ -38,23 +42,24 @@ app.layout = dbc.Container(children=[
 
 @app.callback(
     Output('main-content', 'children'),
-    [Input('url', 'pathname'),
-     Input('store-user-session', 'data')]
+    Input('store-user-session', 'data')
 )
-def display_page(pathname, session_data):
+def display_page(session_data):
     """
-    Controla qual página é exibida baseado na rota e status de login.
+    Controla qual página é exibida baseado no status de login.
     
+    Depende apenas da sessão: trocar de rota atualiza só o page-content,
+    sem reenviar a barra lateral.
     """
-    # Verifica se o usuário está logado
-    if not session_data or not session_data.get('logged_in'):
+    # Verifica se o usuário está logado (sessão válida no servidor)
+    if not validar_sessao(session_data):
         # Se não estiver logado, sempre mostra a tela de login
-        return login.layout
+        return login.criar_layout()
     
     # Se estiver logado, mostra o layout principal com sidebar
     return dbc.Row([
         dbc.Col([
-            sidebar.layout
+            sidebar.criar_layout()
         ], md=2),
         dbc.Col([
             content
@@ -72,14 +77,14 @@ def render_page_content(pathname, session_data):
     
     """
     # Se não estiver logado, não renderiza conteúdo
-    if not session_data or not session_data.get('logged_in'):
+    if not validar_sessao(session_data):
         return html.Div()
     
     # Roteamento para páginas autenticadas
     if pathname == '/' or pathname == '/dashboards':
-        return dashboards.layout
+        return dashboards.criar_layout()
     elif pathname == '/extratos':
-        return extratos.layout
+        return extratos.criar_layout()
     elif pathname == '/logout':
         return html.Div()  # Logout será tratado por outro callback
     else:
@@ -104,26 +109,24 @@ def load_user_data(session_data):
     Carrega os dados financeiros do usuário quando ele faz login.
     
     """
-    if not session_data or not session_data.get('logged_in'):
+    user_id = usuario_da_sessao(session_data)
+    if not user_id:
         return [], [], [], []
     
-    user_id = session_data.get('user_id')
-    
     # Carrega dados específicos do usuário
-    df_r, df_d = ler_transacoes(user_id)
+    df_r, df_d = ler_transacoes_usuario(user_id)
     cat_r, cat_d = ler_categorias()
     
-    # Converte para formato de dicionário para os stores
-    data_receitas = df_r.to_dict('records') if not df_r.empty else []
-    data_despesas = df_d.to_dict('records') if not df_d.empty else []
-    data_cat_receitas = pd.DataFrame(cat_r, columns=['Categoria']).to_dict('records')
-    data_cat_despesas = pd.DataFrame(cat_d, columns=['Categoria']).to_dict('records')
+    # Converte para o formato colunar compacto dos stores
+    data_receitas = codificar_transacoes(df_r)
+    data_despesas = codificar_transacoes(df_d)
+    data_cat_receitas = codificar_transacoes(pd.DataFrame(cat_r, columns=['Categoria']))
+    data_cat_despesas = codificar_transacoes(pd.DataFrame(cat_d, columns=['Categoria']))
     
     return data_receitas, data_despesas, data_cat_receitas, data_cat_despesas
 
 @app.callback(
-    [Output('url', 'pathname'),
-     Output('store-user-session', 'data', allow_duplicate=True)],
+    Output('url', 'pathname'),
     Input('store-user-session', 'data'),
     prevent_initial_call=True
 )
@@ -131,13 +134,15 @@ def handle_login_redirect(session_data):
     """
     Redireciona o usuário após login bem-sucedido.
     
+    Não regrava a sessão, o que dispararia novamente o carregamento dos
+    dados e a montagem do layout.
     """
-    if session_data and session_data.get('logged_in'):
+    if validar_sessao(session_data):
         # Redireciona para dashboard após login
-        return '/dashboards', session_data
+        return '/dashboards'
     
     # Mantém na página atual se não estiver logado
-    return dash.no_update, session_data
+    return dash.no_update
 
 # Callback para logout (pode ser acionado por um botão na sidebar)
 @app.callback(
@@ -153,13 +158,24 @@ def handle_logout(pathname, session_data):
     
     """
     if pathname == '/logout':
-        # Limpa a sessão e redireciona para login
+        # Encerra a sessão no servidor, limpa o store e redireciona para login
+        encerrar_sessao(session_data)
         return None, '/'
     
     return dash.no_update, dash.no_update
 
+def criar_servidor():
+    """
+    Servidor Flask do app, com o layout e os callbacks deste módulo e as
+    rotas administrativas registradas.
+    
+    """
+    admin.registrar(app.server)
+    return app.server
+
 # --- Execução do App ---
+# Em produção o ponto de entrada é o wsgi.py (gunicorn)
 if __name__ == '__main__':
+    inicializar_app()
+    criar_servidor()
     app.run(port=8050, debug=True, host='127.0.0.1')
-
-inicializar_app()
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Módulo responsável pelo formato colunar compacto usado nos dcc.Store.
+
+Em vez de uma lista de registros (que repete o nome de cada coluna em cada
+linha), os DataFrames de transações são enviados como um dicionário de
+listas: datas viram inteiros (dias desde 1970-01-01) e colunas de texto com
+poucos valores distintos são codificadas por dicionário.
+"""
+
+import numpy as np
+import pandas as pd
+
+FORMATO = "colunar-v1"
+
+# Colunas de texto só são codificadas por dicionário se tiverem no máximo
+# esta fração de valores distintos (descrições costumam ser quase únicas)
+FRACAO_MAX_DICIONARIO = 0.5
+
+def _codificar_coluna(nome, serie):
+    """Codifica uma coluna do DataFrame no formato colunar."""
+    if nome == 'Data' or pd.api.types.is_datetime64_any_dtype(serie):
+        datas = pd.to_datetime(serie, format='ISO8601')
+        dias = datas.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        return {'dias': dias.tolist()}
+
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(object).where(serie.notna(), None).tolist()
+
+    codigos, dicionario = pd.factorize(serie, use_na_sentinel=True)
+    if len(dicionario) <= max(1, FRACAO_MAX_DICIONARIO * len(serie)):
+        return {'dicionario': dicionario.tolist(), 'codigos': codigos.tolist()}
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+def _decodificar_coluna(valores):
+    """Reconstrói uma coluna a partir do formato colunar."""
+    if isinstance(valores, dict) and 'dias' in valores:
+        return np.asarray(valores['dias'], dtype=np.int64).astype('datetime64[D]').astype('datetime64[ns]')
+
+    if isinstance(valores, dict) and 'dicionario' in valores:
+        return pd.Categorical.from_codes(valores['codigos'], categories=valores['dicionario']).astype(object)
+
+    return valores
+
+def codificar_transacoes(df):
+    """
+    Converte um DataFrame para o formato colunar dos stores.
+
+    DataFrames vazios viram {} (falso), mantendo as checagens `if not data`.
+    """
+    if df is None or df.empty:
+        return {}
+
+    return {
+        'formato': FORMATO,
+        'colunas': {nome: _codificar_coluna(nome, df[nome]) for nome in df.columns}
+    }
+
+def decodificar_transacoes(data):
+    """
+    Converte o conteúdo de um store de volta para DataFrame.
+
+    Aceita também a lista de registros antiga, para stores persistidos antes
+    da mudança de formato.
+    """
+    if not data:
+        return pd.DataFrame()
+
+    if isinstance(data, list):
+        return pd.DataFrame(data)
+
+    return pd.DataFrame({nome: _decodificar_coluna(valores) for nome, valores in data['colunas'].items()})
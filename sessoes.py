@@ -0,0 +1,116 @@
+"""
+Registro de sessões de login no servidor.
+
+O store-user-session guarda um id de sessão assinado com HMAC; o usuário da
+sessão vem do registro no banco (tabela sessoes), nunca dos dados enviados
+pelo navegador. Sessões e usuários ficam em caches em memória, então validar
+a sessão em cada callback custa uma conferência de assinatura e consultas a
+dicionários, com uma leitura no banco no máximo a cada validade do cache.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+import db
+
+# Duração de uma sessão de login
+DURACAO_SESSAO_HORAS = int(os.environ.get("MONEYFLOW_DURACAO_SESSAO", 12))
+
+# Um logout feito em outro processo leva até esta validade (segundos) para
+# valer neste processo
+_cache_sessoes = db.CacheTTL(maximo=50000, validade=30)
+
+_segredo = None
+
+def _obter_segredo():
+    """
+    Chave do HMAC: MONEYFLOW_SESSION_SECRET ou, sem ela, uma chave gerada uma
+    vez e guardada no banco (compartilhada por todos os processos).
+    """
+    global _segredo
+    if _segredo is None:
+        valor = os.environ.get("MONEYFLOW_SESSION_SECRET")
+        if not valor:
+            conn = db.conectar_bd()
+            conn.execute("INSERT OR IGNORE INTO configuracoes (chave, valor) VALUES ('segredo_sessao', ?)",
+                         (secrets.token_hex(32),))
+            conn.commit()
+            valor = conn.execute("SELECT valor FROM configuracoes WHERE chave = 'segredo_sessao'").fetchone()[0]
+            conn.close()
+        _segredo = valor.encode('utf-8')
+    return _segredo
+
+def _assinar(sessao_id):
+    """Assinatura HMAC-SHA256 do id da sessão."""
+    return hmac.new(_obter_segredo(), sessao_id.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def _ler_sessao(sessao_id):
+    """Lê do banco (usuario_id, expira) da sessão, ou None."""
+    conn = db.conectar_bd()
+    linha = conn.execute("SELECT usuario_id, expira FROM sessoes WHERE id = ?", (sessao_id,)).fetchone()
+    conn.close()
+    return linha
+
+def criar_sessao(usuario_id):
+    """Registra uma nova sessão para o usuário e retorna o token assinado."""
+    sessao_id = secrets.token_urlsafe(24)
+    agora = time.time()
+
+    conn = db.conectar_bd()
+    try:
+        conn.execute("DELETE FROM sessoes WHERE expira < ?", (agora,))
+        conn.execute("INSERT INTO sessoes (id, usuario_id, expira) VALUES (?, ?, ?)",
+                     (sessao_id, usuario_id, agora + DURACAO_SESSAO_HORAS * 3600))
+        conn.commit()
+    finally:
+        conn.close()
+
+    return f"{sessao_id}.{_assinar(sessao_id)}"
+
+def _id_da_sessao(session_data):
+    """
+    Extrai o id da sessão do store se a assinatura for válida; senão None.
+    
+    Valores em outro formato (como o id do usuário guardado pelas versões
+    anteriores) contam como sessão encerrada.
+    """
+    if not isinstance(session_data, dict):
+        return None
+    token = session_data.get('sessao')
+    if not isinstance(token, str) or '.' not in token:
+        return None
+    sessao_id, assinatura = token.rsplit('.', 1)
+    return sessao_id if hmac.compare_digest(assinatura, _assinar(sessao_id)) else None
+
+def validar_sessao(session_data):
+    """Retorna o usuário (dicionário) da sessão do store, ou None se inválida ou expirada."""
+    sessao_id = _id_da_sessao(session_data)
+    if sessao_id is None:
+        return None
+
+    registro = _cache_sessoes.obter(sessao_id, lambda: _ler_sessao(sessao_id))
+    if registro is None or registro[1] < time.time():
+        return None
+    return db.buscar_usuario_por_id(registro[0])
+
+def usuario_da_sessao(session_data):
+    """Id do usuário autenticado pela sessão do store, ou None."""
+    usuario = validar_sessao(session_data)
+    return usuario['id'] if usuario else None
+
+def encerrar_sessao(session_data):
+    """Remove a sessão do registro (logout)."""
+    sessao_id = _id_da_sessao(session_data)
+    if sessao_id is None:
+        return
+
+    conn = db.conectar_bd()
+    try:
+        conn.execute("DELETE FROM sessoes WHERE id = ?", (sessao_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    _cache_sessoes.remover(sessao_id)
@@ -0,0 +1,136 @@
+"""
+Snapshots Arrow do histórico de transações de cada usuário.
+
+Cada usuário tem um arquivo Arrow IPC em DIR_SNAPSHOTS, com nome na versão
+dos dados dele (usuario_<id>_v<versao>.arrow). O arquivo guarda dois lotes,
+receitas e despesas, e é lido por memory map: os workers do mesmo servidor
+compartilham as páginas pelo cache do sistema operacional e as colunas
+numéricas chegam ao pandas sem cópia.
+
+O snapshot cobre o histórico recente, desde a data de corte do arquivo
+(db.ler_data_limite_arquivo): é o que vai para os stores da sessão, sem
+anexar o banco de arquivo. Períodos mais antigos são lidos do banco por
+db.ler_transacoes com o intervalo pedido.
+
+Uma escrita incrementa a versão do usuário; a próxima leitura não encontra o
+arquivo da versão nova, lê o histórico do SQLite uma vez e grava o snapshot
+(em arquivo temporário próprio, trocado de uma vez), apagando os das versões
+anteriores. No mesmo processo, um lock por usuário faz uma thread regravar
+enquanto as outras esperam e leem o arquivo gravado; entre processos, quem
+perde a corrida só deixa de aproveitar o próprio arquivo (uma falta de cache).
+O pyarrow é opcional: sem ele, as leituras vão direto ao SQLite.
+"""
+
+import glob
+import os
+import re
+import tempfile
+import threading
+
+import db
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+DIR_SNAPSHOTS = os.environ.get("MONEYFLOW_DIR_SNAPSHOTS", "./cache/snapshots")
+
+# Esquema fixo: lotes vazios e colunas com nulos continuam com o mesmo tipo
+_ESQUEMA = pa.schema([
+    ('Valor', pa.float64()),
+    ('Efetuado', pa.int64()),
+    ('Fixo', pa.int64()),
+    ('Data', pa.string()),
+    ('Categoria', pa.string()),
+    ('Descrição', pa.string()),
+    ('id', pa.int64()),
+]) if pa is not None else None
+
+# Locks da regravação, repartidos por usuário (quantidade fixa de locks)
+_LOCKS_USUARIOS = 64
+_locks = [threading.Lock() for _ in range(_LOCKS_USUARIOS)]
+
+def _reiniciar_apos_fork():
+    # O fork pode acontecer com um lock tomado por outra thread
+    global _locks
+    _locks = [threading.Lock() for _ in range(_LOCKS_USUARIOS)]
+
+os.register_at_fork(after_in_child=_reiniciar_apos_fork)
+
+def _lock_usuario(usuario_id):
+    return _locks[int(usuario_id) % _LOCKS_USUARIOS]
+
+def _caminho(usuario_id, versao):
+    return os.path.join(DIR_SNAPSHOTS, f"usuario_{int(usuario_id)}_v{versao}.arrow")
+
+def _versao_do_caminho(caminho):
+    encontrado = re.search(r'_v(\d+)\.arrow$', caminho)
+    return int(encontrado.group(1)) if encontrado else None
+
+def _ler_recentes(usuario_id):
+    """Transações do usuário desde a data de corte do arquivo (sem anexar o arquivo)."""
+    return db.ler_transacoes(usuario_id, data_inicio=db.ler_data_limite_arquivo())
+
+def gravar_snapshot(usuario_id, versao):
+    """Lê o histórico recente do usuário no SQLite e grava o snapshot da versão. Retorna (receitas, despesas)."""
+    df_receitas, df_despesas = _ler_recentes(usuario_id)
+    os.makedirs(DIR_SNAPSHOTS, exist_ok=True)
+
+    destino = _caminho(usuario_id, versao)
+    descritor, temporario = tempfile.mkstemp(dir=DIR_SNAPSHOTS, prefix=f"usuario_{int(usuario_id)}_", suffix=".tmp")
+    os.close(descritor)
+    try:
+        with pa.OSFile(temporario, 'wb') as arquivo:
+            with pa.ipc.new_file(arquivo, _ESQUEMA) as escritor:
+                for df in (df_receitas, df_despesas):
+                    escritor.write_batch(pa.RecordBatch.from_pandas(df, schema=_ESQUEMA, preserve_index=False))
+        os.replace(temporario, destino)
+    except FileNotFoundError:
+        # Diretório limpo no meio da gravação: fica sem snapshot até a próxima leitura
+        return df_receitas, df_despesas
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+    # Só as versões anteriores: uma mais nova pode ter sido gravada por outro processo.
+    # Quem ainda tem uma versão antiga mapeada continua lendo até fechar
+    for antigo in glob.glob(os.path.join(DIR_SNAPSHOTS, f"usuario_{int(usuario_id)}_v*.arrow")):
+        versao_antiga = _versao_do_caminho(antigo)
+        if versao_antiga is not None and versao_antiga < versao:
+            try:
+                os.remove(antigo)
+            except FileNotFoundError:
+                pass
+    return df_receitas, df_despesas
+
+def _ler_snapshot(caminho):
+    """Lê (receitas, despesas) de um snapshot por memory map, ou None se não existir."""
+    try:
+        leitor = pa.ipc.open_file(pa.memory_map(caminho, 'r'))
+    except FileNotFoundError:
+        return None
+    return tuple(leitor.get_batch(i).to_pandas() for i in range(2))
+
+def ler_transacoes_usuario(usuario_id):
+    """
+    Receitas e despesas recentes do usuário, desde a data de corte do arquivo
+    (mesmo formato de db.ler_transacoes), a partir do snapshot da versão atual.
+    """
+    if pa is None or not usuario_id:
+        return _ler_recentes(usuario_id)
+
+    _, versao = db.ler_versao(usuario_id)
+    caminho = _caminho(usuario_id, versao)
+    dados = _ler_snapshot(caminho)
+    if dados is None:
+        with _lock_usuario(usuario_id):
+            dados = _ler_snapshot(caminho)
+            if dados is None:
+                dados = gravar_snapshot(usuario_id, versao)
+    return dados
+
+def limpar_snapshots():
+    """Apaga todos os snapshots (serão recriados na próxima leitura)."""
+    for caminho in glob.glob(os.path.join(DIR_SNAPSHOTS, "usuario_*.arrow")):
+        os.remove(caminho)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do aplicativo ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import categorizacao  # noqa: E402
+import db  # noqa: E402
+import sessoes  # noqa: E402
+import snapshots  # noqa: E402
+
+@pytest.fixture
+def banco_vazio(tmp_path, monkeypatch):
+    """Banco novo em um diretório temporário, com os caches em memória zerados."""
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "financas.db"))
+    monkeypatch.setattr(db, "ARQUIVO_FILE", str(tmp_path / "financas_arquivo.db"))
+    monkeypatch.setattr(snapshots, "DIR_SNAPSHOTS", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(db, "_cache_categorias", db.CacheVersionado())
+    monkeypatch.setattr(db, "_cache_usuarios", db.CacheTTL(maximo=100, validade=30))
+    monkeypatch.setattr(sessoes, "_cache_sessoes", db.CacheTTL(maximo=100, validade=30))
+    monkeypatch.setattr(categorizacao, "_cache_classificadores", db.CacheVersionado())
+    db.inicializar_bd()
+    return tmp_path
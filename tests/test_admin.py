@@ -0,0 +1,20 @@
+"""Registro explícito das rotas administrativas."""
+
+from flask import Flask
+
+import admin
+
+def test_registrar_instala_as_rotas_uma_vez(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "segredo")
+    servidor = Flask(__name__)
+    assert 'admin_perfil' not in servidor.view_functions
+
+    admin.registrar(servidor)
+    admin.registrar(servidor)
+    regras = [regra.rule for regra in servidor.url_map.iter_rules()]
+    assert sorted(r for r in regras if r.startswith('/admin')) == ['/admin/metricas', '/admin/perfil']
+
+    cliente = servidor.test_client()
+    assert cliente.get('/admin/metricas').status_code == 403
+    resposta = cliente.get('/admin/metricas', headers={'X-Admin-Token': 'segredo'})
+    assert resposta.status_code == 200 and resposta.get_json()['processo']['pid']
@@ -0,0 +1,129 @@
+"""Paridade entre os motores pandas e DuckDB do analytics.py sobre um banco temporário."""
+
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import analytics
+import db
+
+duckdb = pytest.importorskip("duckdb")
+
+@pytest.fixture(scope="module")
+def banco(tmp_path_factory):
+    """Banco com dois usuários, parte do histórico já movida para o arquivo."""
+    diretorio = tmp_path_factory.mktemp("analytics")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, "DB_FILE", str(diretorio / "financas.db"))
+        mp.setattr(db, "ARQUIVO_FILE", str(diretorio / "financas_arquivo.db"))
+        mp.setattr(analytics, "DIR_PARQUET", str(diretorio / "parquet"))
+        db.inicializar_bd()
+
+        aleatorio = random.Random(45)
+        cat_receita, cat_despesa = db.ler_categorias()
+        usuarios = []
+        for i in range(2):
+            db.criar_usuario(f"paridade{i}", f"paridade{i}@teste.local", "senha123")
+            usuario_id = db.autenticar_usuario(f"paridade{i}", "senha123")['id']
+            linhas = []
+            for _ in range(400):
+                tipo = 'receita' if aleatorio.random() < 0.3 else 'despesa'
+                categoria = aleatorio.choice(cat_receita if tipo == 'receita' else cat_despesa)
+                data = date.today() - timedelta(days=aleatorio.randint(0, 2 * 365))
+                linhas.append((tipo, f"{categoria} {aleatorio.randint(1, 99)}", round(aleatorio.uniform(1, 900), 2),
+                               data.isoformat(), categoria, aleatorio.randint(0, 1), 0, usuario_id))
+            db.salvar_transacoes_em_lote(linhas)
+            usuarios.append(usuario_id)
+        assert db.arquivar_transacoes() > 0
+        yield usuarios
+    analytics._duckdb_disponivel.cache_clear()
+
+@pytest.fixture(params=["sqlite", "parquet"])
+def fonte(request, banco, monkeypatch):
+    """Fonte do DuckDB; a sqlite só roda se a extensão carregar (precisa de rede na primeira vez)."""
+    monkeypatch.setattr(analytics, "FONTE", request.param)
+    analytics._duckdb_disponivel.cache_clear()
+    if request.param == "parquet":
+        analytics.exportar_parquet()
+    elif not analytics._duckdb_disponivel("sqlite"):
+        pytest.skip("extensão sqlite do DuckDB indisponível")
+    yield request.param
+    analytics._duckdb_disponivel.cache_clear()
+
+def test_paridade_entre_motores(banco, fonte):
+    assert analytics.verificar_paridade(regras=('D', 'W-MON', 'MS', 'QS', 'YS')) == []
+
+def test_paridade_com_filtros(banco, fonte):
+    usuario_id = banco[0]
+    inicio, fim = date.today() - timedelta(days=500), date.today() - timedelta(days=30)
+    _, cat_despesa = db.ler_categorias()
+    selecionadas = cat_despesa[:3]
+
+    def comparar(calcular):
+        pd.testing.assert_frame_equal(calcular('pandas'), calcular('duckdb'), check_dtype=False, rtol=1e-9)
+
+    comparar(lambda motor: analytics.totais_por_categoria(usuario_id, 'despesa', inicio, fim, motor=motor))
+    comparar(lambda motor: analytics.fluxo_por_periodo(usuario_id, 'MS', inicio, fim, motor=motor,
+                                                       categorias_despesa=selecionadas))
+    comparar(lambda motor: analytics.fluxo_por_periodo(usuario_id, 'W-MON', inicio, fim, motor=motor,
+                                                       categorias_receita=[], categorias_despesa=selecionadas))
+
+def test_resumo_bate_com_o_banco(banco):
+    """O resumo do motor pandas é o mantido incrementalmente em resumo_mensal."""
+    calculado = analytics.resumo_mensal(banco, 'pandas')
+    conn = db.conectar_bd()
+    gravado = pd.read_sql_query("SELECT * FROM resumo_mensal", conn)[analytics._COLUNAS_RESUMO]
+    conn.close()
+    gravado = analytics._ordenar(gravado, ['usuario_id', 'mes', 'tipo', 'categoria'])
+    pd.testing.assert_frame_equal(calculado, gravado, check_dtype=False, rtol=1e-9)
+
+def test_fonte_indisponivel_usa_pandas(banco, monkeypatch):
+    def falhar(fonte=None):
+        raise duckdb.IOException("sem rede")
+    monkeypatch.setattr(analytics, "MOTOR", "duckdb")
+    monkeypatch.setattr(analytics, "_conectar_duckdb", falhar)
+    analytics._duckdb_disponivel.cache_clear()
+    try:
+        assert analytics.motor_ativo() == 'pandas'
+        assert not analytics.totais_por_categoria(banco[0], 'despesa').empty
+        with pytest.raises(RuntimeError):
+            analytics.verificar_paridade()
+    finally:
+        analytics._duckdb_disponivel.cache_clear()
+
+@pytest.fixture
+def usuario_com_lacuna(banco_vazio, monkeypatch):
+    """Usuário com lançamentos em janeiro e abril, nada em fevereiro e março; snapshot exportado."""
+    monkeypatch.setattr(analytics, "DIR_PARQUET", str(banco_vazio / "parquet"))
+    monkeypatch.setattr(analytics, "FONTE", "parquet")
+    db.criar_usuario("lacuna", "lacuna@teste.local", "senha123")
+    usuario_id = db.autenticar_usuario("lacuna", "senha123")['id']
+    db.salvar_transacoes_em_lote([
+        ('receita', 'salario', 3000.0, '2025-01-05', 'Salário', 1, 0, usuario_id),
+        ('despesa', 'mercado', 200.0, '2025-01-20', 'Alimentação', 1, 0, usuario_id),
+        ('despesa', 'aluguel', 900.0, '2025-04-02', 'Aluguel', 1, 0, usuario_id),
+    ])
+    analytics.exportar_parquet()
+    yield usuario_id
+    analytics._duckdb_disponivel.cache_clear()
+
+@pytest.mark.parametrize("regra", ['D', 'W-MON', 'MS', 'QS'])
+def test_fluxo_preenche_periodos_vazios_como_os_dashboards(usuario_com_lacuna, regra):
+    from components.dashboards import agrupar_por_periodo
+
+    transacoes = pd.DataFrame({
+        'Data': pd.to_datetime(['2025-01-05', '2025-01-20', '2025-04-02']),
+        'Valor': [3000.0, -200.0, -900.0],
+    })
+    esperado = agrupar_por_periodo(transacoes, regra)
+    for motor in ('pandas', 'duckdb'):
+        fluxo = analytics.fluxo_por_periodo(usuario_com_lacuna, regra, motor=motor).set_index('periodo')
+        pd.testing.assert_series_equal(fluxo['receitas'] - fluxo['despesas'], esperado,
+                                       check_names=False, check_freq=False, check_index_type=False)
+
+def test_snapshot_desatualizado_nao_serve_o_usuario(usuario_com_lacuna):
+    db.salvar_transacao('despesa', 'farmacia', 45.0, '2025-04-10', 'Saúde', 1, 0, usuario_com_lacuna)
+    totais = analytics.totais_por_categoria(usuario_com_lacuna, 'despesa', motor='duckdb')
+    assert totais.set_index('categoria')['total'].get('Saúde') == 45.0
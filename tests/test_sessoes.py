@@ -0,0 +1,20 @@
+"""Cache de credenciais e validação das sessões do store."""
+
+import db
+from sessoes import criar_sessao, usuario_da_sessao, validar_sessao
+
+def test_login_inexistente_nao_fica_no_cache(banco_vazio, monkeypatch):
+    assert db.autenticar_usuario("novo", "senha123") is None
+
+    # Conta criada por outro worker: o cache deste processo não é limpo
+    monkeypatch.setattr(db._cache_usuarios, "limpar", lambda: None)
+    db.criar_usuario("novo", "novo@teste.local", "senha123")
+    assert db.autenticar_usuario("novo", "senha123")['username'] == "novo"
+
+def test_sessao_em_formato_antigo_conta_como_encerrada(banco_vazio):
+    db.criar_usuario("antigo", "antigo@teste.local", "senha123")
+    usuario_id = db.autenticar_usuario("antigo", "senha123")['id']
+    for valor in (usuario_id, str(usuario_id), [usuario_id], None):
+        assert validar_sessao(valor) is None
+        assert usuario_da_sessao(valor) is None
+    assert usuario_da_sessao({'sessao': criar_sessao(usuario_id)}) == usuario_id
@@ -0,0 +1,54 @@
+"""Sugestão de categoria pelos callbacks do formulário de lançamentos."""
+
+import dash
+import pytest
+from dash._utils import AttributeDict
+
+import categorizacao
+import db
+from components import sidebar
+from sessoes import criar_sessao
+
+@pytest.fixture
+def sessao(banco_vazio):
+    dash._callback_context.context_value.set(AttributeDict(triggered_inputs=[]))
+    db.criar_usuario("sugestao", "sugestao@teste.local", "senha123")
+    usuario_id = db.autenticar_usuario("sugestao", "senha123")['id']
+    categorizacao.adicionar_regra(usuario_id, 'despesa', 'mercado', 'Alimentação')
+    return usuario_id, {'sessao': criar_sessao(usuario_id)}
+
+def _categoria_salva(usuario_id, descricao):
+    conn = db.conectar_bd()
+    linha = conn.execute("SELECT categoria FROM transacoes WHERE usuario_id = ? AND descricao = ?",
+                         (usuario_id, descricao)).fetchone()
+    conn.close()
+    return linha[0]
+
+def test_salvar_sem_categoria_usa_a_sugerida(sessao):
+    usuario_id, session_data = sessao
+    store = sidebar.save_despesa(1, "Mercado Central", "52.30", "2026-10-10", [1], None, session_data, "chave-1")
+    assert store is not dash.no_update
+    assert _categoria_salva(usuario_id, "Mercado Central") == 'Alimentação'
+
+def test_salvar_sem_sugestao_usa_a_primeira_categoria(sessao):
+    usuario_id, session_data = sessao
+    sidebar.save_despesa(1, "Conta avulsa", "10", "2026-10-10", [1], None, session_data, "chave-2")
+    assert _categoria_salva(usuario_id, "Conta avulsa") == db.ler_categorias()[1][0]
+
+def test_escolha_do_usuario_prevalece(sessao):
+    usuario_id, session_data = sessao
+    sidebar.save_despesa(1, "Mercado da esquina", "8", "2026-10-10", [1], 'Lazer', session_data, "chave-3")
+    assert _categoria_salva(usuario_id, "Mercado da esquina") == 'Lazer'
+
+def test_sugestao_preenche_so_o_campo_vazio(sessao):
+    _, session_data = sessao
+    assert sidebar.suggest_despesa_category("Mercado Central", None, session_data) == 'Alimentação'
+    assert sidebar.suggest_despesa_category("Mercado Central", 'Lazer', session_data) is dash.no_update
+
+@pytest.mark.parametrize("tipo, criar_corpo", [('receita', sidebar.create_receita_modal_body),
+                                               ('despesa', sidebar.create_despesa_modal_body)])
+def test_formulario_comeca_sem_categoria(tipo, criar_corpo):
+    """Sem categoria pré-selecionada, a sugestão e o salvamento usam as regras."""
+    corpo = dash.html.Div(criar_corpo(['Alimentação', 'Lazer']))
+    select = next(c for c in corpo._traverse() if getattr(c, 'id', None) == f'select_{tipo}')
+    assert select.value is None
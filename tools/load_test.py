@@ -0,0 +1,279 @@
+"""
+Ferramenta de teste de carga do MoneyFlow.
+
+Sobe o servidor localmente sobre um financas.db sintético (em um diretório
+temporário) e simula sessões concorrentes chamando os mesmos endpoints que o
+navegador usa (/_dash-update-component): registro, login, carga dos dados,
+novas receitas/despesas, filtros do dashboard e extratos. No final, mostra
+a vazão e os percentis de latência de cada callback.
+
+Uso:
+    python tools/load_test.py --sessoes 50 --concorrencia 10
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Código executado no processo do servidor
+SERVIDOR = """
+import sys
+from werkzeug.serving import run_simple
+from wsgi import server
+run_simple('127.0.0.1', int(sys.argv[1]), server, threaded=True)
+"""
+
+# --- Banco sintético ---
+
+def gerar_banco(diretorio, usuarios, transacoes_por_usuario):
+    """Cria o financas.db sintético e retorna as credenciais dos usuários criados."""
+    os.environ["MONEYFLOW_DB"] = os.path.join(diretorio, "financas.db")
+    os.environ["MONEYFLOW_DB_ARQUIVO"] = os.path.join(diretorio, "financas_arquivo.db")
+    sys.path.insert(0, str(RAIZ))
+    import db
+
+    db.inicializar_bd()
+    cat_receita, cat_despesa = db.ler_categorias()
+    hoje = date.today()
+    credenciais = []
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+    for i in range(usuarios):
+        username, senha = f"carga{i}", "senha123"
+        db.criar_usuario(username, f"{username}@carga.local", senha)
+        usuario_id = db.autenticar_usuario(username, senha)['id']
+        linhas = []
+        for _ in range(transacoes_por_usuario):
+            tipo = 'receita' if random.random() < 0.3 else 'despesa'
+            categoria = random.choice(cat_receita if tipo == 'receita' else cat_despesa)
+            data = hoje - timedelta(days=random.randint(0, 3 * 365))
+            linhas.append((tipo, f"{categoria} {random.randint(1, 999)}", round(random.uniform(5, 2000), 2),
+                           data.isoformat(), categoria, random.randint(0, 1), 0, usuario_id))
+        db._inserir_transacoes(cursor, linhas)
+        conn.commit()
+        credenciais.append((username, senha))
+    conn.close()
+    return credenciais
+
+# --- Servidor ---
+
+def porta_livre():
+    """Retorna uma porta TCP livre na interface local."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def iniciar_servidor(diretorio, porta):
+    """Inicia o servidor em um subprocesso e espera ele responder."""
+    env = dict(os.environ, MONEYFLOW_CACHE_DIR=os.path.join(diretorio, "cache"))
+    processo = subprocess.Popen([sys.executable, "-c", SERVIDOR, str(porta)], cwd=diretorio, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{porta}"
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(base + "/_dash-layout", timeout=1)
+            return processo, base
+        except (urllib.error.URLError, ConnectionError):
+            if processo.poll() is not None:
+                raise RuntimeError("O servidor terminou durante a inicialização")
+            time.sleep(0.1)
+    processo.terminate()
+    raise RuntimeError("O servidor não respondeu a tempo")
+
+# --- Cliente Dash ---
+
+class ClienteDash:
+    """Chama callbacks do Dash pelo mesmo protocolo usado pelo navegador."""
+
+    def __init__(self, base):
+        self.base = base
+        self.callbacks = {}
+        with urllib.request.urlopen(base + "/_dash-dependencies") as resp:
+            for dep in json.load(resp):
+                for saida in self._saidas(dep['output']):
+                    self.callbacks.setdefault(saida, []).append(dep)
+
+    @staticmethod
+    def _saidas(output):
+        """Separa a string de saídas de um callback em 'id.propriedade'."""
+        partes = output.strip('.').split('...') if output.startswith('..') else [output]
+        return [parte.split('@')[0] for parte in partes]
+
+    def _post(self, url, payload):
+        req = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            corpo = resp.read()
+            return json.loads(corpo) if corpo else {}
+
+    def chamar(self, saida, valores, disparado):
+        """
+        Executa o callback que produz `saida` com os valores informados
+        ('id.propriedade' -> valor) e retorna a resposta.
+
+        Callbacks em segundo plano são acompanhados até terminar.
+        """
+        # Várias callbacks podem escrever na mesma saída; usa a disparada pela entrada
+        candidatos = self.callbacks[saida]
+        dep = next((d for d in candidatos if any(f"{i['id']}.{i['property']}" == disparado for i in d['inputs'])),
+                   candidatos[0])
+
+        def entradas(lista):
+            return [{"id": d['id'], "property": d['property'], "value": valores.get(f"{d['id']}.{d['property']}")}
+                    for d in lista]
+
+        saidas = []
+        for parte in self._saidas(dep['output']):
+            componente, propriedade = parte.rsplit('.', 1)
+            saidas.append({"id": componente, "property": propriedade})
+        payload = {
+            "output": dep['output'],
+            "outputs": saidas if len(saidas) > 1 or dep['output'].startswith('..') else saidas[0],
+            "inputs": entradas(dep['inputs']),
+            "state": entradas(dep['state']),
+            "changedPropIds": [disparado],
+        }
+        url = self.base + "/_dash-update-component"
+        resposta = self._post(url, payload)
+        while 'cacheKey' in resposta and 'response' not in resposta:
+            time.sleep(0.05)
+            resposta = self._post(f"{url}?cacheKey={resposta['cacheKey']}&job={resposta['job']}", payload)
+        return resposta.get('response', {})
+
+# --- Sessões simuladas ---
+
+class Medidor:
+    """Acumula as latências de cada callback de forma thread-safe."""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def medir(self, nome, funcao):
+        inicio = time.perf_counter()
+        try:
+            return funcao()
+        except Exception:
+            with self._lock:
+                self.erros[nome] += 1
+            return {}
+        finally:
+            with self._lock:
+                self.latencias[nome].append(time.perf_counter() - inicio)
+
+def simular_sessao(cliente, medidor, credenciais):
+    """Executa o roteiro de uma sessão: registro, login, lançamentos, dashboard e extratos."""
+    novo = f"sessao{random.getrandbits(48):x}"
+    medidor.medir("registro", lambda: cliente.chamar("login-alert.children", {
+        "register-button.n_clicks": 1, "register-username.value": novo,
+        "register-email.value": f"{novo}@carga.local", "register-password.value": "senha123",
+        "register-confirm-password.value": "senha123"}, "register-button.n_clicks"))
+
+    # Metade das sessões entra com um usuário que já tem histórico
+    username, senha = random.choice(credenciais) if random.random() < 0.5 else (novo, "senha123")
+    resposta = medidor.medir("login", lambda: cliente.chamar("store-user-session.data", {
+        "login-button.n_clicks": 1, "login-username.value": username,
+        "login-password.value": senha}, "login-button.n_clicks"))
+    sessao = resposta.get('store-user-session', {}).get('data')
+    if not sessao:
+        return
+
+    valores = {"store-user-session.data": sessao}
+    dados = medidor.medir("load_user_data", lambda: cliente.chamar("store-receitas.data", valores, "store-user-session.data"))
+    for componente, props in dados.items():
+        valores[f"{componente}.data"] = props.get('data')
+
+    hoje = date.today()
+    categorias = {'receita': 'Salário', 'despesa': 'Alimentação'}
+    for tipo in ('receita', 'despesa'):
+        formulario = {
+            f"salvar_{tipo}.n_clicks": 1, f"txt-{tipo}.value": f"carga {tipo}",
+            f"valor-{tipo}.value": round(random.uniform(10, 500), 2), f"date-{tipo}s.date": hoje.isoformat(),
+            f"switches-input-{tipo}.value": [1], f"select_{tipo}.value": categorias[tipo],
+        }
+        resposta = medidor.medir(f"salvar_{tipo}", lambda: cliente.chamar(
+            f"store-{tipo}s.data", {**valores, **formulario}, f"salvar_{tipo}.n_clicks"))
+        if f"store-{tipo}s" in resposta:
+            valores[f"store-{tipo}s.data"] = resposta[f"store-{tipo}s"]['data']
+
+    # Filtros do dashboard: todas as categorias e um período aleatório
+    cards_r = medidor.medir("cards_receitas", lambda: cliente.chamar("p-receita-dashboards.children", valores, "store-receitas.data"))
+    cards_d = medidor.medir("cards_despesas", lambda: cliente.chamar("p-despesa-dashboards.children", valores, "store-despesas.data"))
+    valores["dropdown-receita.value"] = cards_r.get('dropdown-receita', {}).get('value', [])
+    valores["dropdown-despesa.value"] = cards_d.get('dropdown-despesa', {}).get('value', [])
+    valores["date-picker-config.start_date"] = (hoje - timedelta(days=random.choice((30, 365, 3 * 365)))).isoformat()
+    valores["date-picker-config.end_date"] = hoje.isoformat()
+    valores["radio-horizonte-mensal.value"] = random.choice((12, 24, 60))
+    for saida in ("graph1.figure", "graph2.figure", "graph3.figure", "graph4.figure", "graph-mensal.figure"):
+        medidor.medir(saida.split('.')[0], lambda: cliente.chamar(saida, valores, "date-picker-config.start_date"))
+
+    # Extratos
+    for saida in ("tabela-despesas.children", "bar-graph.figure", "valor_despesa_card.children"):
+        medidor.medir(saida.split('.')[0], lambda: cliente.chamar(saida, valores, "store-despesas.data"))
+    valores["input-busca-extratos.value"] = random.choice(("Lazer", "Gasolina", "Salário 1"))
+    valores["tabela-busca.page_current"] = 0
+    medidor.medir("busca", lambda: cliente.chamar("tabela-busca.data", valores, "input-busca-extratos.value"))
+
+# --- Relatório ---
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolação do vizinho mais próximo."""
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def imprimir_relatorio(medidor, duracao, sessoes):
+    """Mostra vazão geral e latências por callback (em milissegundos)."""
+    total = sum(len(v) for v in medidor.latencias.values())
+    print(f"\n{sessoes} sessões em {duracao:.1f}s — {total / duracao:.1f} chamadas/s, {sessoes / duracao:.2f} sessões/s\n")
+    print(f"{'callback':<22}{'n':>6}{'erros':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'máx':>9}")
+    for nome, valores in sorted(medidor.latencias.items()):
+        ms = [v * 1000 for v in valores]
+        print(f"{nome:<22}{len(ms):>6}{medidor.erros[nome]:>7}"
+              f"{percentil(ms, 50):>9.1f}{percentil(ms, 90):>9.1f}{percentil(ms, 99):>9.1f}{max(ms):>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga das sessões do MoneyFlow")
+    parser.add_argument("--sessoes", type=int, default=20, help="total de sessões simuladas")
+    parser.add_argument("--concorrencia", type=int, default=5, help="sessões simultâneas")
+    parser.add_argument("--usuarios", type=int, default=10, help="usuários com histórico no banco sintético")
+    parser.add_argument("--transacoes", type=int, default=2000, help="transações por usuário sintético")
+    parser.add_argument("--porta", type=int, default=0, help="porta do servidor (0 = qualquer livre)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="moneyflow-carga-", ignore_cleanup_errors=True) as diretorio:
+        print(f"Gerando banco sintético em {diretorio}...")
+        credenciais = gerar_banco(diretorio, args.usuarios, args.transacoes)
+
+        os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [str(RAIZ), os.environ.get("PYTHONPATH")]))
+        processo, base = iniciar_servidor(diretorio, args.porta or porta_livre())
+        try:
+            cliente = ClienteDash(base)
+            medidor = Medidor()
+            print(f"Servidor em {base}; simulando {args.sessoes} sessões ({args.concorrencia} simultâneas)...")
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(args.concorrencia) as executor:
+                for futuro in [executor.submit(simular_sessao, cliente, medidor, credenciais) for _ in range(args.sessoes)]:
+                    futuro.result()
+            imprimir_relatorio(medidor, time.perf_counter() - inicio, args.sessoes)
+        finally:
+            processo.terminate()
+            processo.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Teste de estresse de escritas concorrentes na camada de banco (db.py).
+
+Cria um financas.db temporário e dispara N processos × M threads que, ao mesmo
+tempo, salvam transações (salvar_transacao), criam usuários (criar_usuario),
+adicionam e removem categorias (as funções usadas por manage_categories) e
+fazem leituras. No final confere, direto no banco, que:
+
+- toda transação salva existe exatamente uma vez e o resumo mensal bate com
+  as transações;
+- todo usuário criado existe;
+- as categorias são exatamente as adicionadas menos as removidas;
+- nenhuma operação falhou (exceção, "database is locked" ou erro impresso).
+
+Mostra a vazão sustentada de escritas e as latências por operação, e sai com
+código 1 se alguma verificação falhar: é o teste a rodar antes de mudar o
+tratamento de conexões.
+
+Uso:
+    python tools/stress_db.py --processos 4 --threads 8 --operacoes 200
+    python tools/stress_db.py --gravador-lote
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Peso de cada operação no sorteio
+PESOS_OPERACOES = {'transacao': 50, 'categoria': 15, 'usuario': 10, 'leitura': 25}
+
+def _importar_db(diretorio):
+    """Aponta o db.py para o banco temporário e o importa."""
+    os.environ["MONEYFLOW_DB"] = os.path.join(diretorio, "financas.db")
+    os.environ["MONEYFLOW_DB_ARQUIVO"] = os.path.join(diretorio, "financas_arquivo.db")
+    sys.path.insert(0, str(RAIZ))
+    import db
+    return db
+
+# --- Processos de carga ---
+
+def _executar_thread(db, processo, thread, operacoes, usuarios, largada, resultado, lock):
+    """Executa as operações sorteadas de uma thread e acumula o que foi gravado."""
+    aleatorio = random.Random(f"{processo}-{thread}")
+    nomes, pesos = zip(*PESOS_OPERACOES.items())
+    hoje = date.today()
+    transacoes, criados, categorias = [], [], {}
+    latencias, erros = defaultdict(list), []
+    largada.wait()
+
+    for i in range(operacoes):
+        operacao = aleatorio.choices(nomes, pesos)[0]
+        prefixo = f"estresse-p{processo}-t{thread}-{i}"
+        inicio = time.perf_counter()
+        try:
+            if operacao == 'transacao':
+                tipo = aleatorio.choice(('receita', 'despesa'))
+                data = (hoje - timedelta(days=aleatorio.randint(0, 400))).isoformat()
+                db.salvar_transacao(tipo, prefixo, round(aleatorio.uniform(1, 500), 2), data, 'Outros',
+                                    aleatorio.randint(0, 1), 0, aleatorio.choice(usuarios))
+                transacoes.append(prefixo)
+            elif operacao == 'categoria':
+                tipo = aleatorio.choice(('receita', 'despesa'))
+                proprias = [nome for nome, t in categorias.items() if t == tipo]
+                if proprias and aleatorio.random() < 0.4:
+                    nome = aleatorio.choice(proprias)
+                    db.remover_categorias([nome], tipo)
+                    del categorias[nome]
+                else:
+                    db.adicionar_categoria(prefixo, tipo)
+                    categorias[prefixo] = tipo
+            elif operacao == 'usuario':
+                ok, mensagem = db.criar_usuario(prefixo, f"{prefixo}@estresse.local", "senha123")
+                if not ok:
+                    raise RuntimeError(mensagem)
+                criados.append(prefixo)
+            else:
+                leitura = aleatorio.randrange(3)
+                if leitura == 0:
+                    db.ler_transacoes(aleatorio.choice(usuarios))
+                elif leitura == 1:
+                    db.ler_categorias()
+                else:
+                    db.ler_resumo_mensal(aleatorio.choice(usuarios))
+        except Exception as e:
+            erros.append(f"{operacao}: {type(e).__name__}: {e}")
+        latencias[operacao].append(time.perf_counter() - inicio)
+
+    with lock:
+        resultado['transacoes'].extend(transacoes)
+        resultado['usuarios'].extend(criados)
+        resultado['categorias'].update(categorias)
+        resultado['erros'].extend(erros)
+        for operacao, valores in latencias.items():
+            resultado['latencias'][operacao].extend(valores)
+
+def executar_processo(diretorio, processo, threads, operacoes, usuarios, gravador_lote, pronto, largada, fila):
+    """Processo de carga: M threads disparadas juntas; o resultado vai para a fila."""
+    db = _importar_db(diretorio)
+    if gravador_lote:
+        db.iniciar_gravador()
+
+    resultado = {'transacoes': [], 'usuarios': [], 'categorias': {}, 'erros': [],
+                 'latencias': defaultdict(list)}
+    lock = threading.Lock()
+    largada_threads = threading.Event()
+    saida = io.StringIO()
+
+    # Algumas funções do db.py só imprimem o erro; a saída é conferida no final
+    with contextlib.redirect_stdout(saida):
+        trabalhadores = [threading.Thread(target=_executar_thread,
+                                          args=(db, processo, t, operacoes, usuarios, largada_threads, resultado, lock))
+                         for t in range(threads)]
+        for trabalhador in trabalhadores:
+            trabalhador.start()
+        pronto.release()
+        largada.wait()
+        largada_threads.set()
+        for trabalhador in trabalhadores:
+            trabalhador.join()
+        if gravador_lote:
+            db.parar_gravador()
+
+    resultado['erros'].extend(f"saída: {linha}" for linha in saida.getvalue().splitlines() if '❌' in linha)
+    resultado['latencias'] = dict(resultado['latencias'])
+    fila.put(resultado)
+
+# --- Verificação ---
+
+def verificar(db, esperado):
+    """Confere no banco que nenhuma escrita se perdeu. Retorna a lista de falhas."""
+    falhas = []
+    conn = db.conectar_bd()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT descricao, COUNT(*) FROM transacoes WHERE descricao LIKE 'estresse-%' GROUP BY descricao")
+    gravadas = dict(cursor.fetchall())
+    perdidas = set(esperado['transacoes']) - set(gravadas)
+    repetidas = [descricao for descricao, n in gravadas.items() if n > 1]
+    extras = set(gravadas) - set(esperado['transacoes'])
+    if perdidas:
+        falhas.append(f"{len(perdidas)} transação(ões) perdida(s), ex.: {sorted(perdidas)[:3]}")
+    if repetidas:
+        falhas.append(f"{len(repetidas)} transação(ões) gravada(s) mais de uma vez")
+    if extras:
+        falhas.append(f"{len(extras)} transação(ões) gravada(s) sem sucesso reportado")
+
+    # O resumo mensal é mantido na mesma transação de cada escrita
+    cursor.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT usuario_id, substr(data, 1, 7) AS mes, tipo, categoria,
+                   ROUND(SUM(valor), 2) AS total, COUNT(*) AS quantidade
+            FROM transacoes GROUP BY 1, 2, 3, 4
+            EXCEPT
+            SELECT usuario_id, mes, tipo, categoria, ROUND(total, 2), quantidade FROM resumo_mensal
+        )
+    """)
+    divergentes = cursor.fetchone()[0]
+    if divergentes:
+        falhas.append(f"resumo mensal diverge das transações em {divergentes} grupo(s)")
+
+    cursor.execute("SELECT username FROM usuarios WHERE username LIKE 'estresse-%'")
+    faltando = set(esperado['usuarios']) - {linha[0] for linha in cursor.fetchall()}
+    if faltando:
+        falhas.append(f"{len(faltando)} usuário(s) perdido(s)")
+
+    cursor.execute("SELECT nome, tipo FROM categorias WHERE nome LIKE 'estresse-%'")
+    categorias = dict(cursor.fetchall())
+    if categorias != esperado['categorias']:
+        diferenca = set(categorias.items()) ^ set(esperado['categorias'].items())
+        falhas.append(f"{len(diferenca)} categoria(s) diferente(s) do esperado")
+
+    conn.close()
+    if esperado['erros']:
+        falhas.append(f"{len(esperado['erros'])} operação(ões) com erro, ex.: {esperado['erros'][:3]}")
+    return falhas
+
+# --- Relatório ---
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolação do vizinho mais próximo."""
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def imprimir_relatorio(latencias, duracao, escritas):
+    """Mostra a vazão de escritas e as latências por operação (em milissegundos)."""
+    print(f"\n{escritas} escritas em {duracao:.1f}s — {escritas / duracao:.0f} escritas/s sustentadas\n")
+    print(f"{'operação':<12}{'n':>7}{'p50':>9}{'p90':>9}{'p99':>9}{'máx':>9}")
+    for nome, valores in sorted(latencias.items()):
+        ms = [v * 1000 for v in valores]
+        print(f"{nome:<12}{len(ms):>7}{percentil(ms, 50):>9.1f}{percentil(ms, 90):>9.1f}"
+              f"{percentil(ms, 99):>9.1f}{max(ms):>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de estresse de escritas concorrentes do MoneyFlow")
+    parser.add_argument("--processos", type=int, default=4, help="processos escrevendo ao mesmo tempo")
+    parser.add_argument("--threads", type=int, default=8, help="threads por processo")
+    parser.add_argument("--operacoes", type=int, default=200, help="operações por thread")
+    parser.add_argument("--usuarios", type=int, default=20, help="usuários que recebem as transações")
+    parser.add_argument("--gravador-lote", action="store_true", help="salva as transações pelo gravador em lote")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="moneyflow-estresse-", ignore_cleanup_errors=True) as diretorio:
+        db = _importar_db(diretorio)
+        db.inicializar_bd()
+        for i in range(args.usuarios):
+            db.criar_usuario(f"base{i}", f"base{i}@estresse.local", "senha123")
+        usuarios = [db.autenticar_usuario(f"base{i}", "senha123")['id'] for i in range(args.usuarios)]
+
+        contexto = multiprocessing.get_context("spawn")
+        pronto, largada, fila = contexto.Semaphore(0), contexto.Event(), contexto.Queue()
+        processos = [contexto.Process(target=executar_processo,
+                                      args=(diretorio, p, args.threads, args.operacoes, usuarios,
+                                            args.gravador_lote, pronto, largada, fila))
+                     for p in range(args.processos)]
+        for processo in processos:
+            processo.start()
+        for _ in processos:
+            pronto.acquire()
+
+        print(f"Banco em {diretorio}; {args.processos} processos × {args.threads} threads × "
+              f"{args.operacoes} operações...")
+        inicio = time.perf_counter()
+        largada.set()
+        resultados = [fila.get() for _ in processos]
+        duracao = time.perf_counter() - inicio
+        for processo in processos:
+            processo.join()
+
+        esperado = {'transacoes': [], 'usuarios': [], 'categorias': {}, 'erros': []}
+        latencias = defaultdict(list)
+        for resultado in resultados:
+            esperado['transacoes'].extend(resultado['transacoes'])
+            esperado['usuarios'].extend(resultado['usuarios'])
+            esperado['categorias'].update(resultado['categorias'])
+            esperado['erros'].extend(resultado['erros'])
+            for operacao, valores in resultado['latencias'].items():
+                latencias[operacao].extend(valores)
+
+        escritas = sum(len(latencias[op]) for op in ('transacao', 'categoria', 'usuario'))
+        imprimir_relatorio(latencias, duracao, escritas)
+
+        falhas = verificar(db, esperado)
+        if falhas:
+            print("\nFALHOU:")
+            for falha in falhas:
+                print(f"  - {falha}")
+            sys.exit(1)
+        print("\nOK: nenhuma escrita perdida e nenhum erro de concorrência")
+
+if __name__ == "__main__":
+    main()
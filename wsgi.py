@@ -0,0 +1,87 @@
+"""
+Ponto de entrada de produção (WSGI).
+
+criar_app() roda uma vez no processo mestre (gunicorn com preload_app):
+atualiza o esquema do banco, importa todos os componentes e aquece o que não
+depende do banco (templates do Plotly, layouts estáticos e as rotas internas
+do Dash). Nenhuma conexão fica aberta no mestre; cada worker faz a própria
+inicialização depois do fork (iniciar_worker, chamado pelo post_fork do
+gunicorn.conf.py ou, sem ele, na primeira requisição), e as páginas de
+memória do mestre são compartilhadas com os workers por copy-on-write.
+
+/pronto responde 200 só depois do aquecimento e da inicialização do worker,
+e 503 antes disso.
+
+Uso:
+    gunicorn -c gunicorn.conf.py wsgi:server
+"""
+
+import os
+import threading
+import time
+
+import db
+
+_aquecido = False
+_pid_iniciado = None
+_lock_worker = threading.Lock()
+
+def aquecer(server):
+    """Carrega templates, layouts estáticos e rotas internas do Dash, sem abrir o banco."""
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    from components import dashboards, login, sidebar
+
+    # O template padrão é carregado na primeira figura
+    _ = pio.templates[pio.templates.default]
+    go.Figure(go.Scatter(x=[0], y=[0])).to_plotly_json()
+
+    login.criar_layout()
+    dashboards._linha_cards()
+    sidebar._cabecalho()
+    sidebar._botoes_acao()
+    sidebar._navegacao()
+
+    # Monta o índice, o layout e o mapa de callbacks do Dash
+    cliente = server.test_client()
+    for rota in ('/', '/_dash-layout', '/_dash-dependencies'):
+        cliente.get(rota)
+
+def iniciar_worker():
+    """Inicialização de cada worker, depois do fork (conexões e threads próprias)."""
+    global _pid_iniciado
+    with _lock_worker:
+        if _pid_iniciado == os.getpid():
+            return
+        # Threads não sobrevivem ao fork: o gravador só é criado no worker
+        if os.environ.get("MONEYFLOW_GRAVADOR_LOTE") == "1":
+            db.iniciar_gravador()
+        _pid_iniciado = os.getpid()
+
+def criar_app():
+    """Prepara o aplicativo no processo mestre e retorna o servidor WSGI (Flask)."""
+    global _aquecido
+    inicio = time.perf_counter()
+    db.inicializar_bd()
+
+    from myindex import criar_servidor
+    server = criar_servidor()
+
+    # As requisições do aquecimento (no mestre) não inicializam o worker
+    @server.before_request
+    def _garantir_worker():
+        if _aquecido and _pid_iniciado != os.getpid():
+            iniciar_worker()
+
+    @server.route('/pronto')
+    def pronto():
+        if _aquecido and _pid_iniciado == os.getpid():
+            return {'pronto': True}, 200
+        return {'pronto': False}, 503
+
+    aquecer(server)
+    _aquecido = True
+    print(f"Aplicativo aquecido em {time.perf_counter() - inicio:.2f}s")
+    return server
+
+server = criar_app()